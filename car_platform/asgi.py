@@ -2,6 +2,11 @@
 ASGI config for car_platform project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project through it (e.g. ``uvicorn car_platform.asgi:application``)
+so that the conversation event streams in listings/live.py stay open as idle
+coroutines rather than each holding a worker, and the async read paths in
+listings/views.py run on the event loop. ``manage.py benchmark_servers``
+compares it with the WSGI application under concurrent load.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
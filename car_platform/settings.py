@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so the numbers include every other middleware's queries
+    'listings.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,7 +43,8 @@ ROOT_URLCONF = 'car_platform.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render times to QueryMetricsMiddleware
+        'BACKEND': 'listings.metrics.TimedDjangoTemplates',
         # This tells Django to look for the 'templates' folder in your main project directory
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
@@ -68,6 +71,17 @@ DATABASES = {
     }
 }
 
+# --- Cache ---
+# Per-process memory. The facet counts keep one key per combination of filter
+# values (listings/facets.py), far more than LocMemCache's default of 300 entries.
+# Use a shared backend (Redis/Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
@@ -95,3 +109,91 @@ LOGIN_URL = '/login/'
 
 # Email configuration for local development (prints to console)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'CarHub <noreply@carhub.local>'
+
+# Absolute links in emails start with this
+SITE_URL = 'http://127.0.0.1:8000'
+
+# Number of cars shown per page on the Browse Cars page (and per "Load more" click)
+CAR_LIST_PAGE_SIZE = 12
+
+# Number of conversations shown per inbox page
+INBOX_PAGE_SIZE = 20
+
+# Number of messages shown per page of a conversation (and per "Load older" click)
+CONVERSATION_PAGE_SIZE = 30
+
+# Number of cars shown per page on My Purchases
+PURCHASES_PAGE_SIZE = 20
+
+# Number of reviews shown per page on a seller's profile
+REVIEWS_PAGE_SIZE = 10
+
+# How long the cached facet counts on the Browse Cars page may live before a full
+# recount. Listing saves and deletes update the cache in place before then.
+FACET_CACHE_TIMEOUT = 300
+
+# Listing views are recorded as pending rows and added to the counts in batches by
+# the recording process, at the latest this many seconds later. `manage.py
+# flush_view_counts` adds those left by processes that stopped first. Repeat views
+# by the same user within the dedup window count once.
+VIEW_COUNT_FLUSH_INTERVAL = 30
+VIEW_COUNT_DEDUP_WINDOW = 30 * 60
+
+# Upper bound on how long the navbar's unread message count is cached (seconds).
+# New and read messages drop the cached value straight away.
+UNREAD_COUNT_CACHE_TIMEOUT = 600
+
+# Resized renditions of uploaded photos are made in a background thread pool
+# after the upload is saved. Turn IMAGE_PROCESSING_ASYNC off to make them inline.
+IMAGE_PROCESSING_ASYNC = True
+IMAGE_PROCESSING_WORKERS = 2
+
+# Photos uploaded together with a listing are decoded and saved by this many threads
+IMAGE_INGEST_WORKERS = 4
+
+# QueryMetricsMiddleware logs a warning when a request runs more SQL queries or
+# takes longer than these budgets. METRICS_VIEW_BUDGETS overrides them per URL
+# name, e.g. {'car-list': (10, 300)} for 10 queries and 300 ms.
+# The collected numbers are shown to staff at /admin/metrics/.
+METRICS_QUERY_BUDGET = 30
+METRICS_LATENCY_BUDGET_MS = 500
+METRICS_VIEW_BUDGETS = {}
+
+
+# Upper bound on how long a user's wishlisted listing ids are cached (seconds).
+# Adding or removing a wishlist item drops the cached ids straight away.
+WISHLIST_CACHE_TIMEOUT = 600
+
+# Number of days shown in the admin dashboard's activity chart
+DASHBOARD_TIMELINE_DAYS = 30
+
+# Number of events per page of the admin activity feed at /admin/activity/
+ACTIVITY_PAGE_SIZE = 50
+
+# Background jobs (see listings/jobs.py) are run by `manage.py run_jobs`. A failed
+# batch is retried after JOB_RETRY_BACKOFF seconds, doubling each time, and given
+# up after JOB_MAX_ATTEMPTS tries. Jobs held longer than JOB_LOCK_TIMEOUT seconds
+# by a worker that died are handed out again.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 60
+JOB_LOCK_TIMEOUT = 600
+
+# New-message emails wait this many seconds so that further messages to the same
+# person go out in the same digest email
+MESSAGE_DIGEST_WINDOW = 120
+
+# Open conversation pages get new messages and read receipts from an event stream
+# (see listings/live.py). Under ASGI a stream stays open for MESSAGE_STREAM_TIMEOUT
+# seconds and checks for messages saved by other processes every
+# MESSAGE_STREAM_POLL seconds; browsers reconnect MESSAGE_STREAM_RETRY
+# milliseconds after it closes.
+MESSAGE_STREAM_TIMEOUT = 300
+MESSAGE_STREAM_POLL = 5
+MESSAGE_STREAM_RETRY = 3000
+
+# The compare page shows at most COMPARE_MAX_CARS listings; further ids in the
+# URL are ignored. Comparisons are cached for up to COMPARE_CACHE_TIMEOUT
+# seconds (saving a listing drops them straight away).
+COMPARE_MAX_CARS = 3
+COMPARE_CACHE_TIMEOUT = 600
@@ -4,8 +4,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from listings.views import activity_feed_view, metrics_view
 
 urlpatterns = [
+    # Must come before the admin site, which claims every other admin/ URL
+    path('admin/metrics/', metrics_view, name='metrics'),
+    path('admin/activity/', activity_feed_view, name='activity-feed'),
     path('admin/', admin.site.urls),
     # This includes all the URLs from your 'listings' app
     path('', include('listings.urls')), 
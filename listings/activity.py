@@ -0,0 +1,47 @@
+# File: listings/activity.py
+
+from django.contrib.auth.models import User
+
+from .models import ActivityEvent
+from .pagination import paginate_keyset
+
+# The site's activity as one append-only table, written by listings/signals.py
+# as users sign up, post, sell, review and message. Events carry the names and
+# titles they mention, so a feed page is a single range scan over the
+# (timestamp, id) index, or (event_type, ...) / (recipient, ...) when filtered.
+ORDERING = ('-timestamp', '-id')
+
+
+def record(event_type, actor=None, recipient=None, listing=None, timestamp=None, **data):
+    """Appends one event. `data` is stored as is, next to the names of the users and listing."""
+    if actor is not None:
+        data['actor'] = actor.username
+    if recipient is not None:
+        data['recipient'] = recipient.username
+    if listing is not None:
+        data['listing'] = str(listing)
+    fields = {'timestamp': timestamp} if timestamp else {}
+    return ActivityEvent.objects.create(
+        event_type=event_type, actor=actor, recipient=recipient, listing=listing, data=data, **fields
+    )
+
+
+def listing_status_changed(listing, old_status):
+    if listing.status == 'SOLD':
+        buyer = User.objects.filter(pk=listing.buyer_id).only('username').first() if listing.buyer_id else None
+        return record('sale', actor=listing.seller, recipient=buyer, listing=listing)
+    return record('listing_status', actor=listing.seller, listing=listing, old=old_status, new=listing.status)
+
+
+def recent(limit=10):
+    return list(ActivityEvent.objects.order_by(*ORDERING)[:limit])
+
+
+def feed(cursor=None, per_page=50, event_type=None, recipient_id=None):
+    """A KeysetPage of events, newest first, optionally of one type or for one user."""
+    events = ActivityEvent.objects.all()
+    if event_type:
+        events = events.filter(event_type=event_type)
+    if recipient_id is not None:
+        events = events.filter(recipient_id=recipient_id)
+    return paginate_keyset(events, cursor, per_page, ORDERING)
@@ -1,11 +1,10 @@
 # File: listings/admin.py
-from itertools import chain
 from django.urls import reverse
 from django.utils.html import format_html
 from django.contrib import admin
-from django.contrib.auth.models import User
-from django.db.models import Count
+from django.conf import settings
 from .models import CarListing, CarImage, Message, Review
+from . import activity, rollups
 
 # --- Admin view for Additional Images ---
 class CarImageInline(admin.TabularInline):
@@ -23,10 +22,10 @@ class CarListingAdmin(admin.ModelAdmin):
 # --- UPDATED: Admin view for Messages ---
 class MessageAdmin(admin.ModelAdmin):
     # --- FIX: Added 'short_content' to the display ---
-    list_display = ('sender', 'receiver', 'listing', 'short_content', 'timestamp', 'is_read')
-    list_filter = ('is_read', 'listing__make')
+    list_display = ('sender', 'receiver', 'listing', 'short_content', 'timestamp')
+    list_filter = ('listing__make',)
     search_fields = ('sender__username', 'receiver__username', 'content')
-    readonly_fields = ('sender', 'receiver', 'listing', 'content', 'timestamp', 'is_read')
+    readonly_fields = ('sender', 'receiver', 'listing', 'content', 'timestamp')
 
     def has_add_permission(self, request):
         return False
@@ -65,55 +64,14 @@ admin.site.register(Review, ReviewAdmin)
 # --- CUSTOM ADMIN DASHBOARD SETUP (remains the same) ---
 original_index = admin.site.index
 def custom_index(request, *args, **kwargs):
-    # --- Existing analytics queries (remain the same) ---
-    total_users = User.objects.count()
-    total_listings = CarListing.objects.count()
-    active_listings = CarListing.objects.filter(status='ACTIVE').count()
-    sold_listings = CarListing.objects.filter(status='SOLD').count()
-    listings_by_brand = CarListing.objects.values('make').annotate(count=Count('id')).order_by('-count')
-    brand_labels = [item['make'] for item in listings_by_brand]
-    brand_data = [item['count'] for item in listings_by_brand]
-    listings_by_status = CarListing.objects.values('status').annotate(count=Count('id')).order_by('-count')
-    status_labels = [item['status'].replace('_', ' ').title() for item in listings_by_status]
-    status_data = [item['count'] for item in listings_by_status]
-
-    # --- CORRECTED: Fetch a larger pool of recent activities ---
-    # This ensures we don't miss recent events from one category.
-    recent_users = User.objects.order_by('-date_joined')[:10]
-    recent_listings = CarListing.objects.order_by('-created_at')[:10]
-    recent_reviews = Review.objects.order_by('-timestamp')[:10]
-
-    # Add a custom 'activity_type' and 'timestamp' to each object
-    for user in recent_users:
-        user.activity_type = 'User'
-        user.timestamp = user.date_joined
-        
-    for listing in recent_listings:
-        listing.activity_type = 'Listing'
-        listing.timestamp = listing.created_at
-
-    for review in recent_reviews:
-        review.activity_type = 'Review'
-        # The 'timestamp' field already exists
-
-    # Combine all activities into one list
-    combined_activities = list(chain(recent_users, recent_listings, recent_reviews))
-
-    # Sort the combined list by timestamp in descending order
-    sorted_activities = sorted(combined_activities, key=lambda x: x.timestamp, reverse=True)
+    # --- Analytics come from the rollup tables, never the full source tables ---
+    summary = rollups.dashboard(settings.DASHBOARD_TIMELINE_DAYS)
 
     # --- Populate the context for the template ---
     kwargs['extra_context'] = {
-        'total_users': total_users,
-        'total_listings': total_listings,
-        'active_listings': active_listings,
-        'sold_listings': sold_listings,
-        'brand_labels': brand_labels,
-        'brand_data': brand_data,
-        'status_labels': status_labels,
-        'status_data': status_data,
-        # Get the top 10 most recent activities overall
-        'activity_feed': sorted_activities[:10],
+        **summary,
+        # The 10 newest events from the activity log, one indexed query
+        'activity_feed': activity.recent(10),
     }
     return original_index(request, *args, **kwargs)
 
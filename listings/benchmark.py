@@ -0,0 +1,331 @@
+# File: listings/benchmark.py
+
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+from django.test import Client, RequestFactory
+from django.urls import resolve, reverse
+
+from . import metrics
+from .models import CarListing, Review
+from .synthetic import CITIES, MODELS
+
+# Drives the site in-process through the Django test client with a weighted
+# mix of user journeys, and times every request by URL name. Meant to be run
+# against a database filled by generate_marketplace; the message and wishlist
+# journeys write to it.
+DEFAULT_MIX = {'browse': 35, 'search': 25, 'detail': 25, 'message': 5, 'wishlist': 10}
+LOGGED_IN_CLIENTS = 20
+SAMPLE_SIZE = 1000
+TYPOS = {'Nexon': 'Nexin', 'Creta': 'Cretta', 'Swift': 'Swfit', 'Innova': 'Inova', 'Seltos': 'Seltoz'}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Benchmark:
+    def __init__(self, mix=None, seed=None, host='localhost'):
+        self.mix = mix or DEFAULT_MIX
+        self.rng = random.Random(seed)
+        self.anonymous = Client(HTTP_HOST=host)
+        self.clients = []
+        for user in User.objects.filter(is_active=True).order_by('?')[:LOGGED_IN_CLIENTS]:
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+            self.clients.append((user, client))
+        self.listing_ids = list(
+            CarListing.objects.filter(status='ACTIVE').order_by('?').values_list('pk', flat=True)[:SAMPLE_SIZE]
+        )
+        if not self.listing_ids or not self.clients:
+            raise ValueError("The database needs users and active listings; run generate_marketplace first.")
+        self.timings = defaultdict(list)
+
+    def _get(self, client, url, data=None):
+        return self._timed(client.get, url, data)
+
+    def _post(self, client, url, data):
+        return self._timed(client.post, url, data)
+
+    def _timed(self, method, url, data):
+        started = time.perf_counter()
+        response = method(url, data)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 500:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+        match = response.resolver_match
+        self.timings[match.view_name if match else url].append(elapsed)
+        return response
+
+    def _any_client(self):
+        if self.rng.random() < 0.5:
+            return self.anonymous
+        return self.rng.choice(self.clients)[1]
+
+    # --- User journeys ---
+    def browse(self):
+        client = self._any_client()
+        if self.rng.random() < 0.2:
+            self._get(client, reverse('landing-page'))
+            return
+        filters = {}
+        if self.rng.random() < 0.5:
+            filters['make'] = self.rng.choice(list(MODELS))
+        if self.rng.random() < 0.4:
+            filters['location_city'] = self.rng.choice(CITIES)
+        if self.rng.random() < 0.3:
+            filters['max_price'] = self.rng.choice((500000, 1000000, 2000000))
+        self._get(client, reverse('car-list'), filters)
+        if self.rng.random() < 0.3:
+            self._get(client, reverse('car-list-more'), filters)
+
+    def search(self):
+        make = self.rng.choice(list(MODELS))
+        model = self.rng.choice(MODELS[make])
+        query = self.rng.choice((make, model, f'{make} {model}', TYPOS.get(model, model), model[:3]))
+        self._get(self._any_client(), reverse('car-list'), {'q': query})
+
+    def detail(self):
+        self._get(self._any_client(), reverse('car-detail', args=[self.rng.choice(self.listing_ids)]))
+
+    def message(self):
+        _, client = self.rng.choice(self.clients)
+        listing = self.rng.choice(self.listing_ids)
+        self._post(client, reverse('car-detail', args=[listing]), {'content': 'Is this still available?'})
+        self._get(client, reverse('inbox'))
+
+    def wishlist(self):
+        _, client = self.rng.choice(self.clients)
+        self._get(client, reverse('toggle-wishlist', args=[self.rng.choice(self.listing_ids)]))
+        self._get(client, reverse('wishlist'))
+
+    def run(self, journeys, warmup=0):
+        names, weights = list(self.mix), list(self.mix.values())
+        for _ in range(warmup):
+            getattr(self, self.rng.choices(names, weights)[0])()
+        self.timings.clear()
+        metrics.registry.reset()
+        started = time.perf_counter()
+        for _ in range(journeys):
+            getattr(self, self.rng.choices(names, weights)[0])()
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, wall_time):
+        queries = metrics.registry.snapshot()
+        views = {}
+        for view, timings in sorted(self.timings.items()):
+            timings.sort()
+            histogram = queries.get(view, {}).get('queries')
+            views[view] = {
+                'requests': len(timings),
+                'p50_ms': round(percentile(timings, 50) * 1000, 2),
+                'p95_ms': round(percentile(timings, 95) * 1000, 2),
+                'p99_ms': round(percentile(timings, 99) * 1000, 2),
+                'rps': round(len(timings) / sum(timings), 1),
+                'avg_queries': round(histogram.sum / histogram.count, 1) if histogram and histogram.count else None,
+            }
+        total = sum(view['requests'] for view in views.values())
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'listings': CarListing.objects.count(),
+            'mix': self.mix,
+            'requests': total,
+            'rps': round(total / wall_time, 1) if wall_time else 0,
+            'views': views,
+        }
+
+
+# --- WSGI vs ASGI ---
+# The same list of GET requests to the async read paths, sent to the project's
+# WSGI application from a pool of threads and to its ASGI application as
+# coroutines on one event loop, `concurrency` at a time either way. Requests
+# are handed to the applications directly, so the numbers are the Django
+# stack's without a web server or the network in front of it.
+SERVER_ROUTES = {'landing-page': 10, 'car-list': 35, 'car-detail': 35, 'profile': 10, 'compare-cars': 10}
+
+
+class ServerBenchmark:
+    def __init__(self, concurrency=20, seed=None, host='localhost'):
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.host = host
+        self.listing_ids = list(
+            CarListing.objects.filter(status='ACTIVE').order_by('?').values_list('pk', flat=True)[:SAMPLE_SIZE]
+        )
+        self.sellers = list(
+            User.objects.filter(Exists(Review.objects.filter(seller=OuterRef('pk'))))
+            .order_by('?').values_list('username', flat=True)[:SAMPLE_SIZE]
+        ) or list(User.objects.order_by('?').values_list('username', flat=True)[:SAMPLE_SIZE])
+        self.session_cookies = []
+        for user in User.objects.filter(is_active=True).order_by('?')[:LOGGED_IN_CLIENTS]:
+            client = Client()
+            client.force_login(user)
+            name = settings.SESSION_COOKIE_NAME
+            self.session_cookies.append(f'{name}={client.cookies[name].value}')
+        if not self.listing_ids or not self.sellers:
+            raise ValueError("The database needs users and active listings; run generate_marketplace first.")
+
+    def _path(self, route):
+        if route == 'car-detail':
+            return reverse(route, args=[self.rng.choice(self.listing_ids)])
+        if route == 'profile':
+            return reverse(route, args=[self.rng.choice(self.sellers)])
+        if route == 'compare-cars':
+            ids = self.rng.sample(self.listing_ids, min(3, len(self.listing_ids)))
+            return f"{reverse(route)}?ids={','.join(map(str, ids))}"
+        if route == 'car-list' and self.rng.random() < 0.5:
+            return f"{reverse(route)}?make={self.rng.choice(list(MODELS))}"
+        return reverse(route)
+
+    def plan(self, count):
+        """`count` (path, cookie) pairs, half of them from logged-in users."""
+        routes = self.rng.choices(list(SERVER_ROUTES), list(SERVER_ROUTES.values()), k=count)
+        plan = []
+        for route in routes:
+            logged_in = self.session_cookies and self.rng.random() < 0.5
+            plan.append((self._path(route), self.rng.choice(self.session_cookies) if logged_in else None))
+        return plan
+
+    # --- WSGI: a thread per request in flight ---
+    def _wsgi_request(self, application, path, cookie):
+        headers = {'HTTP_HOST': self.host}
+        if cookie:
+            headers['HTTP_COOKIE'] = cookie
+        environ = RequestFactory().get(path, **headers).environ
+        statuses = []
+        started = time.perf_counter()
+        result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return path, int(statuses[0].split()[0]), time.perf_counter() - started
+
+    def run_wsgi(self, plan):
+        from car_platform.wsgi import application
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            return list(pool.map(lambda request: self._wsgi_request(application, *request), plan))
+
+    # --- ASGI: a coroutine per request in flight ---
+    async def _asgi_request(self, application, path, cookie):
+        url = urlsplit(path)
+        headers = [(b'host', self.host.encode())]
+        if cookie:
+            headers.append((b'cookie', cookie.encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(), 'root_path': '',
+            'query_string': url.query.encode(), 'headers': headers,
+            'client': ('127.0.0.1', 50000), 'server': (self.host, 80),
+        }
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client never disconnects; Django cancels this wait once it has responded
+            await asyncio.Future()
+
+        statuses = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return path, statuses[0], time.perf_counter() - started
+
+    def run_asgi(self, plan):
+        from car_platform.asgi import application
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(path, cookie):
+            async with semaphore:
+                return await self._asgi_request(application, path, cookie)
+
+        async def run_all():
+            return await asyncio.gather(*(limited(*request) for request in plan))
+        return asyncio.run(run_all())
+
+    def run(self, requests, warmup=0):
+        """Sends the same `requests` GETs to both applications; returns a summary per server."""
+        plan = self.plan(requests)
+        warmup_plan = self.plan(warmup)
+        results = {}
+        for server, runner in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+            runner(warmup_plan)
+            started = time.perf_counter()
+            responses = runner(plan)
+            results[server] = self.server_summary(responses, time.perf_counter() - started)
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'listings': CarListing.objects.count(),
+            'concurrency': self.concurrency,
+            'servers': results,
+        }
+
+    def server_summary(self, responses, wall_time):
+        by_view = defaultdict(list)
+        errors = 0
+        for path, status, elapsed in responses:
+            by_view[resolve(urlsplit(path).path).view_name].append(elapsed)
+            errors += status >= 500
+        views = {}
+        for view, timings in sorted(by_view.items()):
+            timings.sort()
+            views[view] = {
+                'requests': len(timings),
+                'p50_ms': round(percentile(timings, 50) * 1000, 2),
+                'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            }
+        timings = sorted(elapsed for _, _, elapsed in responses)
+        return {
+            'requests': len(responses),
+            'errors': errors,
+            'rps': round(len(responses) / wall_time, 1) if wall_time else 0,
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'views': views,
+        }
+
+
+def compare(baseline, current, key='p95_ms'):
+    """
+    [(view, baseline value, current value, change in percent)] for every view
+    in both runs, worst regression first.
+    """
+    rows = []
+    for view, result in current['views'].items():
+        before = baseline.get('views', {}).get(view)
+        if before and before[key]:
+            rows.append((view, before[key], result[key], (result[key] - before[key]) / before[key] * 100))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(result, path):
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write('\n')
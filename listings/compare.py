@@ -0,0 +1,142 @@
+# File: listings/compare.py
+
+import re
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.urls import reverse
+
+from .models import CarListing, SellerRating
+
+# The compare page: at most COMPARE_MAX_CARS active listings side by side. The
+# listings, their sellers, seller ratings and photo counts come from a single
+# query, and each spec row says whether the cars differ and which of them have
+# the best value. A comparison is cached under its sorted ids, so ?ids=3,1 and
+# ?ids=1,3 share an entry. Saving or deleting any listing moves a generation
+# number that is part of every key, which retires all cached comparisons at
+# once; photo counts and seller ratings can lag by COMPARE_CACHE_TIMEOUT.
+GENERATION_KEY = 'listings:compare:generation'
+DEFAULT_IMAGE = CarListing._meta.get_field('image').default
+
+
+def _seller_rating(car):
+    try:
+        return car.seller.seller_rating.average
+    except SellerRating.DoesNotExist:
+        return None
+
+
+def _photo_count(car):
+    # The placeholder a listing gets when no main photo was uploaded isn't one
+    return car.image_count + (car.image.name not in ('', DEFAULT_IMAGE))
+
+
+def _inr(value):
+    return f'₹{value:,}'
+
+
+# (key, label, value, display, best) where best is 'min' or 'max' for the rows
+# in which a lower or higher value is better, and None where neither is.
+SPECS = (
+    ('price', 'Price', lambda car: car.price, _inr, 'min'),
+    ('year', 'Year', lambda car: car.year, str, 'max'),
+    ('kms_driven', 'Kilometers Driven', lambda car: car.kms_driven, lambda value: f'{value:,} km', 'min'),
+    ('mileage', 'Mileage', lambda car: car.mileage, lambda value: f'{value} kmpl', 'max'),
+    ('fuel_type', 'Fuel Type', lambda car: car.fuel_type, str, None),
+    ('transmission', 'Transmission', lambda car: car.transmission, str, None),
+    ('noc_available', 'NOC Available', lambda car: car.noc_available, lambda value: 'Yes' if value else 'No', 'max'),
+    ('location_city', 'City', lambda car: car.location_city, str, None),
+    ('photos', 'Photos', _photo_count, str, 'max'),
+    ('seller_rating', 'Seller Rating', _seller_rating,
+     lambda value: 'No reviews' if value is None else f'{value:.1f} / 5', 'max'),
+)
+
+
+def parse_ids(raw, limit=None):
+    """
+    The distinct listing ids among the first `limit` non-empty
+    comma-separated values of `raw`, skipping anything that isn't an id.
+    Returns (ids, whether more values were given than were read).
+    """
+    limit = limit or settings.COMPARE_MAX_CARS
+    # finditer is lazy: scanning stops after limit + 1 values, however long the string
+    tokens = (match.group().strip() for match in re.finditer(r'[^,]+', raw))
+    values = list(islice((token for token in tokens if token), limit + 1))
+    ids = []
+    for value in values[:limit]:
+        if value.isdigit() and len(value) <= 18 and int(value) and int(value) not in ids:
+            ids.append(int(value))
+    return ids, len(values) > limit
+
+
+def _row(cars, key, label, value, display, best):
+    values = [value(car) for car in cars]
+    row = {
+        'key': key, 'label': label, 'values': values,
+        'display': [display(v) for v in values],
+        'differs': len(set(values)) > 1, 'best': [],
+    }
+    known = [v for v in values if v is not None]
+    if best and row['differs'] and known:
+        target = min(known) if best == 'min' else max(known)
+        row['best'] = [index for index, v in enumerate(values) if v == target]
+    # What the template loops over: one cell per car
+    row['cells'] = [{'display': text, 'best': index in row['best']} for index, text in enumerate(row['display'])]
+    return row
+
+
+def build(ids):
+    """The comparison of the active listings among `ids`, without the cache."""
+    cars = list(
+        CarListing.objects.filter(id__in=ids, status='ACTIVE')
+        .select_related('seller__seller_rating')
+        .annotate(image_count=Count('additional_images'))
+        .order_by('id')
+    )
+    return {'cars': cars, 'rows': [_row(cars, *spec) for spec in SPECS]}
+
+
+def comparison(ids):
+    """
+    A dict with the listings ('cars', ordered by id, only those still active)
+    and the spec 'rows', each with the cars' 'values', their 'display' text,
+    whether they 'differs' and the indexes of the 'best' values.
+    """
+    if not ids:
+        return {'cars': [], 'rows': []}
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    key = f'listings:compare:{generation}:' + ','.join(map(str, sorted(ids)))
+    result = cache.get(key)
+    if result is None:
+        result = build(ids)
+        cache.set(key, result, settings.COMPARE_CACHE_TIMEOUT)
+    return result
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Nothing cached yet under any generation
+        pass
+
+
+def as_json(result):
+    return {
+        'cars': [
+            {
+                'id': car.pk,
+                'title': str(car),
+                'url': reverse('car-detail', args=[car.pk]),
+                'image': car.image.url if car.image else None,
+                'seller': car.seller.username,
+            }
+            for car in result['cars']
+        ],
+        'rows': [
+            {key: row[key] for key in ('key', 'label', 'values', 'display', 'differs', 'best')}
+            for row in result['rows']
+        ],
+    }
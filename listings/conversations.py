@@ -0,0 +1,90 @@
+# File: listings/conversations.py
+
+from heapq import merge
+
+from django.db.models import Count, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Conversation, Message
+from .pagination import PREVIOUS, InvalidCursor, KeysetPage, decode_cursor, paginate_keyset
+from . import unread
+
+# A conversation is the messages two users sent each other about one listing.
+# Each direction is a range of the (listing, sender, receiver, timestamp) index,
+# so a page of history is the newest rows of both ranges merged, and "load
+# older" continues both from a keyset cursor.
+#
+# What a participant has read is a watermark on their Conversation row: every
+# message with an id up to last_read_id. Opening a conversation moves it with
+# one UPDATE of that row rather than updating each unread message.
+ORDERING = ('-timestamp', '-id')
+
+
+def _sent(listing_id, sender_id, receiver_id):
+    return Message.objects.filter(listing_id=listing_id, sender_id=sender_id, receiver_id=receiver_id)
+
+
+def messages_between(listing_id, user_id, other_user_id):
+    return _sent(listing_id, user_id, other_user_id) | _sent(listing_id, other_user_id, user_id)
+
+
+def _direction(cursor):
+    try:
+        return decode_cursor(cursor, Message, ORDERING)[0] if cursor else None
+    except InvalidCursor:
+        return None
+
+
+def history(listing_id, user_id, other_user_id, cursor=None, per_page=30):
+    """
+    A KeysetPage of the conversation, newest message first. Its next_cursor
+    loads the page of older messages, its previous_cursor the newer ones.
+    """
+    pages = [
+        paginate_keyset(_sent(listing_id, sender, receiver), cursor, per_page, ORDERING)
+        for sender, receiver in ((user_id, other_user_id), (other_user_id, user_id))
+    ]
+    newest_first = list(merge(*pages, key=lambda message: (message.timestamp, message.pk), reverse=True))
+    more = len(newest_first) > per_page
+    if _direction(cursor) == PREVIOUS:
+        # Both pages start just above the cursor, so the page is the oldest end
+        has_newer = more or any(page.has_previous for page in pages)
+        return KeysetPage(newest_first[-per_page:], True, has_newer, ORDERING)
+    has_older = more or any(page.has_next for page in pages)
+    return KeysetPage(newest_first[:per_page], has_older, any(page.has_previous for page in pages), ORDERING)
+
+
+def watermarks(listing_id, user_id, other_user_id):
+    """{participant id: last_read_id} for both sides of the conversation."""
+    rows = Conversation.objects.filter(
+        listing_id=listing_id, owner_id__in=[user_id, other_user_id], other_user_id__in=[user_id, other_user_id],
+    ).values_list('owner_id', 'last_read_id')
+    return {user_id: 0, other_user_id: 0, **dict(rows)}
+
+
+def mark_read(listing_id, user_id, other_user_id, message):
+    """
+    Records that `user_id` has read the conversation up to `message`. Their
+    unread count becomes the number of messages from the other user after
+    it, counted in the same UPDATE, so a message that arrives meanwhile stays
+    unread.
+    """
+    unread_after = _sent(listing_id, other_user_id, user_id).filter(id__gt=message.pk).order_by().values(
+        'receiver_id'
+    ).annotate(count=Count('id')).values('count')
+    marked = Conversation.objects.filter(owner_id=user_id, listing_id=listing_id, other_user_id=other_user_id).update(
+        last_read_id=message.pk, unread_count=Coalesce(Subquery(unread_after), 0),
+    )
+    if not marked:
+        # No row yet, e.g. for conversations from before the rows were kept
+        Conversation.objects.bulk_create(
+            [Conversation(
+                owner_id=user_id, listing_id=listing_id, other_user_id=other_user_id,
+                last_message_id=message.pk, last_message_at=message.timestamp,
+                last_read_id=message.pk, unread_count=0,
+            )],
+            update_conflicts=True,
+            unique_fields=['owner', 'listing', 'other_user'],
+            update_fields=['last_read_id', 'unread_count'],
+        )
+    unread.invalidate(user_id)
@@ -0,0 +1,70 @@
+# File: listings/engagement.py
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import CarListing, ListingViewer, Message
+
+# The engagement counters on CarListing are adjusted by signals as wishlists,
+# messages and viewers change. Writes that skip signals (bulk_create, queryset
+# deletes, users deleted with their wishlists) make them drift; reconcile()
+# recounts them from the rows behind them.
+Wishlist = CarListing.wishlist.through
+
+# counter field: (model, foreign key to CarListing)
+SOURCES = {
+    'wishlist_count': (Wishlist, 'carlisting_id'),
+    'message_count': (Message, 'listing_id'),
+    'unique_viewers': (ListingViewer, 'listing_id'),
+}
+CHUNK_SIZE = 1000
+
+
+def _actual_counts(listing_ids):
+    counts = {}
+    for field, (model, key) in SOURCES.items():
+        rows = model.objects.filter(**{f'{key}__in': listing_ids}).values_list(key).annotate(count=Count('pk'))
+        counts[field] = dict(rows.order_by())
+    return counts
+
+
+def reconcile(dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Recounts every listing's counters and corrects the ones that drifted.
+    Returns [(listing id, field, stored value, actual value)] for each fix.
+
+    Corrections are applied as F() deltas, so increments that land between
+    the recount and the write are kept.
+    """
+    fields = list(SOURCES)
+    rows = CarListing.objects.order_by('pk').values_list('pk', *fields)
+    fixes = []
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            fixes.extend(_reconcile_chunk(chunk, fields, dry_run))
+            chunk = []
+    if chunk:
+        fixes.extend(_reconcile_chunk(chunk, fields, dry_run))
+    return fixes
+
+
+def _reconcile_chunk(rows, fields, dry_run):
+    actual = _actual_counts([row[0] for row in rows])
+    fixes = []
+    # (field, delta): listing ids, so listings off by the same amount share an UPDATE
+    by_delta = defaultdict(list)
+    for listing_id, *stored in rows:
+        for field, value in zip(fields, stored):
+            count = actual[field].get(listing_id, 0)
+            if count != value:
+                fixes.append((listing_id, field, value, count))
+                by_delta[field, count - value].append(listing_id)
+    if not dry_run and by_delta:
+        with transaction.atomic():
+            for (field, delta), listing_ids in by_delta.items():
+                CarListing.objects.filter(pk__in=listing_ids).update(**{field: F(field) + delta})
+    return fixes
@@ -0,0 +1,185 @@
+# File: listings/facets.py
+
+import hashlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import CarListing
+
+# The facet "cube": the number of ACTIVE listings for every distinct
+# (make, city, fuel, transmission, year, price bucket) combination. It is a
+# few thousand rows at most, so counting facets for any filter state is a
+# single pass over it in memory instead of a scan of the listing table.
+#
+# Each cell's count is cached under its own key, so a listing that moves is a
+# cache.decr() and a cache.incr() instead of a rewrite of the whole cube.
+# CACHE_KEY holds the build's generation and which cells it has; cell keys
+# include the generation, so counts left over from an older build are never
+# read. The cube is only rebuilt when one of these keys is missing.
+CACHE_KEY = 'listings:facet-cube'
+GENERATION_KEY = 'listings:facet-cube:generation'
+FACET_FIELDS = ('make', 'location_city', 'fuel_type', 'transmission', 'year', 'price_bucket')
+
+# (label, min price, max price) in INR; the last bucket is open-ended.
+PRICE_BUCKETS = (
+    ('Under ₹2 Lakh', 0, 200000),
+    ('₹2 - 5 Lakh', 200000, 500000),
+    ('₹5 - 10 Lakh', 500000, 1000000),
+    ('₹10 - 20 Lakh', 1000000, 2000000),
+    ('₹20 - 50 Lakh', 2000000, 5000000),
+    ('Above ₹50 Lakh', 5000000, None),
+)
+
+
+def price_bucket(price):
+    for index, (_, _, high) in enumerate(PRICE_BUCKETS):
+        if high is None or price < high:
+            return index
+    return len(PRICE_BUCKETS) - 1
+
+
+def facet_key(listing):
+    return (
+        listing.make, listing.location_city, listing.fuel_type,
+        listing.transmission, listing.year, price_bucket(listing.price),
+    )
+
+
+def _build_cube():
+    bucket = Case(
+        *[When(price__lt=high, then=Value(index)) for index, (_, _, high) in enumerate(PRICE_BUCKETS) if high is not None],
+        default=Value(len(PRICE_BUCKETS) - 1),
+        output_field=IntegerField(),
+    )
+    rows = (
+        CarListing.objects.filter(status='ACTIVE')
+        .annotate(price_bucket=bucket)
+        .values_list(*FACET_FIELDS)
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+def _cell_key(generation, key):
+    return f'listings:facet-cell:{generation}:{hashlib.md5(repr(key).encode()).hexdigest()}'
+
+
+def _store_cube(cube):
+    cache.add(GENERATION_KEY, 0, None)
+    generation = cache.incr(GENERATION_KEY)
+    # The cells go in first, so the index never points at counts that aren't there
+    cache.set_many({_cell_key(generation, key): count for key, count in cube.items()}, settings.FACET_CACHE_TIMEOUT)
+    cache.set(CACHE_KEY, (generation, frozenset(cube)), settings.FACET_CACHE_TIMEOUT)
+
+
+def get_cube():
+    index = cache.get(CACHE_KEY)
+    if index is not None:
+        generation, keys = index
+        cell_keys = {_cell_key(generation, key): key for key in keys}
+        counts = cache.get_many(cell_keys)
+        if len(counts) == len(cell_keys):
+            return {cell_keys[cell_key]: count for cell_key, count in counts.items() if count > 0}
+    cube = _build_cube()
+    _store_cube(cube)
+    return cube
+
+
+def _move(old_key, new_key):
+    index = cache.get(CACHE_KEY)
+    if index is None:
+        # Nothing cached; the next read builds the cube
+        return
+    generation, keys = index
+    if new_key is not None and new_key not in keys:
+        # A cell the cached cube doesn't have yet
+        cache.delete(CACHE_KEY)
+        return
+    try:
+        if old_key is not None:
+            cache.decr(_cell_key(generation, old_key))
+        if new_key is not None:
+            cache.incr(_cell_key(generation, new_key))
+    except ValueError:
+        # The cell was evicted
+        cache.delete(CACHE_KEY)
+
+
+def listing_moved(old_key=None, new_key=None):
+    """
+    Called when a listing changes: old_key is the cell it was counted in
+    before (None if it wasn't active), new_key the cell it is in now. If it
+    moved, the two cached cells are decremented and incremented once the
+    transaction commits, so rolled back saves are never counted. A cell that
+    isn't cached, e.g. the first listing of a new combination, drops the cube
+    and the next read rebuilds it.
+    """
+    if old_key != new_key:
+        transaction.on_commit(lambda: _move(old_key, new_key))
+
+
+def choices_for(field, cube=None):
+    """
+    Sorted distinct values of `field` among active listings, e.g. every make.
+    """
+    cube = get_cube() if cube is None else cube
+    position = FACET_FIELDS.index(field)
+    return sorted({key[position] for key in cube})
+
+
+def _failed_filters(key, filters):
+    make, city, fuel_type, transmission, year, bucket = key
+    failed = []
+    if filters.get('make') and make != filters['make']:
+        failed.append('make')
+    if filters.get('location_city') and city != filters['location_city']:
+        failed.append('location_city')
+    if filters.get('fuel_type') and fuel_type != filters['fuel_type']:
+        failed.append('fuel_type')
+    if filters.get('transmission') and transmission != filters['transmission']:
+        failed.append('transmission')
+    if filters.get('year') and year != filters['year']:
+        failed.append('year')
+    _, low, high = PRICE_BUCKETS[bucket]
+    min_price, max_price = filters.get('min_price'), filters.get('max_price')
+    if (min_price is not None and high is not None and high <= min_price) or \
+            (max_price is not None and low > max_price):
+        failed.append('price_bucket')
+    return failed
+
+
+def facet_counts(filters, cube=None):
+    """
+    Counts per facet value for the given filter state (CarFilterForm's
+    cleaned_data). As usual for faceted search, each facet ignores its own
+    filter, so the counts show what picking another value would give.
+    Price filters are applied at bucket granularity and the free-text
+    search is not taken into account.
+    """
+    cube = get_cube() if cube is None else cube
+    counts = defaultdict(Counter)
+    for key, count in cube.items():
+        failed = _failed_filters(key, filters)
+        if len(failed) > 1:
+            continue
+        for position, field in enumerate(FACET_FIELDS):
+            if not failed or failed[0] == field:
+                counts[field][key[position]] += count
+    return {field: counts[field] for field in FACET_FIELDS}
+
+
+def price_bucket_facets(counts):
+    return [
+        {
+            'label': label,
+            'min_price': low,
+            'max_price': high - 1 if high is not None else None,
+            'count': counts['price_bucket'].get(index, 0),
+        }
+        for index, (label, low, high) in enumerate(PRICE_BUCKETS)
+    ]
@@ -4,11 +4,25 @@ from django import forms
 from django.contrib.auth.models import User
 from .models import CarListing, Message, Review, Profile, TRANSMISSION_CHOICES, FUEL_TYPE_CHOICES
 
+class MultipleFileInput(forms.FileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A file field that accepts several files; cleans to a list."""
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return single_file_clean(data, initial)
+
+
 # ... (CarListingForm, UserUpdateForm, ProfileUpdateForm, MessageForm remain the same) ...
 class CarListingForm(forms.ModelForm):
-    additional_images = forms.FileField(
+    additional_images = MultipleFileField(
         required=False,
-        widget=forms.FileInput(attrs={
+        widget=MultipleFileInput(attrs={
             'class': 'w-full text-sm text-gray-500 file:mr-4 file:py-2 file:px-4 file:rounded-full file:border-0 file:text-sm file:font-semibold file:bg-red-50 file:text-red-700 hover:file:bg-red-100'
         }),
         label="Additional Photos (Select multiple files)"
@@ -86,6 +100,14 @@ class CarFilterForm(forms.Form):
         self.fields['make'].choices = self.ANY_CHOICE + make_choices
         self.fields['location_city'].choices = self.ANY_CHOICE + city_choices
 
+    # Shows how many cars each choice would return, e.g. "Tata (12)"
+    def apply_facet_counts(self, counts):
+        for name in ('make', 'location_city', 'fuel_type', 'transmission'):
+            self.fields[name].choices = [
+                (value, f"{label} ({counts[name].get(value, 0)})" if value else label)
+                for value, label in self.fields[name].choices
+            ]
+
 # ... (ReviewForm and MessageForm remain the same) ...
 class MessageForm(forms.ModelForm):
     class Meta:
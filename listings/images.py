@@ -0,0 +1,229 @@
+# File: listings/images.py
+
+import base64
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageFilter, ImageOps
+
+from .models import CarImage, ProcessedImage
+
+logger = logging.getLogger(__name__)
+
+# Every uploaded photo gets resized WebP and JPEG renditions plus a tiny blurred
+# placeholder. Renditions are stored under the SHA-256 of the original file, so
+# the same photo uploaded twice is only resized and stored once.
+RENDITION_WIDTHS = (320, 640, 1280)
+RENDITION_FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpeg', 'JPEG', 'image/jpeg'),
+)
+RENDITION_QUALITY = 80
+PLACEHOLDER_WIDTH = 24
+
+# How long rendering caches a lookup; unprocessed images are checked again sooner
+RENDITIONS_CACHE_TIMEOUT = 60 * 60 * 24
+MISSING_CACHE_TIMEOUT = 60
+
+_executor = None
+
+
+def rendition_dir(digest):
+    return f'renditions/{digest[:2]}/{digest}'
+
+
+def _cache_key(source):
+    return f'listings:img:{hashlib.md5(source.encode()).hexdigest()}'
+
+
+def _encode(image, fmt, **options):
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height)).filter(ImageFilter.GaussianBlur(1))
+    data = base64.b64encode(_encode(tiny, 'JPEG', quality=40)).decode()
+    return f'data:image/jpeg;base64,{data}'
+
+
+def process_image(source, storage=default_storage, force=False):
+    """
+    Creates the renditions for one stored image and records them in a
+    ProcessedImage row. Returns the row, or None if the file is missing.
+    """
+    if not force:
+        existing = ProcessedImage.objects.filter(source=source).first()
+        if existing:
+            return existing
+    if not source or not storage.exists(source):
+        return None
+
+    with storage.open(source, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    same_content = ProcessedImage.objects.filter(digest=digest).exclude(source=source).first()
+    if same_content and not force:
+        fields = {
+            'digest': digest, 'width': same_content.width, 'height': same_content.height,
+            'placeholder': same_content.placeholder, 'renditions': same_content.renditions,
+        }
+    else:
+        image = ImageOps.exif_transpose(Image.open(BytesIO(data))).convert('RGB')
+        renditions = {key: {} for key, _, _ in RENDITION_FORMATS}
+        for width in RENDITION_WIDTHS:
+            # Never upscale, but always keep the smallest size
+            if width > image.width and width != RENDITION_WIDTHS[0]:
+                continue
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            for key, fmt, _ in RENDITION_FORMATS:
+                path = f'{rendition_dir(digest)}/{width}.{key}'
+                if force and storage.exists(path):
+                    storage.delete(path)
+                if not storage.exists(path):
+                    path = storage.save(path, ContentFile(_encode(resized, fmt, quality=RENDITION_QUALITY)))
+                renditions[key][str(width)] = path
+        fields = {
+            'digest': digest, 'width': image.width, 'height': image.height,
+            'placeholder': _placeholder(image), 'renditions': renditions,
+        }
+
+    processed, _ = ProcessedImage.objects.update_or_create(source=source, defaults=fields)
+    cache.delete(_cache_key(source))
+    return processed
+
+
+def move_source(old, new):
+    """
+    Points the renditions of `old` at the stored file `new`, which has the
+    same content, e.g. after dedupe_media renamed it.
+    """
+    if ProcessedImage.objects.filter(source=new).exists():
+        ProcessedImage.objects.filter(source=old).delete()
+    else:
+        ProcessedImage.objects.filter(source=old).update(source=new)
+    cache.delete_many([_cache_key(old), _cache_key(new)])
+
+
+def _process_in_background(sources):
+    try:
+        for source in sources:
+            try:
+                process_image(source)
+            except Exception:
+                logger.exception("Could not create renditions for %s", source)
+    finally:
+        # This thread opened its own database connection
+        connections.close_all()
+
+
+def schedule(*sources):
+    """
+    Queues renditions for the given image names once the current transaction
+    commits. With IMAGE_PROCESSING_ASYNC off they are made right away.
+    """
+    global _executor
+    sources = [source for source in sources if source]
+    if not sources:
+        return
+    if not settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(lambda: [process_image(source) for source in sources])
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS, thread_name_prefix='images')
+    transaction.on_commit(lambda: _executor.submit(_process_in_background, sources))
+
+
+def get_renditions(source):
+    """
+    Cached lookup used when rendering: a dict with 'placeholder', 'width',
+    'height' and 'renditions', or None if the image isn't processed yet.
+    """
+    return get_renditions_many([source])[source]
+
+
+def get_renditions_many(sources):
+    """
+    get_renditions() for a page of images at once, as {name: dict or None}:
+    one cache.get_many() for all of them and one query for those that
+    aren't cached.
+    """
+    keys = {_cache_key(source): source for source in sources}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = set(keys.values()) - found.keys()
+    if missing:
+        for processed in ProcessedImage.objects.filter(source__in=missing):
+            found[processed.source] = {
+                'placeholder': processed.placeholder, 'width': processed.width,
+                'height': processed.height, 'renditions': processed.renditions,
+            }
+        cache.set_many({_cache_key(source): found[source] for source in missing if source in found},
+                       RENDITIONS_CACHE_TIMEOUT)
+        cache.set_many({_cache_key(source): False for source in missing if source not in found},
+                       MISSING_CACHE_TIMEOUT)
+    return {source: found.get(source) or None for source in keys.values()}
+
+
+def listing_renditions(listings):
+    """
+    get_renditions_many() for the main photos of `listings`. Views put it in
+    the context as `image_renditions`, which {% responsive_image %} reads
+    before looking an image up on its own.
+    """
+    return get_renditions_many({car.image.name for car in listings if car.image})
+
+
+def _store_upload(upload, storage):
+    """
+    Decodes one uploaded photo to make sure it really is an image, then saves
+    it. Runs in a worker thread; Pillow releases the GIL while decoding.
+    """
+    try:
+        with Image.open(upload) as image:
+            image.load()
+    except Exception as exc:
+        raise ValidationError(f"{upload.name} is not a valid image.") from exc
+    upload.seek(0)
+    name = CarImage._meta.get_field('image').generate_filename(None, upload.name)
+    return storage.store(name, upload)
+
+
+def ingest_car_images(listing, uploads):
+    """
+    Adds several uploaded photos to a listing at once: they are validated and
+    written to storage in parallel, then inserted with a single bulk_create.
+    A photo picked twice is only added once. Returns (created images, names of the files that were rejected).
+    """
+    if not uploads:
+        return [], []
+    storage = CarImage._meta.get_field('image').storage
+    workers = min(len(uploads), settings.IMAGE_INGEST_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest') as pool:
+        futures = [pool.submit(_store_upload, upload, storage) for upload in uploads]
+    stored, rejected = {}, []
+    for upload, future in zip(uploads, futures):
+        try:
+            stored[future.result()] = upload.size
+        except ValidationError:
+            rejected.append(upload.name)
+
+    with transaction.atomic():
+        storage.add_references(stored)
+        created = CarImage.objects.bulk_create(
+            [CarImage(listing=listing, image=name) for name in stored]
+        )
+        # bulk_create doesn't send post_save, so queue the renditions here
+        schedule(*stored)
+    return created, rejected
@@ -0,0 +1,116 @@
+# File: listings/jobs.py
+
+import logging
+import os
+import socket
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+# A small job queue in the database, so work like sending email happens in the
+# run_jobs worker instead of the request. Enqueueing is a plain INSERT and
+# commits or rolls back with the rest of the request.
+#
+# Handlers receive a list of jobs. Pending jobs with the same kind and a
+# non-empty group are claimed together as soon as the first of them is due,
+# which is how several messages to one user become a single digest email.
+# A failed batch is retried with exponential backoff up to JOB_MAX_ATTEMPTS.
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Registers the decorated function as the handler of `kind` jobs."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, group='', delay=0):
+    return Job.objects.create(
+        kind=kind, group=group, payload=payload or {},
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def default_worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def backoff(attempts):
+    """Seconds to wait before the next try, after `attempts` failed ones."""
+    return settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+
+
+def release_stale():
+    """Puts back jobs whose worker died mid-batch. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='pending', locked_by='', locked_at=None,
+    )
+
+
+def claim(worker, limit=100):
+    """
+    Marks up to `limit` due jobs, plus the rest of their groups, as running
+    for `worker` and returns them. The UPDATE only takes jobs that are still
+    pending, so two workers never run the same job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status='pending', run_after__lte=now).order_by('run_after', 'id')
+    condition = Q()
+    for job_id, kind, group in due.values_list('id', 'kind', 'group')[:limit]:
+        condition |= Q(kind=kind, group=group) if group else Q(id=job_id)
+    if not condition:
+        return []
+    Job.objects.filter(condition, status='pending').update(
+        status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+    )
+    return list(Job.objects.filter(status='running', locked_by=worker, locked_at=now).order_by('id'))
+
+
+def _failed(batch, exc):
+    now = timezone.now()
+    error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+    given_up = [job.pk for job in batch if job.attempts >= settings.JOB_MAX_ATTEMPTS]
+    if given_up:
+        Job.objects.filter(pk__in=given_up).update(status='failed', last_error=error, locked_by='', locked_at=None)
+    retry_at = defaultdict(list)
+    for job in batch:
+        if job.pk not in given_up:
+            retry_at[now + timedelta(seconds=backoff(job.attempts))].append(job.pk)
+    for run_after, job_ids in retry_at.items():
+        Job.objects.filter(pk__in=job_ids).update(
+            status='pending', run_after=run_after, last_error=error, locked_by='', locked_at=None,
+        )
+
+
+def run(worker=None, limit=100):
+    """
+    Claims and runs one round of due jobs. Jobs that succeed are deleted.
+    Returns (succeeded, failed) job counts.
+    """
+    release_stale()
+    batches = defaultdict(list)
+    for job in claim(worker or default_worker_name(), limit):
+        batches[job.kind, job.group or job.pk].append(job)
+    succeeded = failed = 0
+    for (kind, _), batch in batches.items():
+        try:
+            HANDLERS[kind](batch)
+        except Exception as exc:
+            logger.exception("%s job(s) %s failed", kind, [job.pk for job in batch])
+            _failed(batch, exc)
+            failed += len(batch)
+        else:
+            Job.objects.filter(pk__in=[job.pk for job in batch]).delete()
+            succeeded += len(batch)
+    return succeeded, failed
@@ -0,0 +1,105 @@
+# File: listings/live.py
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+
+from . import conversations
+
+# Live updates for an open conversation page, sent as Server-Sent Events by
+# conversation_events_view. Each open page is one idle coroutine waiting on an
+# asyncio.Event; saving a message or marking messages read wakes the streams of
+# that conversation in this process, which then fetch what they haven't sent
+# yet with an indexed query on the message id. Streams served by other
+# processes catch up within MESSAGE_STREAM_POLL seconds.
+#
+# Message events carry the message id as the SSE id, so a browser that
+# reconnects sends it back as Last-Event-ID and resumes right after it.
+_lock = threading.Lock()
+_waiters = defaultdict(set)
+
+
+def _key(listing_id, user_id, other_user_id):
+    return listing_id, min(user_id, other_user_id), max(user_id, other_user_id)
+
+
+@contextmanager
+def subscribe(listing_id, user_id, other_user_id):
+    """Yields an asyncio.Event that is set whenever the conversation changes."""
+    key = _key(listing_id, user_id, other_user_id)
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with _lock:
+        _waiters[key].add(waiter)
+    try:
+        yield waiter[1]
+    finally:
+        with _lock:
+            _waiters[key].discard(waiter)
+            if not _waiters[key]:
+                del _waiters[key]
+
+
+def _wake(key):
+    with _lock:
+        waiters = list(_waiters.get(key, ()))
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The stream's event loop has already shut down
+            pass
+
+
+def notify(listing_id, user_id, other_user_id):
+    """Wakes the open streams of a conversation once the current transaction commits."""
+    key = _key(listing_id, user_id, other_user_id)
+    transaction.on_commit(lambda: _wake(key))
+
+
+def _event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def message_event(message, user_id):
+    return _event('message', {
+        'id': message.pk,
+        'mine': message.sender_id == user_id,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+        'time': format_date(timezone.localtime(message.timestamp), 'd M, P'),
+    }, event_id=message.pk)
+
+
+def poll(listing_id, user_id, other_user_id, after, read_up_to, limit=100):
+    """
+    What the stream hasn't sent yet: messages with an id above `after`, then a
+    read receipt if the other user has read further than `read_up_to`. Marks
+    the conversation read up to the delivered messages, since the page showing
+    them is open. Returns (events, last message id, read watermark, whether
+    a full `limit` of messages came back, so there may be more).
+    """
+    events = []
+    new = list(conversations.messages_between(listing_id, user_id, other_user_id)
+               .filter(id__gt=after).order_by('id')[:limit])
+    for message in new:
+        events.append(message_event(message, user_id))
+    read_up_to_by = conversations.watermarks(listing_id, user_id, other_user_id)
+    if new:
+        after = new[-1].pk
+        if after > read_up_to_by[user_id] and any(message.sender_id == other_user_id for message in new):
+            conversations.mark_read(listing_id, user_id, other_user_id, new[-1])
+            notify(listing_id, user_id, other_user_id)
+
+    seen = read_up_to_by[other_user_id]
+    if seen > read_up_to:
+        read_up_to = seen
+        events.append(_event('read', {'up_to': seen}))
+    return events, after, read_up_to, len(new) == limit
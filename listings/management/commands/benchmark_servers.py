@@ -0,0 +1,50 @@
+# File: listings/management/commands/benchmark_servers.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the same concurrent GET requests for the landing, browse, detail, profile and compare pages "
+        "to the WSGI and the ASGI application and compares their throughput and latency. "
+        "Use a generate_marketplace database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests sent to each server (default: 1000).")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once (default: 20).")
+        parser.add_argument('--warmup', type=int, default=100, help="Untimed requests sent first (default: 100).")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--host', default='localhost', help="Host header to send; must be in ALLOWED_HOSTS.")
+        parser.add_argument('--save', metavar='PATH', help="Store the results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            runner = benchmark.ServerBenchmark(
+                concurrency=options['concurrency'], seed=options['seed'], host=options['host'],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        result = runner.run(options['requests'], warmup=options['warmup'])
+        servers = result['servers']
+
+        self.stdout.write(f"{'View':<16}" + ''.join(f"{server + ' p50':>11}{server + ' p95':>11}" for server in servers))
+        for view in servers['wsgi']['views']:
+            row = ''.join(
+                f"{servers[server]['views'].get(view, {}).get('p50_ms', ''):>11}"
+                f"{servers[server]['views'].get(view, {}).get('p95_ms', ''):>11}"
+                for server in servers
+            )
+            self.stdout.write(f"{view:<16}{row}")
+        for server, summary in servers.items():
+            line = (
+                f"{server.upper()}: {summary['requests']} requests at concurrency {result['concurrency']}, "
+                f"{summary['rps']} req/s, p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                f"p99 {summary['p99_ms']} ms, {summary['errors']} errors."
+            )
+            self.stdout.write(self.style.ERROR(line) if summary['errors'] else self.style.SUCCESS(line))
+        if options['save']:
+            benchmark.save(result, options['save'])
+            self.stdout.write(f"Saved results to {options['save']}.")
@@ -0,0 +1,67 @@
+# File: listings/management/commands/benchmark_site.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings import benchmark
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in benchmark.DEFAULT_MIX:
+            raise CommandError(f"Unknown journey '{name}'; choose from {', '.join(benchmark.DEFAULT_MIX)}.")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a mix of browse, search, detail, message and wishlist journeys through the test client "
+        "and reports p50/p95/p99 latency and requests per second per view. "
+        "Writes messages and wishlist entries, so use a generate_marketplace database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journeys', type=int, default=500, help="Number of journeys to time (default: 500).")
+        parser.add_argument('--warmup', type=int, default=50, help="Untimed journeys run first (default: 50).")
+        parser.add_argument('--mix', help="Journey weights, e.g. browse=35,search=25,detail=25,message=5,wishlist=10")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--host', default='localhost', help="Host header to send; must be in ALLOWED_HOSTS.")
+        parser.add_argument('--save', metavar='PATH', help="Store the results as a JSON baseline.")
+        parser.add_argument('--compare', metavar='PATH', help="Compare p95 latencies with a saved baseline.")
+        parser.add_argument('--max-regression', type=float, metavar='PERCENT',
+                            help="With --compare, fail if any view's p95 got this much slower.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix']) if options['mix'] else None
+        try:
+            runner = benchmark.Benchmark(mix=mix, seed=options['seed'], host=options['host'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        result = runner.run(options['journeys'], warmup=options['warmup'])
+
+        self.stdout.write(f"{'View':<24}{'Requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}{'queries':>9}")
+        for view, row in result['views'].items():
+            queries = '' if row['avg_queries'] is None else row['avg_queries']
+            self.stdout.write(
+                f"{view:<24}{row['requests']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+                f"{row['rps']:>8}{queries:>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['requests']} requests, {result['rps']} req/s overall, {result['listings']} listings."
+        ))
+        if options['save']:
+            benchmark.save(result, options['save'])
+            self.stdout.write(f"Saved baseline to {options['save']}.")
+
+        if options['compare']:
+            rows = benchmark.compare(benchmark.load(options['compare']), result)
+            self.stdout.write(f"\n{'View':<24}{'p95 before':>12}{'p95 now':>10}{'change':>9}")
+            for view, before, now, change in rows:
+                line = f"{view:<24}{before:>12}{now:>10}{change:>+8.1f}%"
+                limit = options['max_regression']
+                self.stdout.write(self.style.ERROR(line) if limit is not None and change > limit else line)
+            worst = rows[0] if rows else None
+            if worst and options['max_regression'] is not None and worst[3] > options['max_regression']:
+                raise CommandError(f"{worst[0]} p95 regressed by {worst[3]:.1f}% (limit {options['max_regression']}%).")
@@ -0,0 +1,56 @@
+# File: listings/management/commands/collect_media_garbage.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings import media_gc
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes files under MEDIA_ROOT that no listing, car image, profile, stored blob "
+        "or rendition refers to. Safe to run nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the orphaned files without deleting them.")
+        parser.add_argument('--min-age', type=float, default=24,
+                            help="Only delete files not modified for this many hours (default: 24).")
+        parser.add_argument('--workers', type=int, default=4, help="Number of deleting threads (default: 4).")
+        parser.add_argument('--rate', type=float, default=0,
+                            help="At most this many deletions per second (default: no limit).")
+        parser.add_argument('--error-rate', type=float, default=0.001,
+                            help="False positive rate of the reference filter; those orphans are kept until a later run.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = time.time()
+        references = media_gc.build_reference_filter(options['error_rate'])
+        orphans = media_gc.find_orphans(settings.MEDIA_ROOT, references, started - options['min_age'] * 3600)
+        totals = {'files': 0, 'bytes': 0}
+
+        def paths():
+            for name, path, size in orphans:
+                totals['files'] += 1
+                totals['bytes'] += size
+                if dry_run or options['verbosity'] > 1:
+                    self.stdout.write(name)
+                yield path
+
+        if dry_run:
+            for _ in paths():
+                pass
+            self.stdout.write(self.style.SUCCESS(
+                f"Would delete {totals['files']} orphaned files ({totals['bytes'] / 1024 / 1024:.1f} MB)."
+            ))
+            return
+
+        deleted, failed = media_gc.delete_files(paths(), options['workers'], options['rate'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} orphaned files ({totals['bytes'] / 1024 / 1024:.1f} MB) "
+            f"in {time.time() - started:.1f}s."
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} files could not be deleted."))
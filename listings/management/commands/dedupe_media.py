@@ -0,0 +1,70 @@
+# File: listings/management/commands/dedupe_media.py
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings import images
+from listings.models import CarImage, CarListing, Profile
+from listings.storage import BLOB_DIR, blob_name, content_digest, media_storage
+
+MODELS = (CarListing, CarImage, Profile)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves car and profile photos uploaded before content-addressed storage into it, "
+        "so each distinct file is kept once and reference counted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be moved and freed.")
+
+    def _legacy_names(self, model):
+        # Field defaults are shared by every row that never had an upload; leave them be
+        default = model._meta.get_field('image').default
+        return (
+            model.objects.exclude(image='').exclude(image=default)
+            .exclude(image__startswith=f'{BLOB_DIR}/')
+            .order_by().values_list('image', flat=True).distinct()
+        )
+
+    def handle(self, *args, **options):
+        storage = media_storage()
+        dry_run = options['dry_run']
+        moved = missing = freed = 0
+        planned = set()
+
+        for model in MODELS:
+            for name in self._legacy_names(model):
+                if not storage.exists(name):
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f"Missing file: {name}"))
+                    continue
+                size = storage.size(name)
+                with storage.open(name, 'rb') as f:
+                    target = blob_name(content_digest(f), name)
+                    duplicate = target in planned or storage.exists(target)
+                    if dry_run:
+                        planned.add(target)
+                    else:
+                        storage.store(name, f)
+                moved += 1
+                if duplicate:
+                    freed += size
+                if dry_run:
+                    continue
+
+                with transaction.atomic():
+                    count = sum(m.objects.filter(image=name).update(image=target) for m in MODELS)
+                    storage.add_reference(target, size, count)
+                    images.move_source(name, target)
+                # Remove the old copy directly; it has no reference count of its own
+                FileSystemStorage.delete(storage, name)
+                self.stdout.write(f"{name} -> {target}")
+
+        verb = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} files into content-addressed storage, "
+            f"freeing {freed / 1024 / 1024:.1f} MB ({missing} missing)."
+        ))
@@ -0,0 +1,17 @@
+# File: listings/management/commands/flush_view_counts.py
+
+from django.core.management.base import BaseCommand
+
+from listings import view_counter
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the pending listing page views of every process to the view and unique viewer "
+        "counts. Each web process flushes its own views on a timer; run this from cron, or "
+        "after a deploy, to catch those of workers that stopped before their timer fired."
+    )
+
+    def handle(self, *args, **options):
+        views, viewers = view_counter.flush()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {views} view(s), {viewers} new viewer(s)."))
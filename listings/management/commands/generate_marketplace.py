@@ -0,0 +1,40 @@
+# File: listings/management/commands/generate_marketplace.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.synthetic import MarketplaceGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with a synthetic marketplace for load testing: users, listings, "
+        "photos, message threads, reviews and wishlists. Adds to whatever is there already."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--listings', type=int, default=20000)
+        parser.add_argument('--images-per-listing', type=int, default=3)
+        parser.add_argument('--messages', type=int, default=50000)
+        parser.add_argument('--reviews', type=int, default=2000, help="At most one per sold listing.")
+        parser.add_argument('--wishlist-items', type=int, default=20000)
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows per bulk_create.")
+        parser.add_argument('--seed', type=int, help="Random seed, for a repeatable marketplace.")
+
+    def handle(self, *args, **options):
+        def progress(label, done, total):
+            ending = '\n' if done >= total else ''
+            self.stdout.write(f"\r  {label}: {done}/{total}", ending=ending)
+            self.stdout.flush()
+
+        started = time.perf_counter()
+        counts = MarketplaceGenerator(
+            users=options['users'], listings=options['listings'],
+            images_per_listing=options['images_per_listing'], messages=options['messages'],
+            reviews=options['reviews'], wishlist_items=options['wishlist_items'],
+            chunk_size=options['chunk_size'], seed=options['seed'], progress=progress,
+        ).run()
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary} in {time.perf_counter() - started:.1f}s."))
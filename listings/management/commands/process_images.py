@@ -0,0 +1,29 @@
+# File: listings/management/commands/process_images.py
+
+from django.core.management.base import BaseCommand
+
+from listings import images
+from listings.models import CarImage, CarListing, Profile, ProcessedImage
+
+
+class Command(BaseCommand):
+    help = "Creates resized renditions for every uploaded car and profile photo that doesn't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-create renditions that already exist.")
+
+    def handle(self, *args, **options):
+        sources = set()
+        for model in (CarListing, CarImage, Profile):
+            sources.update(model.objects.exclude(image='').values_list('image', flat=True).distinct())
+        if not options['force']:
+            sources -= set(ProcessedImage.objects.values_list('source', flat=True))
+
+        processed = missing = 0
+        for source in sorted(sources):
+            if images.process_image(source, force=options['force']):
+                processed += 1
+            else:
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"Missing file: {source}"))
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images ({missing} missing)."))
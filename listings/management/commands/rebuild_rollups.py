@@ -0,0 +1,16 @@
+# File: listings/management/commands/rebuild_rollups.py
+
+from django.core.management.base import BaseCommand
+
+from listings import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the admin dashboard rollups from the listing, user and review tables. "
+        "Signals keep them current; run this periodically to catch up bulk writes."
+    )
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} rollup rows."))
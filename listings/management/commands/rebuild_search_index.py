@@ -0,0 +1,16 @@
+# File: listings/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+from listings import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index for every car listing."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write(self.style.WARNING("Full-text search needs SQLite FTS5; nothing to rebuild."))
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} listings."))
@@ -0,0 +1,33 @@
+# File: listings/management/commands/reconcile_engagement_counters.py
+
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from listings import engagement
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts every listing's wishlist, message and unique viewer counters and "
+        "corrects the ones that drifted from the rows behind them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the drift without correcting it.")
+        parser.add_argument('--chunk-size', type=int, default=engagement.CHUNK_SIZE,
+                            help=f"Listings recounted per batch (default: {engagement.CHUNK_SIZE}).")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        fixes = engagement.reconcile(dry_run=dry_run, chunk_size=options['chunk_size'])
+        if options['verbosity'] > 1:
+            for listing_id, field, stored, actual in fixes:
+                self.stdout.write(f"Listing {listing_id}: {field} {stored} -> {actual}")
+        if not fixes:
+            self.stdout.write(self.style.SUCCESS("All engagement counters are correct."))
+            return
+        per_field = Counter(field for _, field, _, _ in fixes)
+        summary = ', '.join(f"{count} {field}" for field, count in sorted(per_field.items()))
+        verb = "Would correct" if dry_run else "Corrected"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(fixes)} counters ({summary})."))
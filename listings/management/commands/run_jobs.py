@@ -0,0 +1,37 @@
+# File: listings/management/commands/run_jobs.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs, such as new-message emails, until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due now, then exit.")
+        parser.add_argument('--sleep', type=float, default=5,
+                            help="Seconds to wait when no job is due (default: 5).")
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Most due jobs claimed per round (default: 100).")
+        parser.add_argument('--worker', default=None, help="Name recorded on claimed jobs (default: host:pid).")
+
+    def handle(self, *args, **options):
+        worker = options['worker'] or jobs.default_worker_name()
+        total_succeeded = total_failed = 0
+        try:
+            while True:
+                succeeded, failed = jobs.run(worker, options['batch_size'])
+                total_succeeded += succeeded
+                total_failed += failed
+                if succeeded or failed:
+                    self.stdout.write(f"{succeeded} job(s) done, {failed} failed")
+                if options['once'] and not (succeeded or failed):
+                    break
+                if not (succeeded or failed):
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Ran {total_succeeded} job(s), {total_failed} failed."))
@@ -0,0 +1,153 @@
+# File: listings/media_gc.py
+
+import hashlib
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .models import CarImage, CarListing, MediaBlob, ProcessedImage, Profile
+
+# Finding orphaned media files without holding millions of paths in memory:
+# every stored name the database refers to goes into a Bloom filter (about
+# 1.8 bytes per name at the default error rate), then MEDIA_ROOT is streamed
+# with os.scandir. A file the filter has never seen is certainly unreferenced.
+# A false positive only means an orphan survives until a later run; the salt
+# changes every run, so it is unlikely to survive twice.
+IMAGE_MODELS = (CarListing, CarImage, Profile)
+CHUNK_SIZE = 2000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.salt = os.urandom(16)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16, salt=self.salt).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _rendition_paths(renditions):
+    for sizes in renditions.values():
+        yield from sizes.values()
+
+
+def referenced_names():
+    """Every storage name the database points at, streamed in chunks."""
+    for model in IMAGE_MODELS:
+        field = model._meta.get_field('image')
+        if field.has_default():
+            yield field.get_default()
+        yield from model.objects.exclude(image='').values_list('image', flat=True).iterator(chunk_size=CHUNK_SIZE)
+    yield from MediaBlob.objects.values_list('name', flat=True).iterator(chunk_size=CHUNK_SIZE)
+    for renditions in ProcessedImage.objects.values_list('renditions', flat=True).iterator(chunk_size=CHUNK_SIZE):
+        yield from _rendition_paths(renditions)
+
+
+def estimated_reference_count():
+    renditions_per_image = 6  # 3 widths x 2 formats
+    return (
+        sum(model.objects.count() for model in IMAGE_MODELS) + len(IMAGE_MODELS)
+        + MediaBlob.objects.count() + ProcessedImage.objects.count() * renditions_per_image
+    )
+
+
+def build_reference_filter(error_rate=0.001):
+    bloom = BloomFilter(estimated_reference_count(), error_rate)
+    for name in referenced_names():
+        bloom.add(name)
+    return bloom
+
+
+def walk(root):
+    """
+    Yields (storage name, os.DirEntry) for every regular file under root,
+    one directory listing at a time. Symlinks are never followed or yielded.
+    """
+    pending = ['']
+    while pending:
+        prefix = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, prefix)) as entries:
+                for entry in entries:
+                    name = prefix + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(name + '/')
+                    elif entry.is_file(follow_symlinks=False):
+                        yield name, entry
+        except FileNotFoundError:
+            continue
+
+
+def find_orphans(root, references, older_than):
+    """
+    Yields (storage name, path, size) for files not in `references` and not
+    modified since the `older_than` timestamp. The age check protects
+    uploads whose database row isn't committed yet.
+    """
+    for name, entry in walk(root):
+        if name in references:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime < older_than:
+            yield name, entry.path, stat.st_size
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1 / per_second if per_second else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + self.interval
+
+
+def delete_files(paths, workers=4, per_second=0):
+    """
+    Removes the given paths with a thread pool, at most `per_second` a
+    second if set. Only a few paths are queued at a time, so `paths` can be
+    a generator over millions of files. Returns (deleted, failed).
+    """
+    limiter = RateLimiter(per_second)
+    slots = threading.BoundedSemaphore(workers * 4)
+    lock = threading.Lock()
+    counts = {'deleted': 0, 'failed': 0}
+
+    def remove(path):
+        try:
+            os.remove(path)
+            outcome = 'deleted'
+        except FileNotFoundError:
+            outcome = 'deleted'
+        except OSError:
+            outcome = 'failed'
+        finally:
+            slots.release()
+        with lock:
+            counts[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-gc') as pool:
+        for path in paths:
+            limiter.wait()
+            slots.acquire()
+            pool.submit(remove, path)
+    return counts['deleted'], counts['failed']
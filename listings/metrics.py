@@ -0,0 +1,179 @@
+# File: listings/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# Per-view request metrics, kept in this process only: every request adds one
+# observation to each histogram of its URL name. Each worker process has its
+# own numbers, so Prometheus should scrape every worker (or sum them).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# (key, help text, buckets) for every histogram kept per view
+SERIES = (
+    ('latency_seconds', "Time spent in the view and middleware below it", LATENCY_BUCKETS),
+    ('queries', "SQL queries run", QUERY_BUCKETS),
+    ('sql_seconds', "Time spent waiting for SQL queries", LATENCY_BUCKETS),
+    ('template_seconds', "Time spent rendering templates", LATENCY_BUCKETS),
+    ('response_bytes', "Size of the response body", SIZE_BUCKETS),
+)
+
+_current = ContextVar('listings_request_stats', default=None)
+
+
+class RequestStats:
+    """What one request has cost so far."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def query_timer(execute, sql, params, many, context):
+    """A connection.execute_wrapper() that adds every query to the current request."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating inside its bucket, like Prometheus' histogram_quantile."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = self.buckets[index - 1] if index else 0
+                high = self.buckets[index] if index < len(self.buckets) else self.max
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+        yield '+Inf', self.count
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, **values):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {key: Histogram(buckets) for key, _, buckets in SERIES}
+            for key, value in values.items():
+                histograms[key].observe(value)
+
+    def snapshot(self):
+        """A copy of the histograms, {view: {series key: Histogram}}, sorted by view."""
+        with self._lock:
+            copy = {}
+            for view, histograms in sorted(self._views.items()):
+                copy[view] = {}
+                for key, histogram in histograms.items():
+                    clone = Histogram(histogram.buckets)
+                    clone.counts, clone.count = list(histogram.counts), histogram.count
+                    clone.sum, clone.max = histogram.sum, histogram.max
+                    copy[view][key] = clone
+            return copy
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(snapshot=None):
+    """The histograms in the Prometheus text exposition format (version 0.0.4)."""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = []
+    for key, help_text, _ in SERIES:
+        name = f'carhub_view_{key}'
+        lines.append(f'# HELP {name} {help_text}.')
+        lines.append(f'# TYPE {name} histogram')
+        for view, histograms in snapshot.items():
+            histogram = histograms[key]
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{view="{_label(view)}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{view="{_label(view)}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{view="{_label(view)}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- Template backend that adds render time to the current request ---
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None or stats.rendering:
+            # Templates rendered from inside another one are already being timed
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+            stats.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report their render time to the metrics middleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,75 @@
+# File: listings/middleware.py
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryMetricsMiddleware:
+    """
+    Records the query count, SQL time, template time, total time and response
+    size of every request under its URL name (see listings/metrics.py), and
+    logs a warning when a view goes over its query or latency budget.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI the async views below this run without a thread hop
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Queries are counted by the wrapper listings/signals.py puts on every connection
+        stats, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # The stats live in a context variable, which sync_to_async copies into
+        # the thread that runs the ORM, so queries made there are counted too
+        stats, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        metrics.registry.observe(
+            view, latency_seconds=elapsed, queries=stats.queries, sql_seconds=stats.sql_seconds,
+            template_seconds=stats.template_seconds, response_bytes=size,
+        )
+        self._check_budget(request, view, stats.queries, elapsed)
+
+    def _check_budget(self, request, view, queries, elapsed):
+        max_queries, max_ms = settings.METRICS_VIEW_BUDGETS.get(
+            view, (settings.METRICS_QUERY_BUDGET, settings.METRICS_LATENCY_BUDGET_MS)
+        )
+        if queries > max_queries:
+            logger.warning("%s ran %d SQL queries (budget %d): %s", view, queries, max_queries, request.get_full_path())
+        if elapsed * 1000 > max_ms:
+            logger.warning("%s took %.0f ms (budget %d ms): %s", view, elapsed * 1000, max_ms, request.get_full_path())
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_review_seller_response'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'created_at'], name='listing_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'make', 'price'], name='listing_status_make_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'location_city', 'price'], name='listing_status_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'fuel_type', 'transmission'], name='listing_status_fuel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'year', 'price'], name='listing_status_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['status', 'price'], name='listing_status_price_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:42
+
+import django.db.models.deletion
+import listings.search
+from django.db import migrations, models
+
+
+FTS_TABLE = 'listings_carlisting_fts'
+VOCAB_TABLE = 'listings_carlisting_fts_vocab'
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other databases keep using the icontains fallback.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        "make, model, description, location_city, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(f"CREATE VIRTUAL TABLE {VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'row')")
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 10.0, 1.0, 4.0)')")
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, make, model, description, location_city) "
+        "SELECT id, make, model, description, location_city FROM listings_carlisting"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {VOCAB_TABLE}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_carlisting_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearchEntry',
+            fields=[
+                ('listing', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='listings.carlisting')),
+                ('document', listings.search.SearchDocumentField(db_column='listings_carlisting_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'listings_carlisting_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
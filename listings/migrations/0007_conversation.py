@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    Message = apps.get_model('listings', 'Message')
+    Conversation = apps.get_model('listings', 'Conversation')
+    threads = {}
+    for message in Message.objects.order_by('timestamp', 'id').iterator():
+        for owner_id, other_id in ((message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)):
+            key = (owner_id, message.listing_id, other_id)
+            thread = threads.setdefault(key, {'unread_count': 0})
+            thread['last_message_id'] = message.id
+            thread['last_message_at'] = message.timestamp
+            if owner_id == message.receiver_id and not message.is_read:
+                thread['unread_count'] += 1
+    Conversation.objects.bulk_create([
+        Conversation(owner_id=owner_id, listing_id=listing_id, other_user_id=other_id, **thread)
+        for (owner_id, listing_id, other_id), thread in threads.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.message')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='listings.carlisting')),
+                ('other_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'last_message_at'], name='conversation_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'listing', 'other_user'), name='unique_conversation_per_owner')],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_buyers(apps, schema_editor):
+    # Same rule my_purchases_view used to apply on every request: the buyer is
+    # the other party of the latest message about the listing.
+    CarListing = apps.get_model('listings', 'CarListing')
+    Message = apps.get_model('listings', 'Message')
+    for listing in CarListing.objects.filter(status='SOLD', buyer__isnull=True):
+        last = Message.objects.filter(listing=listing).order_by('-timestamp').values_list('sender_id', 'receiver_id').first()
+        if last:
+            listing.buyer_id = last[1] if last[0] == listing.seller_id else last[0]
+            listing.save(update_fields=['buyer'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carlisting',
+            name='buyer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['buyer', 'status', 'created_at'], name='listing_buyer_status_idx'),
+        ),
+        migrations.RunPython(backfill_buyers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_seller_ratings(apps, schema_editor):
+    Review = apps.get_model('listings', 'Review')
+    SellerRating = apps.get_model('listings', 'SellerRating')
+    ratings = {}
+    for seller_id, rating in Review.objects.values_list('seller_id', 'rating').iterator():
+        summary = ratings.setdefault(seller_id, SellerRating(seller_id=seller_id))
+        summary.review_count += 1
+        summary.rating_sum += rating
+        setattr(summary, f'stars_{rating}', getattr(summary, f'stars_{rating}') + 1)
+    SellerRating.objects.bulk_create(ratings.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('listings', '0008_carlisting_buyer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerRating',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seller_rating', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_seller_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:00
+
+import listings.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_processedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(help_text='Storage name, derived from the SHA-256 of the file', max_length=255, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('references', models.PositiveIntegerField(default=0, help_text='Image fields currently pointing at this file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='carimage',
+            name='image',
+            field=models.ImageField(storage=listings.storage.media_storage, upload_to='car_images/additional/'),
+        ),
+        migrations.AlterField(
+            model_name='carlisting',
+            name='image',
+            field=models.ImageField(default='car_images/default.png', storage=listings.storage.media_storage, upload_to='car_images/', verbose_name='Main Image'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='image',
+            field=models.ImageField(default='profile_pics/default.jpg', storage=listings.storage.media_storage, upload_to='profile_pics'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_engagement_counts(apps, schema_editor):
+    CarListing = apps.get_model('listings', 'CarListing')
+    Message = apps.get_model('listings', 'Message')
+    Wishlist = CarListing.wishlist.through
+    sources = (
+        ('wishlist_count', Wishlist.objects.values_list('carlisting_id')),
+        ('message_count', Message.objects.values_list('listing_id')),
+    )
+    for field, rows in sources:
+        for listing_id, count in rows.annotate(count=models.Count('pk')).order_by().iterator():
+            CarListing.objects.filter(pk=listing_id).update(**{field: count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_mediablob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carlisting',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carlisting',
+            name='unique_viewers',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carlisting',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ListingViewer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_viewed_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='viewers', to='listings.carlisting')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'user'), name='unique_listing_viewer')],
+            },
+        ),
+        migrations.RunPython(backfill_engagement_counts, migrations.RunPython.noop),
+    ]
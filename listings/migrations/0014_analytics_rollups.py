@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:23
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    CarListing = apps.get_model('listings', 'CarListing')
+    ListingRollup = apps.get_model('listings', 'ListingRollup')
+    DailyRollup = apps.get_model('listings', 'DailyRollup')
+    rows = CarListing.objects.values_list('make', 'status', 'location_city').annotate(count=models.Count('id')).order_by()
+    ListingRollup.objects.bulk_create([
+        ListingRollup(make=make, status=status, location_city=city, count=count)
+        for make, status, city, count in rows
+    ], batch_size=500)
+    sources = (
+        ('signups', apps.get_model('auth', 'User'), 'date_joined'),
+        ('listings', CarListing, 'created_at'),
+        ('reviews', apps.get_model('listings', 'Review'), 'timestamp'),
+    )
+    for metric, model, field in sources:
+        days = model.objects.annotate(day=TruncDate(field)).values_list('day').annotate(count=models.Count('pk')).order_by()
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(metric=metric, day=day, count=count) for day, count in days], batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('signups', 'Signups'), ('listings', 'Listings posted'), ('reviews', 'Reviews')], max_length=20)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'day'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('PENDING_APPROVAL', 'Pending Approval'), ('ACTIVE', 'Active'), ('SOLD', 'Sold'), ('REJECTED', 'Rejected')], max_length=20)),
+                ('location_city', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('make', 'status', 'location_city'), name='unique_listing_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
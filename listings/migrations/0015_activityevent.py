@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_activity(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    CarListing = apps.get_model('listings', 'CarListing')
+    Review = apps.get_model('listings', 'Review')
+    Message = apps.get_model('listings', 'Message')
+    ActivityEvent = apps.get_model('listings', 'ActivityEvent')
+
+    def title(listing):
+        # Same text as CarListing.__str__, which historical models don't have
+        return f"{listing.year} {listing.make} {listing.model} - ₹{listing.price}"
+
+    def events():
+        for user in User.objects.iterator(chunk_size=1000):
+            yield ActivityEvent(event_type='signup', timestamp=user.date_joined, actor=user,
+                                data={'actor': user.username})
+        for listing in CarListing.objects.select_related('seller', 'buyer').iterator(chunk_size=1000):
+            data = {'actor': listing.seller.username, 'listing': title(listing)}
+            yield ActivityEvent(event_type='listing_created', timestamp=listing.created_at,
+                                actor=listing.seller, listing=listing, data=data)
+            if listing.status == 'SOLD':
+                sale = dict(data, recipient=listing.buyer.username) if listing.buyer else data
+                yield ActivityEvent(event_type='sale', timestamp=listing.updated_at, actor=listing.seller,
+                                    recipient=listing.buyer, listing=listing, data=sale)
+        for model, event_type, actor, recipient, when in (
+            (Review, 'review', 'reviewer', 'seller', 'timestamp'),
+            (Message, 'message', 'sender', 'receiver', 'timestamp'),
+        ):
+            for row in model.objects.select_related(actor, recipient, 'listing').iterator(chunk_size=1000):
+                data = {
+                    'actor': getattr(row, actor).username,
+                    'recipient': getattr(row, recipient).username,
+                    'listing': title(row.listing),
+                }
+                if event_type == 'review':
+                    data['rating'] = row.rating
+                yield ActivityEvent(event_type=event_type, timestamp=getattr(row, when), actor=getattr(row, actor),
+                                    recipient=getattr(row, recipient), listing=row.listing, data=data)
+
+    batch = []
+    for event in events():
+        batch.append(event)
+        if len(batch) >= 1000:
+            ActivityEvent.objects.bulk_create(batch)
+            batch = []
+    ActivityEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_analytics_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('signup', 'User signed up'), ('listing_created', 'Listing posted'), ('listing_status', 'Listing status changed'), ('sale', 'Car sold'), ('review', 'Review left'), ('message', 'Message sent')], max_length=20)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data', models.JSONField(default=dict)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.carlisting')),
+                ('recipient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp', 'id'], name='activity_timestamp_idx'), models.Index(fields=['event_type', 'timestamp', 'id'], name='activity_type_idx'), models.Index(fields=['recipient', 'timestamp', 'id'], name='activity_recipient_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
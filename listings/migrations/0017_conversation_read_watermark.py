@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    Conversation = apps.get_model('listings', 'Conversation')
+    Message = apps.get_model('listings', 'Message')
+    # Everything before the owner's oldest unread message in a thread counts as read
+    first_unread = {
+        (listing_id, sender_id, receiver_id): first
+        for listing_id, sender_id, receiver_id, first in Message.objects.filter(is_read=False)
+        .values_list('listing_id', 'sender_id', 'receiver_id').annotate(first=Min('id')).order_by()
+    }
+    batch = []
+    for conversation in Conversation.objects.only('owner', 'other_user', 'listing', 'last_message').iterator():
+        first = first_unread.get((conversation.listing_id, conversation.other_user_id, conversation.owner_id))
+        conversation.last_read_id = first - 1 if first else conversation.last_message_id or 0
+        batch.append(conversation)
+        if len(batch) >= 500:
+            Conversation.objects.bulk_update(batch, ['last_read_id'])
+            batch = []
+    Conversation.objects.bulk_update(batch, ['last_read_id'])
+
+
+def restore_is_read(apps, schema_editor):
+    Conversation = apps.get_model('listings', 'Conversation')
+    Message = apps.get_model('listings', 'Message')
+    for owner_id, other_user_id, listing_id, last_read_id in Conversation.objects.filter(
+            last_read_id__gt=0).values_list('owner', 'other_user', 'listing', 'last_read_id').iterator():
+        Message.objects.filter(
+            listing_id=listing_id, sender_id=other_user_id, receiver_id=owner_id, id__lte=last_read_id,
+        ).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_read_watermarks, restore_is_read),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_receiver_unread_idx',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['listing', 'sender', 'receiver', 'timestamp'], name='message_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0017_conversation_read_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.PositiveBigIntegerField()),
+                ('user_id', models.PositiveBigIntegerField()),
+            ],
+        ),
+    ]
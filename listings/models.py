@@ -3,6 +3,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator 
+from django.utils import timezone
+from .search import FTS_TABLE, SearchDocumentField
+from .storage import media_storage
 
 # ... (Choices remain the same) ...
 TRANSMISSION_CHOICES = (
@@ -36,7 +39,7 @@ class CarListing(models.Model):
     
     kms_driven = models.PositiveIntegerField(help_text="Kilometers driven", default=0)
     
-    image = models.ImageField(upload_to='car_images/', default='car_images/default.png', verbose_name="Main Image")
+    image = models.ImageField(upload_to='car_images/', default='car_images/default.png', storage=media_storage, verbose_name="Main Image")
 
     mileage = models.PositiveIntegerField(help_text="Mileage in KMPL or KM/Charge")
     transmission = models.CharField(max_length=10, choices=TRANSMISSION_CHOICES)
@@ -53,9 +56,19 @@ class CarListing(models.Model):
     )
     
     wishlist = models.ManyToManyField(User, related_name='wishlist_items', blank=True)
+
+    # Set when the listing is marked as sold (see listings/signals.py)
+    buyer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='purchases')
     
     # --- NEW FIELD FOR VIEW COUNT ---
     views = models.PositiveIntegerField(default=0)
+
+    # Engagement counters for the seller's dashboard, kept up to date by
+    # listings/signals.py and listings/view_counter.py. The
+    # reconcile_engagement_counters command recounts them.
+    wishlist_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
+    unique_viewers = models.PositiveIntegerField(default=0, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -63,10 +76,37 @@ class CarListing(models.Model):
     def __str__(self):
         return f"{self.year} {self.make} {self.model} - ₹{self.price}"
 
+    class Meta:
+        # Every public query filters on status='ACTIVE' first, so status leads each index.
+        # The second column matches the filters car_list_view can add on top of it.
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='listing_status_created_idx'),
+            models.Index(fields=['status', 'make', 'price'], name='listing_status_make_idx'),
+            models.Index(fields=['status', 'location_city', 'price'], name='listing_status_city_idx'),
+            models.Index(fields=['status', 'fuel_type', 'transmission'], name='listing_status_fuel_idx'),
+            models.Index(fields=['status', 'year', 'price'], name='listing_status_year_idx'),
+            models.Index(fields=['status', 'price'], name='listing_status_price_idx'),
+            # My Purchases: a buyer's sold cars, newest first
+            models.Index(fields=['buyer', 'status', 'created_at'], name='listing_buyer_status_idx'),
+        ]
+
+# --- Read-only view of the SQLite FTS5 search index (see listings/search.py) ---
+class ListingSearchEntry(models.Model):
+    listing = models.OneToOneField(
+        CarListing, primary_key=True, db_column='rowid',
+        related_name='search_entry', on_delete=models.DO_NOTHING
+    )
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
 # ... (CarImage, Message, Review, and Profile models remain the same) ...
 class CarImage(models.Model):
     listing = models.ForeignKey(CarListing, related_name='additional_images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='car_images/additional/')
+    image = models.ImageField(upload_to='car_images/additional/', storage=media_storage)
 
     def __str__(self):
         return f"Image for {self.listing.make} {self.listing.model}"
@@ -77,11 +117,57 @@ class Message(models.Model):
     listing = models.ForeignKey(CarListing, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Message from {self.sender.username} to {self.receiver.username} re: {self.listing.make}"
 
+    class Meta:
+        indexes = [
+            # One direction of a conversation, newest first: each page of the
+            # history is two short range scans, one per sender
+            models.Index(fields=['listing', 'sender', 'receiver', 'timestamp'], name='message_thread_idx'),
+        ]
+
+# --- Each logged-in user who has viewed a listing, behind CarListing.unique_viewers ---
+class ListingViewer(models.Model):
+    listing = models.ForeignKey(CarListing, on_delete=models.CASCADE, related_name='viewers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    first_viewed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'user'], name='unique_listing_viewer'),
+        ]
+
+# --- Counted page views not yet added to CarListing.views (see listings/view_counter.py) ---
+class PendingView(models.Model):
+    # Plain ids rather than foreign keys, so recording a view is a bare INSERT;
+    # views of listings or users deleted before the flush are dropped then
+    listing_id = models.PositiveBigIntegerField()
+    user_id = models.PositiveBigIntegerField()
+
+# --- One row per participant per thread; keeps the inbox a single indexed query ---
+class Conversation(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    listing = models.ForeignKey(CarListing, on_delete=models.CASCADE)
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+    # The owner has read every message in the thread up to this id
+    last_read_id = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner.username} <-> {self.other_user.username} re: {self.listing.make}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'listing', 'other_user'], name='unique_conversation_per_owner'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'last_message_at'], name='conversation_inbox_idx'),
+        ]
+
 class Review(models.Model):
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_received')
     reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_given')
@@ -99,9 +185,160 @@ class Review(models.Model):
     class Meta:
         unique_together = ('reviewer', 'listing')
 
+# --- Running totals of a seller's reviews, kept up to date by listings/signals.py ---
+class SellerRating(models.Model):
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='seller_rating')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.seller.username}: {self.average or 0:.1f} ({self.review_count} reviews)"
+
+    @property
+    def average(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def histogram(self):
+        # [(5, count, percent), ..., (1, count, percent)] for the rating bars
+        rows = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'stars_{stars}')
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            rows.append((stars, count, percent))
+        return rows
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    image = models.ImageField(default='profile_pics/default.jpg', upload_to='profile_pics')
+    image = models.ImageField(default='profile_pics/default.jpg', upload_to='profile_pics', storage=media_storage)
 
     def __str__(self):
         return f'{self.user.username} Profile'
+
+# --- Resized renditions of an uploaded image (see listings/images.py) ---
+class ProcessedImage(models.Model):
+    source = models.CharField(max_length=255, unique=True, help_text="Storage name of the original upload")
+    digest = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the original file")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    placeholder = models.TextField(help_text="Tiny blurred preview as a data: URI")
+    # e.g. {"webp": {"320": "renditions/ab/ab12.../320.webp", ...}, "jpeg": {...}}
+    renditions = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source
+
+# --- Reference counts for the content-addressed photo storage (see listings/storage.py) ---
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, primary_key=True, help_text="Storage name, derived from the SHA-256 of the file")
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0, help_text="Image fields currently pointing at this file")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references} references)'
+
+
+# --- Admin dashboard rollups, kept up to date by listings/signals.py (see listings/rollups.py) ---
+class ListingRollup(models.Model):
+    make = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=LISTING_STATUS_CHOICES)
+    location_city = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.make} / {self.status} / {self.location_city}: {self.count}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['make', 'status', 'location_city'], name='unique_listing_rollup'),
+        ]
+
+class DailyRollup(models.Model):
+    METRIC_CHOICES = (
+        ('signups', 'Signups'),
+        ('listings', 'Listings posted'),
+        ('reviews', 'Reviews'),
+    )
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.metric} on {self.day}: {self.count}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day'], name='unique_daily_rollup'),
+        ]
+
+# --- Append-only log of what happens on the site, written by listings/signals.py (see listings/activity.py) ---
+class ActivityEvent(models.Model):
+    TYPE_CHOICES = (
+        ('signup', 'User signed up'),
+        ('listing_created', 'Listing posted'),
+        ('listing_status', 'Listing status changed'),
+        ('sale', 'Car sold'),
+        ('review', 'Review left'),
+        ('message', 'Message sent'),
+    )
+    event_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    timestamp = models.DateTimeField(default=timezone.now)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Who the event concerns besides the actor, e.g. the seller of a reviewed car
+    recipient = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    listing = models.ForeignKey(CarListing, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Names and titles as they were at the time, so the feed renders without joins
+    data = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'{self.get_event_type_display()} at {self.timestamp:%Y-%m-%d %H:%M}'
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Activity events are append-only.")
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='activity_timestamp_idx'),
+            models.Index(fields=['event_type', 'timestamp', 'id'], name='activity_type_idx'),
+            models.Index(fields=['recipient', 'timestamp', 'id'], name='activity_recipient_idx'),
+        ]
+
+# --- Database-backed background job queue, run by the run_jobs command (see listings/jobs.py) ---
+class Job(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50)
+    # Pending jobs of the same kind and group are handed to their handler together
+    group = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+    class Meta:
+        indexes = [
+            # The worker's poll: due pending jobs, oldest first
+            models.Index(fields=['status', 'run_after'], name='job_due_idx'),
+            models.Index(fields=['kind', 'group', 'status'], name='job_group_idx'),
+        ]
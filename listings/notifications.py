@@ -0,0 +1,61 @@
+# File: listings/notifications.py
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import jobs
+from .models import Conversation, Message
+
+# New-message emails go through the job queue, grouped by receiver: the first
+# message starts a MESSAGE_DIGEST_WINDOW countdown and everything that arrives
+# for the same person before it ends is sent as one email. Messages the
+# receiver has read on the site by then are left out.
+MESSAGE_NOTIFICATION = 'message_notification'
+
+
+def enqueue_message(message):
+    jobs.enqueue(
+        MESSAGE_NOTIFICATION, {'message': message.pk},
+        group=str(message.receiver_id), delay=settings.MESSAGE_DIGEST_WINDOW,
+    )
+
+
+@jobs.handler(MESSAGE_NOTIFICATION)
+def send_message_digest(batch):
+    read = Conversation.objects.filter(
+        owner=OuterRef('receiver'), listing=OuterRef('listing'), other_user=OuterRef('sender'),
+        last_read_id__gte=OuterRef('pk'),
+    )
+    unread = list(
+        Message.objects.filter(pk__in=[job.payload['message'] for job in batch]).exclude(Exists(read))
+        .select_related('sender', 'receiver', 'listing')
+        .order_by('timestamp')
+    )
+    if not unread or not unread[0].receiver.email:
+        return
+    receiver = unread[0].receiver
+    notifications = [{
+        'sender_name': message.sender.username,
+        'car_name': f'{message.listing.make} {message.listing.model}',
+        'message_content': message.content,
+        'conversation_url': settings.SITE_URL + reverse('conversation', args=[message.listing_id, message.sender_id]),
+    } for message in unread]
+    senders = {message.sender.username for message in unread}
+    if len(unread) == 1:
+        subject = f"New message from {unread[0].sender.username} on CarHub"
+    elif len(senders) == 1:
+        subject = f"{len(unread)} new messages from {unread[0].sender.username} on CarHub"
+    else:
+        subject = f"{len(unread)} new messages on CarHub"
+
+    # Rendered once for the whole batch
+    context = {'receiver_name': receiver.username, 'notifications': notifications}
+    email = EmailMultiAlternatives(
+        subject, render_to_string('emails/new_message_notification.txt', context),
+        settings.DEFAULT_FROM_EMAIL, [receiver.email],
+    )
+    email.attach_alternative(render_to_string('emails/new_message_notification.html', context), 'text/html')
+    email.send()
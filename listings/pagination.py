@@ -0,0 +1,145 @@
+# File: listings/pagination.py
+
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+# Cursors look like "n[...]" or "p[...]" once decoded. The list holds the ordering
+# values of the row the page boundary sits on, so the next query can start right
+# after it with an indexed range scan instead of an OFFSET.
+NEXT = 'n'
+PREVIOUS = 'p'
+
+NEWEST_FIRST = ('-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _split(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def encode_cursor(obj, direction, ordering=NEWEST_FIRST):
+    values = []
+    for name, _ in _split(ordering):
+        value = getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    payload = json.dumps(values, separators=(',', ':'))
+    return urlsafe_base64_encode(f'{direction}{payload}'.encode())
+
+
+def decode_cursor(token, model, ordering=NEWEST_FIRST):
+    try:
+        raw = force_str(urlsafe_base64_decode(token))
+        direction, values = raw[0], json.loads(raw[1:])
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(ordering):
+            raise InvalidCursor(token)
+        decoded = []
+        for (name, _), value in zip(_split(ordering), values):
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except FieldDoesNotExist:
+                # Annotations (e.g. a search rank) are plain JSON numbers already.
+                pass
+            decoded.append(value)
+        return direction, decoded
+    except (ValueError, TypeError, IndexError, ValidationError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+def _after(ordering, values, direction):
+    """
+    Q object for "rows strictly after `values`" in the given ordering, e.g.
+    created_at < c OR (created_at = c AND id < i) for newest-first.
+    """
+    condition = Q()
+    fields = _split(ordering)
+    for position, (name, descending) in enumerate(fields):
+        lookup = 'lt' if descending == (direction == NEXT) else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[position]})
+        for prior_position, (prior_name, _) in enumerate(fields[:position]):
+            term &= Q(**{prior_name: values[prior_position]})
+        condition |= term
+    return condition
+
+
+class KeysetPage:
+    """
+    One page of a queryset walked in a fixed ordering, newest-first by default.
+    """
+    def __init__(self, object_list, has_next, has_previous, ordering=NEWEST_FIRST):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.ordering = ordering
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], NEXT, self.ordering)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], PREVIOUS, self.ordering)
+        return None
+
+
+def _keyset_query(queryset, cursor, per_page, ordering):
+    """
+    The query for one page (fetching one row more to tell if another page
+    follows) and a function that turns its rows into the KeysetPage.
+    An unknown or tampered cursor simply falls back to the first page.
+    """
+    ordering = tuple(ordering)
+    direction, values = NEXT, None
+    if cursor:
+        try:
+            direction, values = decode_cursor(cursor, queryset.model, ordering)
+        except InvalidCursor:
+            direction = NEXT
+
+    if values is None:
+        def first_page(rows):
+            return KeysetPage(rows[:per_page], len(rows) > per_page, False, ordering)
+        return queryset.order_by(*ordering)[:per_page + 1], first_page
+
+    if direction == NEXT:
+        def next_page(rows):
+            return KeysetPage(rows[:per_page], len(rows) > per_page, True, ordering)
+        return queryset.filter(_after(ordering, values, NEXT)).order_by(*ordering)[:per_page + 1], next_page
+
+    # Walking backwards: scan in the reverse order from the cursor, then flip the
+    # rows so the page is still rendered in the normal order.
+    reversed_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+    def previous_page(rows):
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        return KeysetPage(rows, True, has_previous, ordering)
+    return queryset.filter(_after(ordering, values, PREVIOUS)).order_by(*reversed_ordering)[:per_page + 1], previous_page
+
+
+def paginate_keyset(queryset, cursor=None, per_page=12, ordering=NEWEST_FIRST):
+    """Returns a KeysetPage of `queryset` starting after `cursor`."""
+    query, make_page = _keyset_query(queryset, cursor, per_page, ordering)
+    return make_page(list(query))
+
+
+async def apaginate_keyset(queryset, cursor=None, per_page=12, ordering=NEWEST_FIRST):
+    """paginate_keyset() for async views."""
+    query, make_page = _keyset_query(queryset, cursor, per_page, ordering)
+    return make_page([row async for row in query])
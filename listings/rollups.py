@@ -0,0 +1,126 @@
+# File: listings/rollups.py
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CarListing, DailyRollup, ListingRollup, Review
+
+# Summary tables behind the admin dashboard, so its numbers never scan the
+# listing, user or review tables:
+#   ListingRollup - listings per (make, status, city), a few thousand rows at most
+#   DailyRollup   - signups, listings posted and reviews per day, for the totals
+#                   and the time-series chart
+# Signals adjust them as rows are saved and deleted. Writes that skip signals
+# (bulk_create, queryset updates) are caught up by the rebuild_rollups command.
+#
+# A daily row counts the rows created that day that still exist, so deleting
+# a user, listing or review takes it off the day it was created.
+DAILY_SOURCES = {
+    'signups': (User, 'date_joined'),
+    'listings': (CarListing, 'created_at'),
+    'reviews': (Review, 'timestamp'),
+}
+
+
+def _bump(model, delta, **key):
+    if not delta:
+        return
+    rows = model.objects.filter(**key)
+    if delta < 0:
+        rows.filter(count__gte=-delta).update(count=F('count') + delta)
+        return
+    if rows.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(count=F('count') + delta)
+
+
+def listing_key(listing):
+    return listing.make, listing.status, listing.location_city
+
+
+def move_listing(old_key=None, new_key=None):
+    """Moves one listing between (make, status, city) rows; either key may be None."""
+    if old_key == new_key:
+        return
+    for key, delta in ((old_key, -1), (new_key, 1)):
+        if key is not None:
+            make, status, city = key
+            _bump(ListingRollup, delta, make=make, status=status, location_city=city)
+
+
+def count_day(metric, when, delta=1):
+    _bump(DailyRollup, delta, metric=metric, day=timezone.localdate(when))
+
+
+@transaction.atomic
+def rebuild():
+    """
+    Recomputes every rollup from the source tables. Returns the number of
+    rollup rows written.
+    """
+    ListingRollup.objects.all().delete()
+    DailyRollup.objects.all().delete()
+    listing_rows = (
+        CarListing.objects.values_list('make', 'status', 'location_city')
+        .annotate(count=Count('id')).order_by()
+    )
+    ListingRollup.objects.bulk_create([
+        ListingRollup(make=make, status=status, location_city=city, count=count)
+        for make, status, city, count in listing_rows
+    ], batch_size=500)
+    written = ListingRollup.objects.count()
+    for metric, (model, field) in DAILY_SOURCES.items():
+        days = model.objects.annotate(day=TruncDate(field)).values_list('day').annotate(count=Count('pk')).order_by()
+        rollups = DailyRollup.objects.bulk_create(
+            [DailyRollup(metric=metric, day=day, count=count) for day, count in days], batch_size=500,
+        )
+        written += len(rollups)
+    return written
+
+
+def dashboard(days=30):
+    """Everything the admin dashboard shows, read from the rollups in three queries."""
+    by_make, by_status, by_city = Counter(), Counter(), Counter()
+    for make, status, city, count in ListingRollup.objects.filter(count__gt=0).values_list(
+            'make', 'status', 'location_city', 'count'):
+        by_make[make] += count
+        by_status[status] += count
+        by_city[city] += count
+    totals = dict(DailyRollup.objects.values_list('metric').annotate(total=Sum('count')).order_by())
+
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    series = defaultdict(dict)
+    for metric, day, count in DailyRollup.objects.filter(day__gte=start).values_list('metric', 'day', 'count'):
+        series[metric][day] = count
+    timeline_days = [start + timedelta(days=offset) for offset in range(days)]
+
+    statuses = dict(CarListing._meta.get_field('status').choices)
+    return {
+        'total_users': totals.get('signups', 0),
+        'total_listings': sum(by_status.values()),
+        'active_listings': by_status['ACTIVE'],
+        'sold_listings': by_status['SOLD'],
+        'brand_labels': [make for make, _ in by_make.most_common()],
+        'brand_data': [count for _, count in by_make.most_common()],
+        'status_labels': [statuses.get(status, status.replace('_', ' ').title()) for status, _ in by_status.most_common()],
+        'status_data': [count for _, count in by_status.most_common()],
+        'city_labels': [city for city, _ in by_city.most_common()],
+        'city_data': [count for _, count in by_city.most_common()],
+        'timeline_labels': [day.strftime('%d %b') for day in timeline_days],
+        'timeline_data': {
+            label: [series[metric].get(day, 0) for day in timeline_days]
+            for metric, label in DailyRollup.METRIC_CHOICES
+        },
+    }
@@ -0,0 +1,143 @@
+# File: listings/search.py
+
+import re
+from difflib import get_close_matches
+
+from django.db import connection, models
+from django.db.models import Q
+
+from .pagination import NEWEST_FIRST
+
+# The search index is an SQLite FTS5 table keyed by CarListing.id (its rowid).
+# It is created by migration 0006 and kept in sync by listings/signals.py.
+# On any other database we fall back to the old icontains search.
+FTS_TABLE = 'listings_carlisting_fts'
+VOCAB_TABLE = 'listings_carlisting_fts_vocab'
+INDEXED_FIELDS = ('make', 'model', 'description', 'location_city')
+
+# bm25() weights, in INDEXED_FIELDS order: a hit on the make or model counts
+# for much more than a hit somewhere in the description.
+RANK_FUNCTION = 'bm25(10.0, 10.0, 1.0, 4.0)'
+
+# Search results are ordered by relevance first, then newest first.
+RANKED_ORDERING = ('search_rank', '-created_at', '-id')
+
+# Typo tolerance: how many near-miss terms to try per word, and how similar they must be.
+FUZZY_MAX_CANDIDATES = 3
+FUZZY_CUTOFF = 0.75
+FUZZY_MIN_LENGTH = 3
+FUZZY_SCAN_LIMIT = 5000
+
+
+class SearchDocumentField(models.TextField):
+    """
+    The hidden FTS5 column that has the same name as the table. Only
+    used as the left-hand side of a MATCH.
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def index_listing(listing):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [listing.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(INDEXED_FIELDS)}) VALUES (%s, %s, %s, %s, %s)',
+            [listing.pk] + [getattr(listing, field) for field in INDEXED_FIELDS],
+        )
+
+
+def remove_listing(pk):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index():
+    """
+    Re-indexes every listing from scratch. Needed after bulk updates that
+    bypass model signals, e.g. QuerySet.update().
+    """
+    if not is_available():
+        return 0
+    columns = ', '.join(INDEXED_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', %s)", [RANK_FUNCTION])
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, {columns}) SELECT id, {columns} FROM listings_carlisting')
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _similar_terms(cursor, word):
+    # fts5vocab can range-scan its terms, so only words sharing the first
+    # letter are compared. A typo in the very first letter is not corrected.
+    start = word[0]
+    cursor.execute(
+        f'SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT %s',
+        [start, chr(ord(start) + 1), FUZZY_SCAN_LIMIT],
+    )
+    terms = [row[0] for row in cursor.fetchall()]
+    return get_close_matches(word, terms, n=FUZZY_MAX_CANDIDATES, cutoff=FUZZY_CUTOFF)
+
+
+def build_match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix,
+    or else as one of its closest spellings in the index.
+    Returns None if the query has no searchable words.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    groups = []
+    with connection.cursor() as cursor:
+        for word in words:
+            prefix = f'"{word}"*'
+            cursor.execute(
+                f'SELECT 1 FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1',
+                [word, word + '\uffff'],
+            )
+            if cursor.fetchone() or len(word) < FUZZY_MIN_LENGTH:
+                groups.append(prefix)
+                continue
+            alternatives = [prefix] + [f'"{term}"' for term in _similar_terms(cursor, word)]
+            groups.append(f'({" OR ".join(alternatives)})' if len(alternatives) > 1 else prefix)
+    return ' AND '.join(groups)
+
+
+def search_listings(queryset, query):
+    """
+    Narrows a CarListing queryset to the listings matching `query`.
+    Returns (queryset, ordering); with FTS5 the queryset carries a
+    `search_rank` annotation and the ordering is by relevance.
+    """
+    if not is_available():
+        queryset = queryset.filter(
+            Q(make__icontains=query) | Q(model__icontains=query) |
+            Q(description__icontains=query) | Q(location_city__icontains=query)
+        )
+        return queryset, NEWEST_FIRST
+
+    expression = build_match_expression(query)
+    if expression is None:
+        return queryset, NEWEST_FIRST
+    queryset = queryset.filter(search_entry__document__match=expression).annotate(
+        search_rank=models.F('search_entry__rank')
+    )
+    return queryset, RANKED_ORDERING
@@ -1,9 +1,13 @@
 # File: listings/signals.py
 
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, m2m_changed
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, CarListing, CarImage, Message, Conversation, Review, SellerRating
+from . import activity, compare, facets, images, live, metrics, notifications, rollups, search, unread, wishlist
 
 # This function will run every time a new User object is created
 @receiver(post_save, sender=User)
@@ -17,3 +21,323 @@ def save_profile(sender, instance, **kwargs):
     # Ensure the user has a profile before trying to save it
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+# --- Keep the full-text search index in sync with CarListing ---
+@receiver(post_save, sender=CarListing)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch e.g. 'views' or 'status' don't change the indexed text
+    if update_fields and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_listing(instance)
+
+@receiver(post_delete, sender=CarListing)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_listing(instance.pk)
+
+# --- Record who bought a car when it is marked as sold ---
+@receiver(pre_save, sender=CarListing)
+def record_buyer(sender, instance, **kwargs):
+    if instance.status != 'SOLD' or instance.buyer_id or instance.pk is None:
+        return
+    # The buyer is the other party of the latest message about the listing
+    last = (
+        Message.objects.filter(listing_id=instance.pk)
+        .order_by('-timestamp')
+        .values_list('sender_id', 'receiver_id')
+        .first()
+    )
+    if last:
+        instance.buyer_id = last[1] if last[0] == instance.seller_id else last[0]
+
+# --- Keep the cached facet counts and the dashboard rollups in step with the listings ---
+FACET_SOURCE_FIELDS = {'make', 'location_city', 'fuel_type', 'transmission', 'year', 'price', 'status'}
+
+@receiver(pre_save, sender=CarListing)
+def remember_listing_keys(sender, instance, update_fields=None, **kwargs):
+    instance._facet_key_before = None
+    instance._rollup_key_before = None
+    instance._status_before = None
+    if instance.pk is None or (update_fields and not set(update_fields) & FACET_SOURCE_FIELDS):
+        return
+    old = CarListing.objects.filter(pk=instance.pk).only(*FACET_SOURCE_FIELDS).first()
+    if old is not None:
+        instance._rollup_key_before = rollups.listing_key(old)
+        instance._status_before = old.status
+        if old.status == 'ACTIVE':
+            instance._facet_key_before = facets.facet_key(old)
+
+@receiver(post_save, sender=CarListing)
+def update_facet_counts(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & FACET_SOURCE_FIELDS:
+        return
+    new_key = facets.facet_key(instance) if instance.status == 'ACTIVE' else None
+    facets.listing_moved(getattr(instance, '_facet_key_before', None), new_key)
+
+@receiver(post_delete, sender=CarListing)
+def remove_from_facet_counts(sender, instance, **kwargs):
+    if instance.status == 'ACTIVE':
+        facets.listing_moved(old_key=facets.facet_key(instance))
+
+@receiver(post_save, sender=CarListing)
+def update_listing_rollups(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        rollups.move_listing(new_key=rollups.listing_key(instance))
+        rollups.count_day('listings', instance.created_at)
+    elif not update_fields or set(update_fields) & FACET_SOURCE_FIELDS:
+        rollups.move_listing(getattr(instance, '_rollup_key_before', None), rollups.listing_key(instance))
+
+@receiver(post_delete, sender=CarListing)
+def remove_from_listing_rollups(sender, instance, **kwargs):
+    rollups.move_listing(old_key=rollups.listing_key(instance))
+    rollups.count_day('listings', instance.created_at, -1)
+
+# --- Cached comparisons show listing fields, so any change retires them ---
+@receiver(post_save, sender=CarListing)
+@receiver(post_delete, sender=CarListing)
+def invalidate_comparisons(sender, instance, **kwargs):
+    compare.invalidate()
+
+# --- Signups and reviews per day for the dashboard rollups ---
+def _daily_metric(model):
+    return next((metric, source) for metric, source in rollups.DAILY_SOURCES.items() if source[0] is model)
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Review)
+def count_new_row(sender, instance, created, **kwargs):
+    if created:
+        metric, (_, field) = _daily_metric(sender)
+        rollups.count_day(metric, getattr(instance, field))
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Review)
+def uncount_deleted_row(sender, instance, **kwargs):
+    metric, (_, field) = _daily_metric(sender)
+    rollups.count_day(metric, getattr(instance, field), -1)
+
+# --- Append to the activity log (see listings/activity.py) ---
+@receiver(post_save, sender=User)
+def log_signup(sender, instance, created, **kwargs):
+    if created:
+        activity.record('signup', actor=instance, timestamp=instance.date_joined)
+
+@receiver(post_save, sender=CarListing)
+def log_listing(sender, instance, created, **kwargs):
+    if created:
+        activity.record('listing_created', actor=instance.seller, listing=instance, timestamp=instance.created_at)
+        return
+    old_status = getattr(instance, '_status_before', None)
+    if old_status and old_status != instance.status:
+        activity.listing_status_changed(instance, old_status)
+
+@receiver(post_save, sender=Review)
+def log_review(sender, instance, created, **kwargs):
+    if created:
+        activity.record('review', actor=instance.reviewer, recipient=instance.seller, listing=instance.listing,
+                        timestamp=instance.timestamp, rating=instance.rating)
+
+@receiver(post_save, sender=Message)
+def log_message(sender, instance, created, **kwargs):
+    if created:
+        activity.record('message', actor=instance.sender, recipient=instance.receiver, listing=instance.listing,
+                        timestamp=instance.timestamp)
+
+# --- Keep each participant's Conversation row up to date as messages arrive ---
+def _touch_conversation(message, owner_id, other_user_id, unread_increment):
+    thread = Conversation.objects.filter(owner_id=owner_id, listing_id=message.listing_id, other_user_id=other_user_id)
+    fields = {'last_message': message, 'last_message_at': message.timestamp}
+    if thread.update(unread_count=F('unread_count') + unread_increment, **fields):
+        return
+    try:
+        with transaction.atomic():
+            Conversation.objects.create(
+                owner_id=owner_id, listing_id=message.listing_id, other_user_id=other_user_id,
+                unread_count=unread_increment, **fields
+            )
+    except IntegrityError:
+        # Another request created the row first
+        thread.update(unread_count=F('unread_count') + unread_increment, **fields)
+
+@receiver(post_save, sender=Message)
+def update_conversations(sender, instance, created, **kwargs):
+    if created:
+        _touch_conversation(instance, instance.sender_id, instance.receiver_id, 0)
+        _touch_conversation(instance, instance.receiver_id, instance.sender_id, 1)
+
+# --- Push new messages to the open conversation pages (see listings/live.py) ---
+@receiver(post_save, sender=Message)
+def push_message(sender, instance, created, **kwargs):
+    if created:
+        live.notify(instance.listing_id, instance.sender_id, instance.receiver_id)
+
+# --- Email the receiver about new messages, from the job queue (see listings/notifications.py) ---
+@receiver(post_save, sender=Message)
+def queue_message_notification(sender, instance, created, **kwargs):
+    if created:
+        notifications.enqueue_message(instance)
+
+# --- Drop the receiver's cached unread count when their inbox changes ---
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_unread_count(sender, instance, **kwargs):
+    unread.invalidate(instance.receiver_id)
+
+# --- Drop the cached wishlist ids of every user whose wishlist changed ---
+@receiver(m2m_changed, sender=CarListing.wishlist.through)
+def invalidate_wishlist(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.wishlist_items was changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            wishlist.invalidate(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        wishlist.invalidate(*pk_set)
+    elif action == 'pre_clear':
+        wishlist.invalidate(*instance.wishlist.values_list('pk', flat=True))
+
+# --- Engagement counters on CarListing (see listings/engagement.py) ---
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, **kwargs):
+    if created:
+        CarListing.objects.filter(pk=instance.listing_id).update(message_count=F('message_count') + 1)
+
+@receiver(post_delete, sender=Message)
+def uncount_message(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, CarListing) or getattr(origin, 'model', None) is CarListing:
+        return  # the messages go with their listing, counter and all
+    CarListing.objects.filter(pk=instance.listing_id, message_count__gt=0).update(message_count=F('message_count') - 1)
+
+def _adjust_wishlist_count(listing_ids, delta):
+    listings = CarListing.objects.filter(pk__in=listing_ids)
+    if delta < 0:
+        listings = listings.filter(wishlist_count__gte=-delta)
+    listings.update(wishlist_count=F('wishlist_count') + delta)
+
+def _pop_removed(instance, default):
+    removed = getattr(instance, '_wishlist_removed', None)
+    if removed is None:
+        return default
+    del instance._wishlist_removed
+    return removed
+
+@receiver(m2m_changed, sender=CarListing.wishlist.through)
+def update_wishlist_count(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse: user.wishlist_items changed and pk_set holds listing ids;
+    # otherwise listing.wishlist changed and pk_set holds user ids.
+    if action == 'pre_remove':
+        # remove() reports every id it was given, wishlisted or not
+        if reverse:
+            rows = sender.objects.filter(user_id=instance.pk, carlisting_id__in=pk_set).values_list('carlisting_id', flat=True)
+        else:
+            rows = sender.objects.filter(carlisting_id=instance.pk, user_id__in=pk_set).values_list('user_id', flat=True)
+        instance._wishlist_removed = set(rows)
+    elif action == 'pre_clear' and reverse:
+        instance._wishlist_removed = set(sender.objects.filter(user_id=instance.pk).values_list('carlisting_id', flat=True))
+    elif action == 'post_add':
+        if reverse:
+            _adjust_wishlist_count(pk_set, 1)
+        else:
+            _adjust_wishlist_count([instance.pk], len(pk_set))
+    elif action == 'post_remove':
+        # listings/wishlist.py sends post_remove alone, with only the deleted rows
+        removed = _pop_removed(instance, pk_set)
+        if reverse:
+            _adjust_wishlist_count(removed, -1)
+        elif removed:
+            _adjust_wishlist_count([instance.pk], -len(removed))
+    elif action == 'post_clear':
+        if reverse:
+            _adjust_wishlist_count(_pop_removed(instance, ()), -1)
+        else:
+            CarListing.objects.filter(pk=instance.pk).update(wishlist_count=0)
+
+# --- Keep each seller's rating totals in step with their reviews ---
+def _adjust_seller_rating(seller_id, rating, sign):
+    SellerRating.objects.get_or_create(seller_id=seller_id)
+    SellerRating.objects.filter(seller_id=seller_id).update(**{
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'stars_{rating}': F(f'stars_{rating}') + sign,
+    })
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._rating_before = None
+    if instance.pk is not None:
+        instance._rating_before = Review.objects.filter(pk=instance.pk).values_list('seller_id', 'rating').first()
+
+@receiver(post_save, sender=Review)
+def update_seller_rating(sender, instance, created, **kwargs):
+    before = getattr(instance, '_rating_before', None)
+    if before == (instance.seller_id, instance.rating):
+        return  # e.g. the seller only added a response
+    if before is not None:
+        _adjust_seller_rating(before[0], before[1], -1)
+    _adjust_seller_rating(instance.seller_id, instance.rating, 1)
+
+@receiver(post_delete, sender=Review)
+def remove_from_seller_rating(sender, instance, **kwargs):
+    _adjust_seller_rating(instance.seller_id, instance.rating, -1)
+
+# --- Make resized renditions of new uploads in the background ---
+@receiver(post_save, sender=CarListing)
+@receiver(post_save, sender=CarImage)
+@receiver(post_save, sender=Profile)
+def process_uploaded_image(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and 'image' not in update_fields:
+        return
+    # Runs before release_replaced_image, so _stored_image is still the name
+    # loaded from the database; other saves (profiles, status changes) skip this
+    changed = created or instance.image.name != getattr(instance, '_stored_image', None)
+    if instance.image and changed:
+        images.schedule(instance.image.name)
+
+# --- Release stored photos when they are replaced or their row is deleted ---
+def _release_image(storage, name):
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+@receiver(post_init, sender=CarListing)
+@receiver(post_init, sender=CarImage)
+@receiver(post_init, sender=Profile)
+def remember_stored_image(sender, instance, **kwargs):
+    # The raw column value as loaded; reading __dict__ keeps .only() querysets
+    # from fetching the deferred column, and new uploads aren't stored yet.
+    value = instance.__dict__.get('image')
+    instance._stored_image = value if isinstance(value, str) else None
+
+@receiver(pre_save, sender=CarListing)
+@receiver(pre_save, sender=CarImage)
+@receiver(pre_save, sender=Profile)
+def remember_image_upload(sender, instance, **kwargs):
+    # Whether this save writes a new upload, which adds a reference to its blob;
+    # receivers run before the field stores the file
+    instance._uploading_image = bool(instance.image) and not instance.image._committed
+
+@receiver(post_save, sender=CarListing)
+@receiver(post_save, sender=CarImage)
+@receiver(post_save, sender=Profile)
+def release_replaced_image(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'image' not in update_fields:
+        return
+    before, now = getattr(instance, '_stored_image', None), instance.image.name
+    if before != now:
+        _release_image(instance.image.storage, before)
+        instance._stored_image = now
+    elif getattr(instance, '_uploading_image', False):
+        # The same content was uploaded again: the field still holds one
+        # reference, so let go of the one the upload added
+        _release_image(instance.image.storage, now)
+
+@receiver(post_delete, sender=CarListing)
+@receiver(post_delete, sender=CarImage)
+@receiver(post_delete, sender=Profile)
+def release_deleted_image(sender, instance, **kwargs):
+    _release_image(instance.image.storage, instance.image.name)
+
+# --- Count and time every query for the request metrics (see listings/metrics.py) ---
+# On the connection itself rather than around each request, so queries that async
+# views run in sync_to_async threads are counted as well.
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Django reconnects the same wrapper object, so only add the timer once
+    if metrics.query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.query_timer)
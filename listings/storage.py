@@ -0,0 +1,119 @@
+# File: listings/storage.py
+
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# Uploaded car and profile photos are stored by content: a file's name is the
+# SHA-256 of its bytes, so the same photo uploaded ten times is kept on disk once.
+# A MediaBlob row counts the model fields pointing at each file, and the file is
+# only removed when the last of them lets go of it.
+BLOB_DIR = 'blobs'
+
+
+def content_digest(content):
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+def blob_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files after their content and keeps a
+    reference count per file in MediaBlob. delete() drops one reference.
+    """
+
+    def store(self, name, content):
+        """
+        Writes the content under its content-derived name unless that file
+        exists already, and returns the name. No reference is recorded.
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = blob_name(content_digest(content), name)
+        if not self.exists(name):
+            stored = self._save(name, content)
+            if stored != name:
+                # The same content was written concurrently; keep that copy
+                super().delete(stored)
+        return name
+
+    def save(self, name, content, max_length=None):
+        name = self.store(name, content)
+        if not self.add_reference(name, content.size) and not self.exists(name):
+            # The last reference was released while we were writing
+            self.store(name, content)
+        return name
+
+    def add_reference(self, name, size=0, count=1):
+        """
+        Adds `count` references to a stored file. Returns False if the file
+        wasn't tracked yet, in which case its row is created.
+        """
+        from .models import MediaBlob
+        blobs = MediaBlob.objects.filter(name=name)
+        if blobs.update(references=F('references') + count):
+            return True
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, references=count)
+            return False
+        except IntegrityError:
+            # Another upload of the same content got there first
+            blobs.update(references=F('references') + count)
+            return True
+
+    def add_references(self, sizes):
+        """
+        add_reference() for several different stored files, given as
+        {name: size}, in two queries: files that aren't tracked yet get a row
+        with no references, then every row gets one more.
+        """
+        from .models import MediaBlob
+        with transaction.atomic():
+            MediaBlob.objects.bulk_create(
+                [MediaBlob(name=name, size=size, references=0) for name, size in sizes.items()],
+                ignore_conflicts=True,
+            )
+            MediaBlob.objects.filter(name__in=list(sizes)).update(references=F('references') + 1)
+
+    def delete(self, name):
+        """
+        Releases one reference, removing the file with the last one. Names
+        that aren't tracked, like field defaults and uploads from before
+        dedupe_media ran, are left alone.
+        """
+        from .models import MediaBlob
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.references > 1:
+                MediaBlob.objects.filter(name=name).update(references=F('references') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+
+_storage = None
+
+
+def media_storage():
+    """The storage used by every uploaded photo field."""
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
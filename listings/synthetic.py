@@ -0,0 +1,240 @@
+# File: listings/synthetic.py
+
+import random
+from collections import defaultdict
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
+
+from . import engagement, facets, rollups, search
+from .models import CarImage, CarListing, Conversation, Message, Profile, Review, SellerRating
+from .storage import media_storage
+
+# A synthetic marketplace for load testing: users, listings, photos, message
+# threads, reviews and wishlists, written with bulk_create in chunks. Rows that
+# signals normally maintain (Conversation, SellerRating, the engagement
+# counters, the dashboard rollups, the search index and the facet cache) are
+# filled in here too, so every page behaves as it would on real data.
+MODELS = {
+    'Tata': ('Nexon', 'Harrier', 'Safari', 'Punch', 'Altroz'),
+    'Honda': ('City', 'Amaze', 'Elevate'),
+    'Maruti': ('Swift', 'Baleno', 'Brezza', 'Dzire', 'Ertiga'),
+    'Hyundai': ('Creta', 'Venue', 'i20', 'Verna'),
+    'Mahindra': ('XUV700', 'Thar', 'Scorpio'),
+    'Toyota': ('Innova', 'Fortuner', 'Glanza'),
+    'Volkswagen': ('Taigun', 'Virtus'),
+    'Kia': ('Seltos', 'Sonet'),
+}
+CITIES = ('Pune', 'Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Kolkata', 'Ahmedabad', 'Jaipur', 'Kochi')
+FUEL_TYPES = ('Petrol', 'Petrol', 'Diesel', 'CNG', 'Electric')
+WORDS = ('single owner', 'well maintained', 'full service history', 'new tyres', 'accident free',
+         'sunroof', 'touchscreen', 'insurance valid', 'garage kept', 'low mileage')
+STATUS_WEIGHTS = (('ACTIVE', 85), ('SOLD', 10), ('PENDING_APPROVAL', 5))
+RATING_WEIGHTS = (1, 2, 6, 18, 30)  # for 1 to 5 stars
+PHOTO_COLORS = ((180, 30, 30), (30, 60, 160), (220, 220, 220), (40, 40, 40), (200, 160, 30))
+
+
+def _chunks(count, size):
+    for start in range(0, count, size):
+        yield start, min(count, start + size)
+
+
+def _store_photos():
+    """A handful of distinct photos; content-addressed storage keeps one copy of each."""
+    storage = media_storage()
+    names = []
+    for index, color in enumerate(PHOTO_COLORS):
+        image = Image.new('RGB', (1280, 800), color)
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=70)
+        names.append(storage.save(f'car_images/synthetic_{index}.jpg', ContentFile(buffer.getvalue())))
+    return names
+
+
+class MarketplaceGenerator:
+    def __init__(self, users, listings, images_per_listing, messages, reviews, wishlist_items,
+                 chunk_size=2000, seed=None, progress=None):
+        self.counts = {
+            'users': users, 'listings': listings, 'images': listings * images_per_listing,
+            'messages': messages, 'reviews': reviews, 'wishlist_items': wishlist_items,
+        }
+        self.images_per_listing = images_per_listing
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        self.progress = progress or (lambda label, done, total: None)
+
+    def run(self):
+        prefix = f'synthetic{self.rng.randrange(16 ** 6):06x}_'
+        self.user_ids = self._users(prefix)
+        self.photos = _store_photos()
+        self.photo_uses = defaultdict(int)
+        self.active, self.sold = [], []
+        self._listings()
+        self._images()
+        self._messages()
+        self._reviews()
+        self._wishlists()
+        # Saving each photo took one reference already
+        storage = media_storage()
+        for name in self.photos:
+            uses = self.photo_uses[name]
+            if uses:
+                storage.add_reference(name, count=uses - 1)
+            else:
+                storage.delete(name)
+        engagement.reconcile(chunk_size=self.chunk_size)
+        rollups.rebuild()
+        search.rebuild_index()
+        cache.delete(facets.CACHE_KEY)
+        return self.counts
+
+    def _users(self, prefix):
+        password = make_password('synthetic')
+        ids = []
+        for start, end in _chunks(self.counts['users'], self.chunk_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+                    for i in range(start, end)
+                ])
+                Profile.objects.bulk_create([Profile(user=user) for user in users])
+            ids.extend(user.pk for user in users)
+            self.progress('users', end, self.counts['users'])
+        return ids
+
+    def _listing(self, i):
+        rng = self.rng
+        make = rng.choice(list(MODELS))
+        status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+        seller_id = rng.choice(self.user_ids)
+        buyer_id = None
+        if status == 'SOLD':
+            buyer_id = rng.choice(self.user_ids)
+            if buyer_id == seller_id:
+                status, buyer_id = 'ACTIVE', None
+        year = rng.randint(2008, 2024)
+        photo = rng.choice(self.photos)
+        self.photo_uses[photo] += 1
+        return CarListing(
+            seller_id=seller_id, buyer_id=buyer_id, make=make, model=rng.choice(MODELS[make]),
+            year=year, price=rng.randrange(150000, 4500000, 5000), kms_driven=rng.randrange(0, 180000, 500),
+            image=photo, mileage=rng.randint(9, 28), transmission=rng.choice(('Manual', 'Automatic')),
+            fuel_type=rng.choice(FUEL_TYPES), noc_available=rng.random() < 0.3,
+            description=f"{year} model, " + ', '.join(rng.sample(WORDS, 3)) + '.',
+            location_city=rng.choice(CITIES), status=status, views=rng.randint(0, 2000),
+        )
+
+    def _listings(self):
+        for start, end in _chunks(self.counts['listings'], self.chunk_size):
+            with transaction.atomic():
+                listings = CarListing.objects.bulk_create([self._listing(i) for i in range(start, end)])
+            for listing in listings:
+                if listing.status == 'ACTIVE':
+                    self.active.append((listing.pk, listing.seller_id))
+                elif listing.status == 'SOLD':
+                    self.sold.append((listing.pk, listing.seller_id, listing.buyer_id))
+            self.progress('listings', end, self.counts['listings'])
+
+    def _images(self):
+        total = self.counts['images']
+        listing_ids = [pk for pk, _ in self.active] + [pk for pk, _, _ in self.sold]
+        batch, done = [], 0
+        for listing_id in listing_ids:
+            for _ in range(self.images_per_listing):
+                photo = self.rng.choice(self.photos)
+                self.photo_uses[photo] += 1
+                batch.append(CarImage(listing_id=listing_id, image=photo))
+            if len(batch) >= self.chunk_size:
+                CarImage.objects.bulk_create(batch)
+                done += len(batch)
+                batch = []
+                self.progress('images', done, total)
+        CarImage.objects.bulk_create(batch)
+        self.counts['images'] = done + len(batch)
+        self.progress('images', self.counts['images'], self.counts['images'])
+
+    @transaction.atomic
+    def _flush_threads(self, threads):
+        # bulk_create sets the pk and timestamp on the objects themselves
+        messages = [message for thread, _ in threads for message in thread]
+        Message.objects.bulk_create(messages)
+        conversations = []
+        for thread, last_unread in threads:
+            last = thread[-1]
+            for owner_id, other_id in ((last.sender_id, last.receiver_id), (last.receiver_id, last.sender_id)):
+                # Everyone has read the whole thread, except maybe the receiver of its last message
+                unread = int(last_unread and owner_id == last.receiver_id)
+                read_up_to = thread[-1 - unread].pk if len(thread) > unread else 0
+                conversations.append(Conversation(
+                    owner_id=owner_id, other_user_id=other_id, listing_id=last.listing_id,
+                    last_message=last, last_message_at=last.timestamp, unread_count=unread, last_read_id=read_up_to,
+                ))
+        Conversation.objects.bulk_create(conversations)
+        return len(messages)
+
+    def _messages(self):
+        total = self.counts['messages']
+        if not self.active or len(self.user_ids) < 2:
+            self.counts['messages'] = 0
+            return
+        seen, threads, pending, done = set(), [], 0, 0
+        while done + pending < total and len(seen) < len(self.active) * (len(self.user_ids) - 1):
+            listing_id, seller_id = self.rng.choice(self.active)
+            buyer_id = self.rng.choice(self.user_ids)
+            if buyer_id == seller_id or (listing_id, buyer_id) in seen:
+                continue
+            seen.add((listing_id, buyer_id))
+            length = min(self.rng.randint(1, 8), total - done - pending)
+            thread = []
+            for i in range(length):
+                sender, receiver = (buyer_id, seller_id) if i % 2 == 0 else (seller_id, buyer_id)
+                thread.append(Message(sender_id=sender, receiver_id=receiver, listing_id=listing_id,
+                                      content=f"Message {i + 1} about this car."))
+            threads.append((thread, self.rng.random() >= 0.5))
+            pending += length
+            if pending >= self.chunk_size:
+                done += self._flush_threads(threads)
+                threads, pending = [], 0
+                self.progress('messages', done, total)
+        done += self._flush_threads(threads)
+        self.counts['messages'] = done
+        self.progress('messages', done, total)
+
+    def _reviews(self):
+        rng = self.rng
+        candidates = rng.sample(self.sold, min(self.counts['reviews'], len(self.sold)))
+        totals = defaultdict(lambda: defaultdict(int))
+        for start, end in _chunks(len(candidates), self.chunk_size):
+            reviews = []
+            for listing_id, seller_id, buyer_id in candidates[start:end]:
+                rating = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+                reviews.append(Review(seller_id=seller_id, reviewer_id=buyer_id, listing_id=listing_id,
+                                      rating=rating, comment=f"{rating} stars. " + rng.choice(WORDS).capitalize() + '.'))
+                totals[seller_id]['review_count'] += 1
+                totals[seller_id]['rating_sum'] += rating
+                totals[seller_id][f'stars_{rating}'] += 1
+            Review.objects.bulk_create(reviews)
+            self.progress('reviews', end, len(candidates))
+        SellerRating.objects.bulk_create(
+            [SellerRating(seller_id=seller_id, **fields) for seller_id, fields in totals.items()],
+            batch_size=self.chunk_size,
+        )
+        self.counts['reviews'] = len(candidates)
+
+    def _wishlists(self):
+        Wishlist = CarListing.wishlist.through
+        total = self.counts['wishlist_items']
+        if not self.active:
+            self.counts['wishlist_items'] = 0
+            return
+        for start, end in _chunks(total, self.chunk_size):
+            Wishlist.objects.bulk_create([
+                Wishlist(carlisting_id=self.rng.choice(self.active)[0], user_id=self.rng.choice(self.user_ids))
+                for _ in range(start, end)
+            ], ignore_conflicts=True)
+            self.progress('wishlist items', end, total)
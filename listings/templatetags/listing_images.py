@@ -0,0 +1,45 @@
+# File: listings/templatetags/listing_images.py
+
+from django import template
+from django.core.files.storage import default_storage
+
+from listings import images
+
+register = template.Library()
+
+
+def _srcset(paths):
+    return ', '.join(f'{default_storage.url(path)} {width}w' for width, path in sorted(paths.items(), key=lambda item: int(item[0])))
+
+
+@register.inclusion_tag('partials/responsive_image.html', takes_context=True)
+def responsive_image(context, image, alt='', css_class='',
+                     sizes='(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw'):
+    """
+    {% responsive_image car.image alt="..." css_class="h-56 w-full object-cover" %}
+
+    Renders a <picture> with WebP/JPEG srcsets and a blurred placeholder once
+    listings/images.py has processed the upload, or the original file until then.
+    Pages of cards pass `image_renditions` (images.listing_renditions) in their
+    context so the whole page is looked up at once.
+    """
+    loaded = context.get('image_renditions') or {}
+    tag_context = {'alt': alt, 'css_class': css_class, 'sizes': sizes, 'src': None}
+    if not image:
+        return tag_context
+    processed = loaded[image.name] if image.name in loaded else images.get_renditions(image.name)
+    if processed is None:
+        tag_context['src'] = image.url
+        return tag_context
+    jpeg = processed['renditions'].get('jpeg', {})
+    # The middle size is the fallback for browsers without srcset support
+    widths = sorted(jpeg, key=int)
+    tag_context.update({
+        'src': default_storage.url(jpeg[widths[len(widths) // 2]]),
+        'webp_srcset': _srcset(processed['renditions'].get('webp', {})),
+        'jpeg_srcset': _srcset(jpeg),
+        'placeholder': processed['placeholder'],
+        'width': processed['width'],
+        'height': processed['height'],
+    })
+    return tag_context
@@ -1,3 +1,1770 @@
-from django.test import TestCase
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import combinations
+from statistics import median
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    activity, benchmark, compare, conversations, engagement, facets, images, jobs, live, media_gc, metrics, rollups,
+    search, unread, view_counter, wishlist,
+)
+from . import urls as listing_urls
+from .models import (
+    LISTING_STATUS_CHOICES, ActivityEvent, CarImage, CarListing, Conversation, DailyRollup, Job, ListingRollup,
+    ListingViewer, MediaBlob, Message, PendingView, ProcessedImage, Profile, Review, SellerRating,
+)
+from .synthetic import MarketplaceGenerator
+
+
+def make_listing(seller, **overrides):
+    fields = {
+        'make': 'Tata', 'model': 'Nexon', 'year': 2021, 'price': 900000,
+        'mileage': 17, 'transmission': 'Manual', 'fuel_type': 'Petrol',
+        'description': 'Well maintained, single owner.', 'location_city': 'Pune',
+        'status': 'ACTIVE',
+    }
+    fields.update(overrides)
+    return CarListing.objects.create(seller=seller, **fields)
+
+
+# Buffered listing views are written by the tests that ask for it, not by the
+# flush timer firing in the middle of some later test
+_view_flush_interval = override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+
+
+def setUpModule():
+    _view_flush_interval.enable()
+
+
+def tearDownModule():
+    view_counter.reset()
+    _view_flush_interval.disable()
+
+
+# Every GET parameter car_list_view turns into a WHERE clause.
+CAR_LIST_FILTERS = {
+    'q': 'Nex',
+    'make': 'Tata',
+    'location_city': 'Pune',
+    'year': '2021',
+    'transmission': 'Manual',
+    'fuel_type': 'Petrol',
+    'min_price': '500000',
+    'max_price': '1500000',
+}
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+@override_settings(CAR_LIST_PAGE_SIZE=1)
+class CarListQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every CarListing query car_list_view issues,
+    for every combination of filters, and fails on a full table scan.
+    """
+    table = CarListing._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        make_listing(seller)
+        make_listing(seller)
+        make_listing(seller, make='Honda', model='City', location_city='Mumbai', status='SOLD')
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_no_full_scan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            if step.split(' ')[:2] == ['SCAN', self.table] and 'INDEX' not in step:
+                self.fail(f'Full scan of {self.table}:\n{sql}\n' + '\n'.join(plan))
+
+    def explain_request(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('car-list'), params)
+        self.assertEqual(response.status_code, 200)
+        listing_queries = [q['sql'] for q in ctx.captured_queries if f'"{self.table}"' in q['sql']]
+        self.assertTrue(listing_queries)
+        for sql in listing_queries:
+            # captured SQL has its parameters already inlined
+            self.assert_no_full_scan(sql, [])
+        return response
+
+    def test_every_filter_combination_uses_an_index(self):
+        names = list(CAR_LIST_FILTERS)
+        for size in range(len(names) + 1):
+            for combo in combinations(names, size):
+                params = {name: CAR_LIST_FILTERS[name] for name in combo}
+                with self.subTest(filters=combo):
+                    response = self.explain_request(params)
+                    next_url = response.context['next_page_url']
+                    if next_url:
+                        # The keyset range for the following page (and back again).
+                        response = self.client.get(next_url)
+                        self.explain_request({**params, 'cursor': response.context['page'].previous_cursor or ''})
+                        self.explain_request({**params, 'cursor': next_url.split('cursor=')[-1]})
+
+    def test_landing_page_uses_an_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('landing-page'))
+        for query in ctx.captured_queries:
+            if f'"{self.table}"' in query['sql']:
+                self.assert_no_full_scan(query['sql'], [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 search backend is SQLite only')
+class ListingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.nexon = make_listing(seller, description='Sunroof, alloy wheels.')
+        cls.harrier = make_listing(seller, model='Harrier', description='Top model, Nexon-like styling.', location_city='Mumbai')
+        cls.city = make_listing(seller, make='Honda', model='City', location_city='Hyderabad')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, q):
+        response = self.client.get(reverse('car-list'), {'q': q})
+        return [car.pk for car in response.context['listings']]
+
+    def test_prefix_and_ranking(self):
+        # A hit on the model outranks a hit in the description.
+        self.assertEqual(self.search('nex'), [self.nexon.pk, self.harrier.pk])
+
+    def test_searches_description_and_city(self):
+        self.assertEqual(self.search('sunroof'), [self.nexon.pk])
+        self.assertEqual(self.search('hyderabad'), [self.city.pk])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.search('harier'), [self.harrier.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.city.model = 'Amaze'
+        self.city.save()
+        self.assertEqual(self.search('amaze'), [self.city.pk])
+        self.city.delete()
+        self.assertEqual(self.search('amaze'), [])
+
+
+class FacetCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.nexon = make_listing(cls.seller)
+        make_listing(cls.seller, model='Harrier', fuel_type='Diesel', price=1800000)
+        make_listing(cls.seller, make='Honda', model='City', location_city='Mumbai', transmission='Automatic')
+        make_listing(cls.seller, make='Honda', model='Amaze', status='PENDING_APPROVAL')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_follow_the_other_filters(self):
+        counts = facets.facet_counts({'make': 'Tata'})
+        # the make facet ignores its own filter, every other facet honours it
+        self.assertEqual(counts['make'], {'Tata': 2, 'Honda': 1})
+        self.assertEqual(counts['fuel_type'], {'Petrol': 1, 'Diesel': 1})
+        self.assertEqual(counts['location_city'], {'Pune': 2})
+        self.assertEqual(counts['price_bucket'], {2: 1, 3: 1})
+
+    def test_committed_changes_update_the_cached_cells(self):
+        facets.get_cube()
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.facet_counts({})['make'], {'Tata': 2, 'Honda': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CarListing.objects.get(model='City').save()
+            self.nexon.status = 'SOLD'
+            self.nexon.save()
+            # Counted in the same cell the Nexon was in
+            make_listing(self.seller, model='Punch')
+            CarListing.objects.get(model='City').delete()
+        with self.assertNumQueries(0):
+            cube = facets.get_cube()
+        self.assertEqual(cube, facets._build_cube())
+        self.assertEqual(facets.facet_counts({}, cube)['make'], {'Tata': 2})
+
+    def test_a_new_cell_or_a_missing_key_rebuilds_the_cube(self):
+        facets.get_cube()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_listing(self.seller, make='Mahindra', model='Thar')
+        self.assertIsNone(cache.get(facets.CACHE_KEY))
+        with self.assertNumQueries(1):
+            self.assertEqual(facets.facet_counts({})['make'], {'Tata': 2, 'Honda': 1, 'Mahindra': 1})
+
+        generation, keys = cache.get(facets.CACHE_KEY)
+        cache.delete(facets._cell_key(generation, facets.facet_key(self.nexon)))
+        with self.assertNumQueries(1):
+            cube = facets.get_cube()
+        self.assertEqual(cube, facets._build_cube())
+
+    def test_rolled_back_changes_leave_the_cube_alone(self):
+        cube = facets.get_cube()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                make_listing(self.seller, model='Punch')
+                self.nexon.delete()
+                transaction.set_rollback(True)
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.get_cube(), cube)
+        self.assertEqual(facets._build_cube(), cube)
+
+    def test_filter_form_shows_counts(self):
+        response = self.client.get(reverse('car-list'), {'fuel_type': 'Petrol'})
+        self.assertEqual(
+            response.context['filter_form'].fields['make'].choices,
+            [('', 'Any'), ('Honda', 'Honda (1)'), ('Tata', 'Tata (1)')],
+        )
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+        cls.other_car = make_listing(cls.seller, model='Harrier')
+
+    def setUp(self):
+        cache.clear()
+        view_counter.reset()
+
+    def test_detail_view_buffers_and_dedups(self):
+        self.client.force_login(self.buyer)
+        url = reverse('car-detail', args=[self.car.pk])
+        self.client.get(url)
+        # a repeat view inside the window is not counted, and nothing is written yet
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(view_counter.pending_views(self.car.pk), 1)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.views, 0)
+
+    def test_seller_views_are_not_counted(self):
+        self.client.force_login(self.seller)
+        self.client.get(reverse('car-detail', args=[self.car.pk]))
+        self.assertEqual(view_counter.pending_views(self.car.pk), 0)
+
+    def test_flush_batches_updates(self):
+        for user_id in range(1, 4):
+            view_counter.record_view(self.car.pk, user_id)
+        view_counter.record_view(self.other_car.pk, 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(view_counter.flush()[0], 4)
+        # one UPDATE per distinct increment
+        self.assertEqual(len([q for q in ctx.captured_queries if 'SET "views"' in q['sql']]), 2)
+        self.assertEqual(
+            dict(CarListing.objects.values_list('model', 'views')),
+            {'Nexon': 3, 'Harrier': 1},
+        )
+        self.assertFalse(PendingView.objects.exists())
+
+    def test_command_flushes_views_left_by_another_process(self):
+        view_counter.record_view(self.car.pk, self.buyer.pk)
+        # The process that recorded the view stops before its timer fires
+        view_counter.reset()
+        out = StringIO()
+        call_command('flush_view_counts', stdout=out)
+        self.assertIn('Wrote 1 view(s), 1 new viewer(s).', out.getvalue())
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.views, self.car.unique_viewers), (1, 1))
+        self.assertEqual(view_counter.pending_views(self.car.pk), 0)
+
+    def test_views_of_deleted_listings_are_dropped(self):
+        view_counter.record_view(self.car.pk, self.buyer.pk)
+        view_counter.record_view(self.other_car.pk, self.buyer.pk)
+        self.other_car.delete()
+        self.assertEqual(view_counter.flush(), (2, 1))
+        self.assertFalse(PendingView.objects.exists())
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0.3)
+class ViewCounterTimerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        view_counter.reset()
+        self.addCleanup(view_counter.reset)
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.car = make_listing(seller)
+
+    def wait_for_flush(self):
+        # The timer thread runs the flush, so joining it waits for the writes
+        timer = view_counter._timer
+        self.assertIsNotNone(timer)
+        timer.join(5)
+
+    def test_views_are_written_without_further_traffic(self):
+        self.assertTrue(view_counter.record_view(self.car.pk, self.buyer.pk))
+        self.wait_for_flush()
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.views, self.car.unique_viewers), (1, 1))
+
+    def test_a_failed_flush_is_logged_and_retried(self):
+        table = CarListing._meta.db_table
+        view_counter.record_view(self.car.pk, self.buyer.pk)
+        with self.assertLogs('listings.view_counter', 'ERROR') as logs:
+            # The listing table is renamed away for the first try
+            with connection.schema_editor() as editor:
+                editor.alter_db_table(CarListing, table, f'{table}_away')
+            try:
+                self.wait_for_flush()
+            finally:
+                with connection.schema_editor() as editor:
+                    editor.alter_db_table(CarListing, f'{table}_away', table)
+        self.assertIn('Could not write the buffered listing views', logs.output[0])
+        self.assertEqual(view_counter.pending_views(self.car.pk), 1)
+        self.wait_for_flush()
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.views, 1)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass12345') for i in range(3)]
+        cls.car = make_listing(cls.seller)
+
+    def send(self, sender, receiver, content='Is it available?'):
+        return Message.objects.create(sender=sender, receiver=receiver, listing=self.car, content=content)
+
+    def test_threads_track_last_message_and_unread_counts(self):
+        buyer = self.buyers[0]
+        self.send(buyer, self.seller)
+        last = self.send(buyer, self.seller, 'Still there?')
+        thread = Conversation.objects.get(owner=self.seller, other_user=buyer)
+        self.assertEqual((thread.last_message, thread.unread_count), (last, 2))
+        self.assertEqual(Conversation.objects.get(owner=buyer).unread_count, 0)
+
+        self.client.force_login(self.seller)
+        self.client.get(reverse('conversation', args=[self.car.pk, buyer.pk]))
+        thread.refresh_from_db()
+        self.assertEqual(thread.unread_count, 0)
+
+    def test_inbox_query_count_does_not_grow_with_history(self):
+        self.client.force_login(self.seller)
+        self.send(self.buyers[0], self.seller)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('inbox'))
+        for buyer in self.buyers:
+            for _ in range(5):
+                self.send(buyer, self.seller)
+                self.send(self.seller, buyer)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('inbox'))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context['conversation_threads']), 3)
+
+
+@override_settings(CONVERSATION_PAGE_SIZE=30)
+class ConversationHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.other_buyer = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+        make_thread(cls.car, cls.buyer, 70)
+        make_thread(cls.car, cls.other_buyer, 5)
+        cls.thread = list(
+            Message.objects.filter(listing=cls.car).exclude(sender=cls.other_buyer)
+            .exclude(receiver=cls.other_buyer).order_by('id')
+        )
+
+    def setUp(self):
+        self.url = reverse('conversation', args=[self.car.pk, self.buyer.pk])
+        self.client.force_login(self.seller)
+
+    def test_history_is_paged_newest_first_with_a_load_older_cursor(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['conversation_messages'], self.thread[-30:])
+        pages = [self.thread[-60:-30], self.thread[:-60]]
+        url = response.context['load_older_url']
+        for expected in pages:
+            data = self.client.get(url, headers={'accept': 'application/json'}).json()
+            shown = [int(pk) for pk in re.findall(r'data-message-id="(\d+)"', data['html'])]
+            self.assertEqual(shown, [message.pk for message in expected])
+            url = data['load_older_url']
+        self.assertIsNone(url)
+
+    def test_each_page_is_two_index_range_scans(self):
+        table = Message._meta.db_table
+        for cursor in (None, self.client.get(self.url).context['load_older_url'].split('cursor=')[-1]):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(self.url, {'cursor': cursor} if cursor else {})
+            history = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and f'FROM "{table}"' in q['sql']]
+            self.assertEqual(len(history), 2)
+            for sql in history:
+                with connection.cursor() as db:
+                    db.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = ' '.join(row[-1] for row in db.fetchall())
+                self.assertIn('message_thread_idx', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_history_pages_back_and_forth_with_both_cursors(self):
+        newest_first = self.thread[::-1]
+        pages = [conversations.history(self.car.pk, self.seller.pk, self.buyer.pk, per_page=20)]
+        while pages[-1].next_cursor:
+            pages.append(conversations.history(self.car.pk, self.seller.pk, self.buyer.pk, pages[-1].next_cursor, 20))
+        self.assertEqual([page.object_list for page in pages], [newest_first[i:i + 20] for i in range(0, 70, 20)])
+        self.assertFalse(pages[0].has_previous)
+
+        for older, newer in zip(pages[:0:-1], pages[-2::-1]):
+            back = conversations.history(self.car.pk, self.seller.pk, self.buyer.pk, older.previous_cursor, 20)
+            self.assertEqual(back.object_list, newer.object_list)
+            self.assertEqual(back.has_previous, newer is not pages[0])
+            self.assertTrue(back.has_next)
+
+    def test_opening_the_conversation_moves_the_watermark_with_one_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE'))
+        thread = Conversation.objects.get(owner=self.seller, other_user=self.buyer)
+        self.assertEqual((thread.last_read_id, thread.unread_count), (self.thread[-1].pk, 0))
+        self.assertEqual(Conversation.objects.get(owner=self.seller, other_user=self.other_buyer).unread_count, 3)
+
+        # Nothing new since: no write at all
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+
+    def test_a_message_arriving_while_the_page_loads_stays_unread(self):
+        page = conversations.history(self.car.pk, self.seller.pk, self.buyer.pk)
+        Message.objects.create(sender=self.buyer, receiver=self.seller, listing=self.car, content='Still there?')
+        conversations.mark_read(self.car.pk, self.seller.pk, self.buyer.pk, page.object_list[0])
+        thread = Conversation.objects.get(owner=self.seller, other_user=self.buyer)
+        self.assertEqual((thread.last_read_id, thread.unread_count), (self.thread[-1].pk, 1))
+        self.assertEqual(unread.get_unread_count(self.seller.pk), 4)
+
+    def test_seen_markers_follow_the_other_users_watermark(self):
+        own = [message for message in self.thread if message.sender_id == self.buyer.pk]
+        Conversation.objects.filter(owner=self.seller, other_user=self.buyer).update(last_read_id=own[-3].pk)
+        self.client.force_login(self.buyer)
+        html = self.client.get(reverse('conversation', args=[self.car.pk, self.seller.pk])).content.decode()
+        self.assertEqual(html.count('seen-marker"'), len([m for m in own[-15:] if m.pk <= own[-3].pk]))
+
+
+def bulk_sold_listings(seller, buyer, count):
+    CarListing.objects.bulk_create([
+        CarListing(
+            seller=seller, buyer=buyer, make='Tata', model=f'Nexon {i}', year=2020, price=800000,
+            mileage=17, transmission='Manual', fuel_type='Petrol', description='Sold.',
+            location_city='Pune', status='SOLD',
+        )
+        for i in range(count)
+    ], batch_size=2000)
+
+
+class MyPurchasesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.other_buyer = User.objects.create_user('other', 'other@example.com', 'pass12345')
+
+    def test_marking_as_sold_records_the_buyer(self):
+        car = make_listing(self.seller)
+        Message.objects.create(sender=self.buyer, receiver=self.seller, listing=car, content='Deal?')
+        Message.objects.create(sender=self.seller, receiver=self.buyer, listing=car, content='Deal.')
+        self.client.force_login(self.seller)
+        self.client.get(reverse('mark-as-sold', args=[car.pk]))
+        car.refresh_from_db()
+        self.assertEqual(car.buyer, self.buyer)
+
+        Review.objects.create(seller=self.seller, reviewer=self.buyer, listing=car, rating=5, comment='Great')
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('my-purchases'))
+        self.assertEqual([(c.pk, c.has_reviewed) for c in response.context['purchased_cars']], [(car.pk, True)])
+
+    def test_query_count_is_independent_of_platform_sales(self):
+        self.client.force_login(self.buyer)
+        bulk_sold_listings(self.seller, self.buyer, 3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('my-purchases'))
+        bulk_sold_listings(self.seller, self.other_buyer, 300)
+        bulk_sold_listings(self.seller, self.buyer, 50)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('my-purchases'))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context['purchased_cars']), 20)
+
+
+@skipUnless(os.environ.get('CARHUB_BENCHMARK'), 'set CARHUB_BENCHMARK=1 to run benchmarks')
+class MyPurchasesBenchmark(TestCase):
+    """
+    CARHUB_BENCHMARK=1 python manage.py test listings.tests.MyPurchasesBenchmark
+
+    Latency of My Purchases as the number of cars sold on the whole platform
+    grows from 100 to 100k, for a buyer with 10 purchases.
+    """
+    def test_latency_stays_flat(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        others = User.objects.create_user('others', 'others@example.com', 'pass12345')
+        bulk_sold_listings(seller, buyer, 10)
+        self.client.force_login(buyer)
+
+        results, total = {}, 0
+        for size in (100, 1000, 10000, 100000):
+            bulk_sold_listings(seller, others, size - total)
+            total = size
+            timings = []
+            for _ in range(20):
+                start = time.perf_counter()
+                self.client.get(reverse('my-purchases'))
+                timings.append((time.perf_counter() - start) * 1000)
+            results[size] = median(timings)
+            print(f'{size:>7} sold listings: p50 {results[size]:.2f} ms')
+        self.assertLess(results[100000], results[100] * 3)
+
+
+class SellerRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.reviewers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass12345') for i in range(12)]
+        cls.cars = [make_listing(cls.seller, status='SOLD') for _ in range(12)]
+
+    def review(self, i, rating):
+        return Review.objects.create(seller=self.seller, reviewer=self.reviewers[i], listing=self.cars[i], rating=rating, comment='ok')
+
+    def test_totals_follow_reviews(self):
+        self.review(0, 5)
+        review = self.review(1, 3)
+        review.seller_response = 'Thanks!'
+        review.save()
+        review.rating = 4
+        review.save()
+        self.review(2, 1).delete()
+        rating = SellerRating.objects.get(seller=self.seller)
+        self.assertEqual((rating.review_count, rating.rating_sum, rating.average), (2, 9, 4.5))
+        self.assertEqual([count for _, count, _ in rating.histogram], [1, 1, 0, 0, 0])
+
+    def test_profile_query_count_does_not_grow_with_reviews(self):
+        self.review(0, 5)
+        url = reverse('profile', args=[self.seller.username])
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(1, 12):
+            self.review(i, 4)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context['reviews']), 10)
+        self.assertIsNotNone(response.context['next_page_url'])
+
+
+class UnreadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.seller)
+
+    def unread_badge(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('wishlist'))
+        counted = any('SUM(' in q['sql'] and 'listings_conversation' in q['sql'] for q in ctx.captured_queries)
+        return response.context['unread_messages_count'], counted
+
+    def test_count_is_cached_until_inbox_changes(self):
+        self.assertEqual(self.unread_badge(), (0, True))
+        self.assertEqual(self.unread_badge(), (0, False))
+        Message.objects.create(sender=self.buyer, receiver=self.seller, listing=self.car, content='Hi')
+        self.assertEqual(self.unread_badge(), (1, True))
+        # opening the conversation marks it read; that page already shows the fresh count
+        response = self.client.get(reverse('conversation', args=[self.car.pk, self.buyer.pk]))
+        self.assertEqual(response.context['unread_messages_count'], 0)
+        self.assertEqual(self.unread_badge(), (0, False))
+
+
+class WishlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.cars = [make_listing(cls.seller, model=f'Model {i}') for i in range(6)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.buyer)
+
+    def set_state(self, car_pk, wanted):
+        return self.client.post(reverse('toggle-wishlist', args=[car_pk]), {'wishlisted': wanted},
+                                HTTP_ACCEPT='application/json')
+
+    def test_ids_are_cached_until_the_wishlist_changes(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(wishlist.wishlisted_ids(self.buyer), frozenset())
+        with self.assertNumQueries(0):
+            self.assertFalse(wishlist.is_wishlisted(self.buyer, self.cars[0].pk))
+        wishlist.add(self.buyer, self.cars[0].pk)
+        self.assertTrue(wishlist.is_wishlisted(self.buyer, self.cars[0].pk))
+        # changes through the related managers drop the cached ids too
+        self.buyer.wishlist_items.add(self.cars[1])
+        self.cars[2].wishlist.add(self.buyer)
+        self.assertEqual(wishlist.wishlisted_ids(self.buyer, [c.pk for c in self.cars[1:4]]),
+                         {self.cars[1].pk, self.cars[2].pk})
+        self.buyer.wishlist_items.clear()
+        self.assertEqual(wishlist.wishlisted_ids(self.buyer), frozenset())
+
+    def test_setting_the_state_is_idempotent(self):
+        car = self.cars[0]
+        for _ in range(2):
+            response = self.set_state(car.pk, 'true')
+            self.assertEqual(response.json(), {'listing': car.pk, 'wishlisted': True})
+        self.assertEqual(list(self.buyer.wishlist_items.all()), [car])
+        for _ in range(2):
+            self.assertEqual(self.set_state(car.pk, 'false').json()['wishlisted'], False)
+        self.assertFalse(self.buyer.wishlist_items.exists())
+        self.assertEqual(self.set_state(car.pk + 1000, 'true').status_code, 404)
+
+    def test_toggle_writes_a_single_statement(self):
+        wishlist.wishlisted_ids(self.buyer)
+        for wanted, keyword in (('true', 'INSERT'), ('false', 'DELETE')):
+            with CaptureQueriesContext(connection) as ctx:
+                self.set_state(self.cars[0].pk, wanted)
+            writes = [q['sql'] for q in ctx.captured_queries
+                      if q['sql'].startswith(('INSERT', 'DELETE', 'UPDATE')) and 'listings_carlisting_wishlist' in q['sql']]
+            self.assertEqual(len(writes), 1)
+            self.assertTrue(writes[0].startswith(keyword))
+
+    def test_link_without_javascript_flips_and_redirects(self):
+        url = reverse('toggle-wishlist', args=[self.cars[0].pk])
+        self.assertRedirects(self.client.get(url), reverse('car-detail', args=[self.cars[0].pk]))
+        self.assertTrue(wishlist.is_wishlisted(self.buyer, self.cars[0].pk))
+        self.client.get(url)
+        self.assertFalse(wishlist.is_wishlisted(self.buyer, self.cars[0].pk))
+
+    def test_flip_ignores_stale_cached_ids(self):
+        # Another worker's toggle leaves this process's cached ids behind
+        car = self.cars[0]
+        url = reverse('toggle-wishlist', args=[car.pk])
+        wishlist.add(self.buyer, car.pk)
+        self.assertTrue(wishlist.is_wishlisted(self.buyer, car.pk))
+        Wishlist = CarListing.wishlist.through
+        Wishlist.objects.filter(user=self.buyer).delete()
+        self.assertEqual(self.client.post(url, HTTP_ACCEPT='application/json').json()['wishlisted'], True)
+        self.assertTrue(self.buyer.wishlist_items.filter(pk=car.pk).exists())
+
+        cache.set(wishlist._cache_key(self.buyer.pk), frozenset())
+        self.assertEqual(self.set_state(car.pk, 'true').json()['wishlisted'], True)
+        self.assertEqual(self.client.post(url, HTTP_ACCEPT='application/json').json()['wishlisted'], False)
+        self.assertFalse(self.buyer.wishlist_items.exists())
+        self.assertEqual(self.client.post(reverse('toggle-wishlist', args=[car.pk + 1000]),
+                                          HTTP_ACCEPT='application/json').status_code, 404)
+
+    def count_card_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return len(ctx.captured_queries), response
+
+    def test_hearts_cost_one_query_per_page(self):
+        for url in (reverse('car-list'), reverse('landing-page')):
+            with self.subTest(url=url):
+                before, response = self.count_card_queries(url)
+                self.assertNotContains(response, 'data-wishlisted="true"')
+                self.buyer.wishlist_items.set(self.cars)
+                after, response = self.count_card_queries(url)
+                self.assertEqual(after, before)
+                self.assertContains(response, 'data-wishlisted="true"')
+                self.assertNotContains(response, 'data-wishlisted="false"')
+                self.buyer.wishlist_items.clear()
+
+
+class EngagementCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass12345') for i in range(3)]
+        cls.car = make_listing(cls.seller)
+        cls.other_car = make_listing(cls.seller, model='Harrier')
+
+    def setUp(self):
+        cache.clear()
+        view_counter.reset()
+
+    def counters(self, car=None):
+        car = car or self.car
+        car.refresh_from_db()
+        return car.wishlist_count, car.message_count, car.unique_viewers
+
+    def test_wishlist_count_follows_every_kind_of_change(self):
+        first, second, third = self.buyers
+        self.car.wishlist.add(first, second)
+        third.wishlist_items.add(self.car, self.other_car)
+        self.assertEqual(self.counters()[0], 3)
+        # removing someone who never wishlisted it changes nothing
+        self.car.wishlist.remove(self.seller, first)
+        self.assertEqual(self.counters()[0], 2)
+        third.wishlist_items.clear()
+        self.assertEqual((self.counters()[0], self.counters(self.other_car)[0]), (1, 0))
+        wishlist.add(first, self.car.pk)
+        wishlist.add(first, self.car.pk)
+        wishlist.remove(second, self.car.pk)
+        self.assertEqual(self.counters()[0], 1)
+        self.car.wishlist.clear()
+        self.assertEqual(self.counters()[0], 0)
+
+    def test_message_count_follows_messages(self):
+        messages = [
+            Message.objects.create(sender=buyer, receiver=self.seller, listing=self.car, content='Hi')
+            for buyer in self.buyers
+        ]
+        self.assertEqual(self.counters()[1], 3)
+        messages[0].delete()
+        self.assertEqual(self.counters()[1], 2)
+
+    def test_deleting_a_listing_does_not_uncount_each_message(self):
+        make_thread(self.car, self.buyers[0], 30)
+        with CaptureQueriesContext(connection) as ctx:
+            self.car.delete()
+        self.assertFalse([q for q in ctx.captured_queries if 'SET "message_count"' in q['sql']])
+
+    def test_unique_viewers_count_each_user_once(self):
+        for buyer in self.buyers[:2]:
+            view_counter.record_view(self.car.pk, buyer.pk)
+        self.assertEqual(view_counter.flush()[1], 2)
+        # a later visit by the same user, after the dedup window, is a view but not a new viewer
+        cache.clear()
+        view_counter.record_view(self.car.pk, self.buyers[0].pk)
+        view_counter.record_view(self.car.pk, self.buyers[2].pk)
+        self.assertEqual(view_counter.flush()[1], 1)
+        self.assertEqual(self.counters()[2], 3)
+        self.assertEqual(ListingViewer.objects.filter(listing=self.car).count(), 3)
+
+    def test_reconcile_fixes_drift(self):
+        self.car.wishlist.add(*self.buyers)
+        Message.objects.create(sender=self.buyers[0], receiver=self.seller, listing=self.car, content='Hi')
+        CarListing.objects.filter(pk=self.car.pk).update(wishlist_count=7, message_count=0)
+        CarListing.objects.filter(pk=self.other_car.pk).update(unique_viewers=2)
+
+        out = StringIO()
+        call_command('reconcile_engagement_counters', '--dry-run', stdout=out)
+        self.assertIn("Would correct 3 counters", out.getvalue())
+        self.assertEqual(self.counters(), (7, 0, 0))
+
+        self.assertEqual(sorted(engagement.reconcile(chunk_size=1)), [
+            (self.car.pk, 'message_count', 0, 1),
+            (self.car.pk, 'wishlist_count', 7, 3),
+            (self.other_car.pk, 'unique_viewers', 2, 0),
+        ])
+        self.assertEqual(self.counters(), (3, 1, 0))
+        self.assertEqual(self.counters(self.other_car), (0, 0, 0))
+        self.assertEqual(engagement.reconcile(), [])
+
+    def test_my_listings_reads_plain_columns(self):
+        self.car.wishlist.add(*self.buyers)
+        self.client.force_login(self.seller)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('my-listings'))
+        self.assertFalse([q for q in ctx.captured_queries if 'listings_carlisting_wishlist' in q['sql']])
+        self.assertContains(response, 'Wishlisted by 3 users')
+
+
+class AnalyticsRollupTests(TestCase):
+    def rollup_rows(self):
+        return (
+            set(ListingRollup.objects.filter(count__gt=0).values_list('make', 'status', 'location_city', 'count')),
+            set(DailyRollup.objects.filter(count__gt=0).values_list('metric', 'day', 'count')),
+        )
+
+    def test_signals_keep_rollups_equal_to_a_rebuild(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        leaving = User.objects.create_user('leaving', 'leaving@example.com', 'pass12345')
+        nexon = make_listing(seller)
+        make_listing(seller, make='Honda', model='City', location_city='Mumbai')
+        pending = make_listing(seller, status='PENDING_APPROVAL')
+        make_listing(leaving)
+        nexon.status = 'SOLD'
+        nexon.save()
+        pending.make = 'Kia'
+        pending.save(update_fields=['make'])
+        review = Review.objects.create(seller=seller, reviewer=buyer, listing=nexon, rating=5, comment='Great')
+        leaving.delete()
+
+        incremental = self.rollup_rows()
+        self.assertIn(('Tata', 'SOLD', 'Pune', 1), incremental[0])
+        self.assertIn(('Kia', 'PENDING_APPROVAL', 'Pune', 1), incremental[0])
+        rollups.rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+        review.delete()
+        self.assertNotIn('reviews', {metric for metric, _, _ in self.rollup_rows()[1]})
+
+    def test_dashboard_reads_only_the_rollups(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        make_listing(seller)
+        make_listing(seller, status='SOLD')
+        make_listing(seller, make='Honda', model='City')
+        with CaptureQueriesContext(connection) as ctx:
+            summary = rollups.dashboard(days=7)
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertTrue(all('rollup' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual((summary['total_users'], summary['total_listings']), (1, 3))
+        self.assertEqual((summary['active_listings'], summary['sold_listings']), (2, 1))
+        self.assertEqual(list(zip(summary['brand_labels'], summary['brand_data'])), [('Tata', 2), ('Honda', 1)])
+        self.assertEqual(len(summary['timeline_labels']), 7)
+        self.assertEqual(summary['timeline_data']['Listings posted'][-1], 3)
+
+    def test_admin_index_shows_the_rollups(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        make_listing(admin_user)
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_listings'], 1)
+        self.assertContains(response, 'timelineChart')
+
+
+class ActivityLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+
+    def test_signals_append_events(self):
+        Message.objects.create(sender=self.buyer, receiver=self.seller, listing=self.car, content='Still available?')
+        self.car.status = 'SOLD'
+        self.car.save()
+        Review.objects.create(seller=self.seller, reviewer=self.buyer, listing=self.car, rating=4, comment='Good')
+        events = [(e.event_type, e.data.get('actor'), e.data.get('recipient')) for e in activity.recent(10)]
+        self.assertEqual(events, [
+            ('review', 'buyer', 'seller'),
+            ('sale', 'seller', 'buyer'),
+            ('message', 'buyer', 'seller'),
+            ('listing_created', 'seller', None),
+            ('signup', 'buyer', None),
+            ('signup', 'seller', None),
+        ])
+        event = ActivityEvent.objects.get(event_type='sale')
+        self.assertEqual(event.data['listing'], str(self.car))
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_status_changes_other_than_a_sale(self):
+        self.car.status = 'REJECTED'
+        self.car.save()
+        event = activity.recent(1)[0]
+        self.assertEqual((event.event_type, event.data['old'], event.data['new']), ('listing_status', 'ACTIVE', 'REJECTED'))
+
+    def test_feed_pages_are_single_range_scans(self):
+        for i in range(5):
+            make_listing(self.seller, model=f'Model {i}')
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = activity.feed(cursor, per_page=3)
+                seen.extend(event.pk for event in page)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(seen, list(ActivityEvent.objects.order_by('-timestamp', '-id').values_list('pk', flat=True)))
+        listings = activity.feed(per_page=10, event_type='listing_created')
+        self.assertEqual(len(listings), 6)
+        self.assertEqual(len(activity.feed(recipient_id=self.seller.pk)), 0)
+
+    def test_admin_feed_filters_by_type(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pass12345', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('activity-feed'), {'type': 'signup'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({event.event_type for event in response.context['events']}, {'signup'})
+        self.assertContains(response, 'just signed up')
+        response = self.client.get(reverse('activity-feed'), {'type': 'bogus'})
+        self.assertEqual(len(response.context['events']), 4)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse('activity-feed')).status_code, 302)
+
+
+@override_settings(MESSAGE_DIGEST_WINDOW=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MessageNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.other_buyer = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+
+    def send(self, sender, receiver, content):
+        return Message.objects.create(sender=sender, receiver=receiver, listing=self.car, content=content)
+
+    def test_messages_to_one_receiver_become_one_digest(self):
+        self.send(self.buyer, self.seller, 'Is it available?')
+        self.send(self.other_buyer, self.seller, 'Best price?')
+        self.send(self.buyer, self.seller, 'Can I see it Sunday?')
+        self.send(self.seller, self.buyer, 'Yes, it is.')
+        self.assertEqual(Job.objects.count(), 4)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(jobs.run(), (4, 0))
+        self.assertFalse(Job.objects.exists())
+        emails = {email.to[0]: email for email in mail.outbox}
+        self.assertEqual(len(mail.outbox), 2)
+        digest = emails['seller@example.com']
+        self.assertEqual(digest.subject, "3 new messages on CarHub")
+        for content in ('Is it available?', 'Best price?', 'Can I see it Sunday?'):
+            self.assertIn(content, digest.body)
+        self.assertIn(reverse('conversation', args=[self.car.pk, self.other_buyer.pk]), digest.alternatives[0][0])
+        self.assertEqual(emails['buyer@example.com'].subject, "New message from seller on CarHub")
+
+    @override_settings(MESSAGE_DIGEST_WINDOW=120)
+    def test_digest_waits_for_the_window_and_skips_read_messages(self):
+        first = self.send(self.buyer, self.seller, 'First question')
+        self.assertEqual(jobs.run(), (0, 0))
+        self.send(self.buyer, self.seller, 'Anyone there?')
+        Conversation.objects.filter(owner=self.seller, other_user=self.buyer).update(last_read_id=first.pk)
+        # the first job falling due takes the later one in its group along
+        Job.objects.filter(payload__message=first.pk).update(run_after=timezone.now())
+        self.assertEqual(jobs.run(), (2, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertNotIn('First question', mail.outbox[0].body)
+        self.assertIn('Anyone there?', mail.outbox[0].body)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=60)
+    def test_failed_batches_are_retried_with_backoff(self):
+        calls = []
+
+        @jobs.handler('flaky')
+        def flaky(batch):
+            calls.append(len(batch))
+            raise ConnectionError("SMTP is down")
+        self.addCleanup(jobs.HANDLERS.pop, 'flaky')
+
+        job = jobs.enqueue('flaky', {'n': 1})
+        with self.assertLogs('listings.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn("SMTP is down", job.last_error)
+        self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(jobs.run(), (0, 0))
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('listings.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), ('failed', 2, [1, 1]))
+
+    def test_jobs_of_a_dead_worker_are_handed_out_again(self):
+        self.send(self.buyer, self.seller, 'Hello')
+        Job.objects.update(status='running', locked_by='gone:1', locked_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertIn("Ran 1 job(s), 0 failed.", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class LiveMessagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller)
+        make_thread(cls.car, cls.buyer, 4)
+        cls.first, *_, cls.last = Message.objects.order_by('id')
+
+    def events_url(self, other):
+        return reverse('conversation-events', args=[self.car.pk, other.pk])
+
+    def test_stream_resumes_after_the_last_event_id(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(self.events_url(self.buyer), headers={'last-event-id': str(self.first.pk)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = response.content.decode()
+        self.assertNotIn(f'id: {self.first.pk}\n', body)
+        for message in Message.objects.filter(pk__gt=self.first.pk):
+            self.assertIn(f'id: {message.pk}\nevent: message\n', body)
+        # The buyer's messages were delivered to the open page, so they are read now
+        thread = Conversation.objects.get(owner=self.seller)
+        self.assertEqual((thread.last_read_id, thread.unread_count), (self.last.pk, 0))
+
+    def test_read_receipts_follow_the_other_users_watermark(self):
+        self.client.force_login(self.buyer)
+        body = self.client.get(self.events_url(self.seller) + f'?after={self.last.pk}').content.decode()
+        self.assertNotIn('event: read', body)
+
+        self.client.force_login(self.seller)
+        self.client.get(reverse('conversation', args=[self.car.pk, self.buyer.pk]))
+        self.client.force_login(self.buyer)
+        body = self.client.get(self.events_url(self.seller) + f'?after={self.last.pk}').content.decode()
+        self.assertIn(f'event: read\ndata: {{"up_to": {self.last.pk}}}', body)
+
+    def test_only_participants_can_open_the_stream(self):
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.events_url(self.buyer)).status_code, 404)
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(self.events_url(self.seller)).status_code, 404)
+
+    def test_replies_posted_with_fetch_get_json_back(self):
+        self.client.force_login(self.buyer)
+        url = reverse('conversation', args=[self.car.pk, self.seller.pk])
+        response = self.client.post(url, {'content': 'Still available?'}, headers={'accept': 'application/json'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.get(pk=response.json()['id']).content, 'Still available?')
+        response = self.client.post(url, {'content': ''}, headers={'accept': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+
+    def send(self, sender, receiver, content):
+        # Runs the on_commit hooks that TestCase's transaction would hold back
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(sender=sender, receiver=receiver, listing=self.car, content=content)
+
+    async def test_saving_a_message_wakes_only_that_conversations_streams(self):
+        with live.subscribe(self.car.pk, self.seller.pk, self.buyer.pk) as changed, \
+                live.subscribe(self.car.pk, self.seller.pk, self.outsider.pk) as unrelated:
+            await sync_to_async(self.send)(self.buyer, self.seller, 'Any service records?')
+            await asyncio.wait_for(changed.wait(), 1)
+            self.assertFalse(unrelated.is_set())
+        self.assertEqual(live._waiters, {})
+
+    @override_settings(MESSAGE_STREAM_TIMEOUT=10)
+    async def test_asgi_stream_stays_open_and_pushes_new_messages(self):
+        await self.async_client.aforce_login(self.buyer)
+        response = await self.async_client.get(self.events_url(self.seller), {'after': self.last.pk})
+        stream = response.streaming_content
+        received = (await anext(stream)).decode()
+        self.assertTrue(received.startswith('retry: '))
+
+        # Let the stream catch up and wait, then reply: the save has to wake it
+        # well before the MESSAGE_STREAM_POLL fallback would
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.2)
+        self.assertFalse(pending.done())
+        started = time.monotonic()
+        reply = await sync_to_async(self.send)(self.seller, self.buyer, 'Yes!')
+        received = (await asyncio.wait_for(pending, 2)).decode()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertIn(f'id: {reply.pk}', received)
+        self.assertIn('"content": "Yes!"', received)
+        await stream.aclose()
+        self.assertTrue(await Conversation.objects.filter(owner=self.buyer, last_read_id=reply.pk).aexists())
+
+
+def jpeg_upload(name='car.jpg', size=(2000, 1200), color=(200, 30, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class CompareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.cheap = make_listing(cls.seller, price=500000, year=2018, kms_driven=60000)
+        cls.newer = make_listing(cls.seller, price=800000, year=2022, kms_driven=15000, location_city='Mumbai')
+        cls.sold = make_listing(cls.seller, status='SOLD', buyer=cls.buyer)
+        CarImage.objects.create(listing=cls.newer, image='car_images/additional/a.jpg')
+        Review.objects.create(seller=cls.seller, reviewer=cls.buyer, listing=cls.sold, rating=5, comment='Great')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ids_are_capped_deduplicated_and_validated(self):
+        self.assertEqual(compare.parse_ids('3,1,3', limit=3), ([3, 1], False))
+        self.assertEqual(compare.parse_ids(' 4, x,-2,0', limit=4), ([4], False))
+        self.assertEqual(compare.parse_ids('1,2,3,4,5', limit=3), ([1, 2, 3], True))
+        ids, truncated = compare.parse_ids(','.join(['7'] * 100000), limit=3)
+        self.assertEqual((ids, truncated), ([7], True))
+        self.assertEqual(compare.parse_ids(''), ([], False))
+        # Empty values, as in a trailing comma, are not counted against the cap
+        self.assertEqual(compare.parse_ids('1,2,', limit=2), ([1, 2], False))
+        self.assertEqual(compare.parse_ids(',1,, ,2,,', limit=2), ([1, 2], False))
+        self.assertEqual(compare.parse_ids(','.join([''] * 100000 + ['1', '2', '3'])), ([1, 2, 3], False))
+
+    def test_comparison_is_one_query_and_highlights_the_best_values(self):
+        ids = [self.newer.pk, self.cheap.pk, self.sold.pk]
+        with self.assertNumQueries(1):
+            result = compare.comparison(ids)
+        self.assertEqual(result['cars'], [self.cheap, self.newer])
+        rows = {row['key']: row for row in result['rows']}
+        self.assertEqual(rows['price']['best'], [0])
+        self.assertEqual(rows['price']['display'], ['₹500,000', '₹800,000'])
+        self.assertEqual(rows['year']['best'], [1])
+        self.assertEqual(rows['kms_driven']['best'], [1])
+        # The placeholder main image of a listing without uploads is not a photo
+        self.assertEqual(rows['photos']['values'], [0, 1])
+        self.assertTrue(rows['location_city']['differs'])
+        self.assertEqual(rows['location_city']['best'], [])
+        self.assertFalse(rows['fuel_type']['differs'])
+        self.assertEqual(rows['seller_rating']['display'], ['5.0 / 5', '5.0 / 5'])
+        self.assertEqual(rows['seller_rating']['best'], [])
+
+    def test_comparisons_are_cached_until_a_listing_changes(self):
+        compare.comparison([self.cheap.pk, self.newer.pk])
+        with self.assertNumQueries(0):
+            compare.comparison([self.newer.pk, self.cheap.pk])
+        self.cheap.price = 900000
+        self.cheap.save()
+        result = compare.comparison([self.cheap.pk, self.newer.pk])
+        self.assertEqual({row['key']: row for row in result['rows']}['price']['best'], [1])
+
+    def test_compare_page_and_json(self):
+        url = reverse('compare-cars') + f'?ids={self.cheap.pk},{self.newer.pk},{self.sold.pk},99'
+        response = self.client.get(url)
+        self.assertContains(response, '₹500,000')
+        self.assertContains(response, 'Only the first 3 selected cars are compared.')
+        self.assertEqual(len(response.context['cars']), 2)
+
+        data = self.client.get(url, headers={'Accept': 'application/json'}).json()
+        self.assertTrue(data['truncated'])
+        self.assertEqual([car['id'] for car in data['cars']], [self.cheap.pk, self.newer.pk])
+        self.assertEqual(data['cars'][0]['url'], reverse('car-detail', args=[self.cheap.pk]))
+        price = next(row for row in data['rows'] if row['key'] == 'price')
+        self.assertEqual(price, {
+            'key': 'price', 'label': 'Price', 'values': [500000, 800000],
+            'display': ['₹500,000', '₹800,000'], 'differs': True, 'best': [0],
+        })
+
+
+class TemporaryMediaMixin:
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class ImageRenditionTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+
+    def test_upload_gets_renditions_and_placeholder(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            car = make_listing(self.seller, image=jpeg_upload())
+        processed = ProcessedImage.objects.get(source=car.image.name)
+        self.assertEqual(sorted(processed.renditions), ['jpeg', 'webp'])
+        self.assertEqual(sorted(processed.renditions['webp'], key=int), ['320', '640', '1280'])
+        self.assertTrue(processed.placeholder.startswith('data:image/jpeg;base64,'))
+        with default_storage.open(processed.renditions['webp']['320']) as f:
+            self.assertEqual(Image.open(f).size, (320, 192))
+
+        response = self.client.get(reverse('car-list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, processed.renditions['jpeg']['640'])
+
+    def test_same_photo_is_stored_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_listing(self.seller, image=jpeg_upload())
+            second = make_listing(self.seller, image=jpeg_upload())
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(ProcessedImage.objects.count(), 1)
+
+    def test_only_saves_that_change_the_image_process_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            car = make_listing(self.seller, image=jpeg_upload())
+        ProcessedImage.objects.all().delete()
+        car = CarListing.objects.get(pk=car.pk)
+        car.status = 'SOLD'
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            car.save()
+            self.seller.save()
+        self.assertFalse(ProcessedImage.objects.exists())
+        self.assertFalse([q for q in ctx.captured_queries if ProcessedImage._meta.db_table in q['sql']])
+
+        car.image = jpeg_upload('other.jpg', color=(0, 90, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            car.save()
+        self.assertTrue(ProcessedImage.objects.filter(source=car.image.name).exists())
+
+    def test_unprocessed_image_falls_back_to_original(self):
+        car = make_listing(self.seller, image=jpeg_upload())
+        response = self.client.get(reverse('car-list'))
+        self.assertContains(response, car.image.url)
+
+    def test_a_page_of_images_is_looked_up_at_once(self):
+        cars = [make_listing(self.seller, image=f'car_images/card{i}.jpg') for i in range(6)]
+        for car in cars[:3]:
+            ProcessedImage.objects.create(
+                source=car.image.name, digest=f'{car.pk:064}', width=640, height=384, placeholder='data:,',
+                renditions={'jpeg': {'320': f'renditions/{car.pk}/320.jpg', '640': f'renditions/{car.pk}/640.jpg'}},
+            )
+        self.client.force_login(self.seller)
+        for url in (reverse('car-list'), reverse('my-listings')):
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                lookups = [q for q in ctx.captured_queries if ProcessedImage._meta.db_table in q['sql']]
+                self.assertEqual(len(lookups), 1)
+                self.assertContains(response, f'renditions/{cars[0].pk}/640.jpg')
+                self.assertContains(response, cars[5].image.url)
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.get(url)
+                self.assertFalse([q for q in ctx.captured_queries if ProcessedImage._meta.db_table in q['sql']])
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class ImageIngestTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+
+    def test_edit_listing_adds_all_photos(self):
+        car = make_listing(self.seller)
+        self.client.force_login(self.seller)
+        post = {
+            'make': car.make, 'model': car.model, 'year': car.year, 'price': car.price,
+            'kms_driven': 1000, 'mileage': car.mileage, 'transmission': car.transmission,
+            'fuel_type': car.fuel_type, 'description': car.description,
+            'location_city': car.location_city,
+            'additional_images': [jpeg_upload(f'photo{i}.jpg', size=(800, 600), color=(i * 30, 0, 0)) for i in range(6)],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('edit-listing', args=[car.pk]), post, follow=True)
+        self.assertRedirects(response, reverse('my-listings'))
+        self.assertContains(response, '6 photos added.')
+        names = list(car.additional_images.values_list('image', flat=True))
+        self.assertEqual(len(names), 6)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        # Renditions are still made even though bulk_create sends no signals
+        self.assertEqual(ProcessedImage.objects.filter(source__in=names).count(), 6)
+
+    def test_photos_are_inserted_in_one_query(self):
+        car = make_listing(self.seller)
+        uploads = [jpeg_upload(f'photo{i}.jpg', size=(800, 600), color=(i * 30, 0, 0)) for i in range(6)]
+        with CaptureQueriesContext(connection) as ctx:
+            created, rejected = images.ingest_car_images(car, uploads)
+        self.assertEqual((len(created), rejected), (6, []))
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "listings_carimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len([q for q in ctx.captured_queries if '"listings_mediablob"' in q['sql']]), 2)
+        self.assertEqual(set(MediaBlob.objects.values_list('references', flat=True)), {1})
+
+    def test_invalid_files_are_skipped_and_reported(self):
+        car = make_listing(self.seller)
+        uploads = [jpeg_upload('good.jpg'), SimpleUploadedFile('notes.jpg', b'not an image')]
+        created, rejected = images.ingest_car_images(car, uploads)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(rejected, ['notes.jpg'])
+        self.assertEqual(CarImage.objects.filter(listing=car).count(), 1)
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class ContentAddressedStorageTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+
+    def test_blob_is_removed_with_its_last_reference(self):
+        first = make_listing(self.seller, image=jpeg_upload('a.jpg'))
+        second = make_listing(self.seller, image=jpeg_upload('b.jpg'))
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 2)
+
+        self.client.force_login(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete-listing', args=[first.pk]))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_replacing_an_image_releases_the_old_one(self):
+        car = make_listing(self.seller, image=jpeg_upload('a.jpg'))
+        old = car.image.name
+        car = CarListing.objects.get(pk=car.pk)
+        car.image = jpeg_upload('b.jpg', color=(0, 0, 200))
+        with self.captureOnCommitCallbacks(execute=True):
+            car.save()
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(car.image.name))
+
+    def test_uploading_the_same_photo_again_keeps_one_reference(self):
+        car = make_listing(self.seller, image=jpeg_upload('a.jpg'))
+        name = car.image.name
+        for upload in ('again.jpg', 'and-again.jpg'):
+            car.image = jpeg_upload(upload)
+            with self.captureOnCommitCallbacks(execute=True):
+                car.save()
+            self.assertEqual(car.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            car.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_defaults_and_untracked_files_are_never_deleted(self):
+        car = make_listing(self.seller)
+        legacy = FileSystemStorage().save('car_images/legacy.jpg', ContentFile(b'old upload'))
+        CarImage.objects.create(listing=car, image=legacy)
+        with self.captureOnCommitCallbacks(execute=True):
+            car.delete()
+        self.assertTrue(default_storage.exists(legacy))
+
+    def test_dedupe_media_merges_existing_copies(self):
+        plain = FileSystemStorage()
+        photo = jpeg_upload().read()
+        names = [plain.save(f'car_images/{name}', ContentFile(photo)) for name in ('Taigun.jpg', 'Taigun.jpg', 'other.jpg')]
+        cars = [make_listing(self.seller) for _ in names]
+        for car, name in zip(cars, names):
+            CarListing.objects.filter(pk=car.pk).update(image=name)
+
+        call_command('dedupe_media', '--dry-run', stdout=StringIO())
+        self.assertTrue(all(plain.exists(name) for name in names))
+
+        call_command('dedupe_media', stdout=StringIO())
+        stored = set(CarListing.objects.values_list('image', flat=True))
+        self.assertEqual(len(stored), 1)
+        blob = stored.pop()
+        self.assertTrue(blob.startswith('blobs/'))
+        self.assertEqual(MediaBlob.objects.get(name=blob).references, 3)
+        self.assertFalse(any(plain.exists(name) for name in names))
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class MediaGarbageCollectorTests(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+
+    def _age(self, *names):
+        old = time.time() - 3 * 24 * 3600
+        for name in names:
+            os.utime(default_storage.path(name), (old, old))
+
+    def test_only_old_unreferenced_files_are_deleted(self):
+        plain = FileSystemStorage()
+        with self.captureOnCommitCallbacks(execute=True):
+            car = make_listing(self.seller, image=jpeg_upload())
+        renditions = ProcessedImage.objects.get(source=car.image.name).renditions
+        legacy = plain.save('car_images/legacy.jpg', ContentFile(b'still referenced'))
+        CarImage.objects.create(listing=car, image=legacy)
+        orphan = plain.save('car_images/additional/deleted.jpg', ContentFile(b'orphan'))
+        fresh = plain.save('car_images/additional/uploading.jpg', ContentFile(b'row not committed yet'))
+        kept = [car.image.name, legacy, renditions['webp']['320'], renditions['jpeg']['320']]
+        self._age(orphan, *kept)
+
+        out = StringIO()
+        call_command('collect_media_garbage', '--dry-run', stdout=out)
+        self.assertIn(orphan, out.getvalue())
+        self.assertTrue(plain.exists(orphan))
+
+        call_command('collect_media_garbage', '--workers=2', '--rate=100', stdout=StringIO())
+        self.assertFalse(plain.exists(orphan))
+        self.assertTrue(all(plain.exists(name) for name in kept + [fresh]))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = media_gc.BloomFilter(1000, error_rate=0.01)
+        names = [f'car_images/{i}.jpg' for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        false_positives = sum(f'other/{i}.jpg' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class QueryMetricsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass12345', is_staff=True)
+        make_listing(cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse('car-list'))
+        self.client.get(reverse('car-list'))
+        histograms = metrics.registry.snapshot()['car-list']
+        self.assertEqual(histograms['latency_seconds'].count, 2)
+        self.assertGreater(histograms['queries'].max, 0)
+        self.assertGreater(histograms['template_seconds'].sum, 0)
+        self.assertGreater(histograms['response_bytes'].sum, 0)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse('car-list'))
+        self.assertContains(self.client.get(reverse('metrics')), 'car-list')
+        response = self.client.get(reverse('metrics'), {'format': 'prometheus'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, 'carhub_view_queries_count{view="car-list"} 1')
+        self.assertContains(response, 'carhub_view_latency_seconds_bucket{view="car-list",le="+Inf"} 1')
+
+    @override_settings(METRICS_VIEW_BUDGETS={'car-list': (0, 60000)})
+    def test_over_budget_views_are_logged(self):
+        with self.assertLogs('listings.middleware', 'WARNING') as logs:
+            self.client.get(reverse('car-list'))
+        self.assertIn('car-list ran', logs.output[0])
+
+
+
+class ServerBenchmarkTests(TemporaryMediaMixin, TransactionTestCase):
+    """The WSGI and ASGI applications run in other threads, so the rows are committed."""
+
+    def test_both_servers_serve_the_same_requests(self):
+        MarketplaceGenerator(
+            users=8, listings=30, images_per_listing=1, messages=10, reviews=5, wishlist_items=10, chunk_size=16, seed=1,
+        ).run()
+        result = benchmark.ServerBenchmark(concurrency=3, seed=1).run(30)
+        self.assertEqual(set(result['servers']), {'wsgi', 'asgi'})
+        for summary in result['servers'].values():
+            self.assertEqual((summary['requests'], summary['errors']), (30, 0))
+            self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
+            self.assertLessEqual(set(summary['views']), set(benchmark.SERVER_ROUTES))
+
+
+# --- Factories for a realistic marketplace ---
+MAKES = (('Tata', 'Nexon'), ('Honda', 'City'), ('Maruti', 'Swift'), ('Hyundai', 'Creta'), ('Mahindra', 'XUV700'))
+CITIES = ('Pune', 'Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai')
+
+
+def make_users(prefix, count):
+    password = make_password('pass12345')
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+        for i in range(count)
+    ])
+    Profile.objects.bulk_create([Profile(user=user) for user in users])
+    return users
+
+
+def make_listings(sellers, count, **overrides):
+    listings = []
+    for i in range(count):
+        make, model = MAKES[i % len(MAKES)]
+        fields = {
+            'seller': sellers[i % len(sellers)], 'make': make, 'model': model,
+            'year': 2010 + i % 14, 'price': 200000 + (i * 7919) % 3000000, 'kms_driven': i * 37 % 150000,
+            'mileage': 12 + i % 10, 'transmission': ('Manual', 'Automatic')[i % 2],
+            'fuel_type': ('Petrol', 'Diesel', 'CNG')[i % 3], 'description': f'Seed listing {i}, well kept.',
+            'location_city': CITIES[i % len(CITIES)], 'status': 'ACTIVE',
+        }
+        fields.update(overrides)
+        listings.append(CarListing(**fields))
+    listings = CarListing.objects.bulk_create(listings, batch_size=500)
+    # A photo of its own for every listing, so a page of cards needs every one looked up
+    for listing in listings:
+        listing.image = f'car_images/seed_{listing.pk}.jpg'
+    CarListing.objects.bulk_update(listings, ['image'], batch_size=500)
+    return listings
+
+
+def make_car_images(listings, per_listing):
+    CarImage.objects.bulk_create([
+        CarImage(listing=listing, image=f'car_images/additional/seed_{listing.pk}_{i}.jpg')
+        for listing in listings for i in range(per_listing)
+    ], batch_size=1000)
+
+
+def make_thread(listing, buyer, count):
+    # Saved one by one so the signals keep Conversation rows and unread counts
+    for i in range(count):
+        sender, receiver = (buyer, listing.seller) if i % 2 == 0 else (listing.seller, buyer)
+        Message.objects.create(sender=sender, receiver=receiver, listing=listing, content=f'Message {i}')
+
+
+@override_settings(METRICS_LATENCY_BUDGET_MS=60000)
+class RouteQueryBudgetTests(TemporaryMediaMixin, TestCase):
+    """
+    Requests every route in listings/urls.py as an anonymous user, a buyer
+    and a seller against a marketplace of a few thousand rows, and fails if
+    any of them runs more SQL queries than its budget, or more than the
+    middleware's METRICS_QUERY_BUDGET. Routes that take a form are posted to
+    as well, each POST in a transaction that is rolled back afterwards. The
+    budgets are the current counts: when a change lowers one, lower the
+    budget with it.
+    """
+    # route name: (anonymous, buyer, seller)
+    BUDGETS = {
+        'landing-page': (2, 7, 7),
+        'car-list': (3, 8, 8),
+        'car-list-more': (3, 7, 7),
+        'car-detail': (2, 8, 7),
+        'signup': (0, 3, 3),
+        'login': (0, 3, 3),
+        'logout': (0, 4, 4),
+        'post-car': (0, 4, 4),
+        'my-listings': (0, 5, 6),
+        'my-listing-detail': (0, 3, 8),
+        'edit-listing': (0, 3, 7),
+        'delete-car-image': (0, 5, 6),
+        'mark-as-sold': (0, 3, 15),
+        'delete-listing': (0, 3, 5),
+        'wishlist': (0, 6, 5),
+        'toggle-wishlist': (0, 7, 8),
+        'edit-profile': (0, 5, 5),
+        'profile': (2, 6, 6),
+        'password_change': (0, 4, 4),
+        'password_change_done': (0, 4, 4),
+        'compare-cars': (1, 5, 5),
+        'inbox': (0, 5, 5),
+        'conversation': (0, 10, 10),
+        'conversation-events': (0, 6, 6),
+        'my-purchases': (0, 6, 5),
+        'leave-review': (0, 7, 7),
+        'add-review-response': (0, 4, 7),
+    }
+    # route name: (anonymous, buyer, seller) for a POST of post_data(name)
+    POST_BUDGETS = {
+        'car-detail': (1, 11, 13),
+        'signup': (7, 7, 7),
+        'login': (11, 8, 11),
+        'post-car': (0, 21, 21),
+        'edit-listing': (0, 3, 14),
+        'delete-listing': (0, 3, 18),
+        'toggle-wishlist': (0, 7, 7),
+        'edit-profile': (0, 7, 7),
+        'password_change': (0, 14, 14),
+        'conversation': (0, 10, 10),
+        'leave-review': (0, 10, 10),
+        'add-review-response': (0, 4, 6),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        others = make_users('user', 40)
+        make_listings(others, 2500)
+        own = make_listings([cls.seller], 300)
+        sold = make_listings([cls.seller], 40, status='SOLD', buyer=cls.buyer)
+        make_listings(others, 200, status='PENDING_APPROVAL')
+        make_car_images(own[:200] + sold, 4)
+        search.rebuild_index()
+
+        cls.listing, cls.sold = own[0], sold[0]
+        cls.image = cls.listing.additional_images.first()
+        make_thread(cls.listing, cls.buyer, 200)
+        for i, listing in enumerate(own[1:150]):
+            make_thread(listing, others[i % len(others)], 6)
+        for i, listing in enumerate(sold[1:]):
+            Review.objects.create(seller=cls.seller, reviewer=cls.buyer, listing=listing, rating=i % 5 + 1, comment='Fine')
+        cls.review = Review.objects.filter(seller=cls.seller).first()
+        cls.buyer.wishlist_items.add(*own[:150])
+
+    def setUp(self):
+        super().setUp()
+        self.forget_state()
+
+    def forget_state(self):
+        cache.clear()
+        view_counter.reset()
+
+    def route_url(self, name, role):
+        other = {'anonymous': self.buyer, 'buyer': self.seller, 'seller': self.buyer}[role]
+        kwargs = {
+            'car-detail': {'pk': self.listing.pk},
+            'my-listing-detail': {'pk': self.listing.pk},
+            'edit-listing': {'pk': self.listing.pk},
+            'delete-car-image': {'image_pk': self.image.pk},
+            'mark-as-sold': {'pk': self.listing.pk},
+            'delete-listing': {'pk': self.listing.pk},
+            'toggle-wishlist': {'pk': self.listing.pk},
+            'profile': {'username': self.seller.username},
+            'conversation': {'listing_pk': self.listing.pk, 'other_user_pk': other.pk},
+            'conversation-events': {'listing_pk': self.listing.pk, 'other_user_pk': other.pk},
+            'leave-review': {'listing_pk': self.sold.pk},
+            'add-review-response': {'review_pk': self.review.pk},
+        }.get(name, {})
+        url = reverse(name, kwargs=kwargs)
+        if name == 'compare-cars':
+            url += f'?ids={self.listing.pk},{self.sold.pk},{self.image.listing_id}'
+        return url
+
+    def post_data(self, name):
+        listing = {
+            'make': 'Tata', 'model': 'Punch', 'year': 2022, 'price': 650000, 'kms_driven': 12000,
+            'mileage': 18, 'transmission': 'Manual', 'fuel_type': 'Petrol',
+            'description': 'First owner.', 'location_city': 'Pune',
+            'additional_images': [jpeg_upload(f'photo{i}.jpg', size=(64, 48), color=(i * 60, 0, 0)) for i in range(3)],
+        }
+        return {
+            'car-detail': {'content': 'Is the price negotiable?'},
+            'signup': {'username': 'newcomer', 'password1': 'Str0ng-pass-9', 'password2': 'Str0ng-pass-9'},
+            'login': {'username': 'buyer', 'password': 'pass12345'},
+            'post-car': listing,
+            'edit-listing': listing,
+            'delete-listing': {},
+            'toggle-wishlist': {'wishlisted': 'true'},
+            'edit-profile': {'first_name': 'Asha', 'last_name': 'Rao', 'email': 'asha@example.com'},
+            'password_change': {'old_password': 'pass12345', 'new_password1': 'Str0ng-pass-9', 'new_password2': 'Str0ng-pass-9'},
+            'conversation': {'content': 'Can we meet on Saturday?'},
+            'leave-review': {'rating': 5, 'comment': 'Smooth sale.'},
+            'add-review-response': {'seller_response': 'Thank you!'},
+        }[name]
+
+    def count_queries(self, name, role):
+        self.client.logout()
+        if role != 'anonymous':
+            self.client.force_login(getattr(self, role))
+        url = self.route_url(name, role)
+        # Measured with cold caches
+        self.forget_state()
+        # The middleware logs requests over METRICS_QUERY_BUDGET
+        with self.assertNoLogs('listings.middleware', 'WARNING'), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500, url)
+        return len(ctx.captured_queries)
+
+    def count_post_queries(self, name, role):
+        self.client.logout()
+        if role != 'anonymous':
+            self.client.force_login(getattr(self, role))
+        url, data = self.route_url(name, role), self.post_data(name)
+        self.forget_state()
+        with transaction.atomic():
+            with self.assertNoLogs('listings.middleware', 'WARNING'), CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(url, data)
+            transaction.set_rollback(True)
+        # Caches and buffered views may now describe the rolled back writes
+        self.forget_state()
+        self.assertLess(response.status_code, 500, url)
+        return len(ctx.captured_queries)
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in listing_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set(), "Add a query budget for the new routes")
+
+    def test_routes_stay_within_query_budget(self):
+        for name, budgets in self.BUDGETS.items():
+            for role, budget in zip(('anonymous', 'buyer', 'seller'), budgets):
+                with self.subTest(route=name, role=role):
+                    self.assertLessEqual(self.count_queries(name, role), budget)
+
+    def test_form_posts_stay_within_query_budget(self):
+        for name, budgets in self.POST_BUDGETS.items():
+            for role, budget in zip(('anonymous', 'buyer', 'seller'), budgets):
+                with self.subTest(route=name, role=role):
+                    self.assertLessEqual(self.count_post_queries(name, role), budget)
+
+
+class AsyncReadPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pass12345')
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        cls.car = make_listing(cls.seller, model='Harrier')
+        cls.other = make_listing(cls.seller, make='Honda', model='City')
+        cls.sold = make_listing(cls.seller, status='SOLD', buyer=cls.buyer)
+        Review.objects.create(seller=cls.seller, reviewer=cls.buyer, listing=cls.sold, rating=4, comment='Smooth sale')
+        cls.buyer.wishlist_items.add(cls.car)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_read_paths_render_under_asgi(self):
+        await self.async_client.aforce_login(self.buyer)
+        pages = {
+            reverse('landing-page'): 'Harrier',
+            reverse('car-list') + '?make=Tata': 'Harrier',
+            reverse('car-detail', args=[self.car.pk]): 'Remove from wishlist',
+            reverse('profile', args=['seller']): 'Smooth sale',
+            reverse('compare-cars') + f'?ids={self.car.pk},{self.other.pk}': 'City',
+        }
+        for url, text in pages.items():
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertContains(response, text)
+                self.assertContains(response, 'buyer')
+        response = await self.async_client.get(reverse('profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_messages_can_be_sent_from_the_async_detail_page(self):
+        await self.async_client.aforce_login(self.buyer)
+        url = reverse('car-detail', args=[self.car.pk])
+        response = await self.async_client.post(url, {'content': 'Is the price negotiable?'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        message = await Message.objects.select_related('receiver').aget(content='Is the price negotiable?')
+        self.assertEqual(message.receiver, self.seller)
+
+
+class SyntheticMarketplaceTests(TemporaryMediaMixin, TestCase):
+    def generate(self):
+        return MarketplaceGenerator(
+            users=12, listings=80, images_per_listing=2, messages=60, reviews=5,
+            wishlist_items=30, chunk_size=16, seed=1,
+        ).run()
+
+    def test_generated_rows_match_what_signals_would_maintain(self):
+        counts = self.generate()
+        self.assertEqual(User.objects.count(), 12)
+        self.assertEqual(CarListing.objects.count(), 80)
+        self.assertEqual(Message.objects.count(), counts['messages'])
+        self.assertEqual(Review.objects.count(), counts['reviews'])
+        statuses = set(CarListing.objects.values_list('status', flat=True))
+        self.assertLessEqual(statuses, {value for value, label in LISTING_STATUS_CHOICES})
+        for thread in Conversation.objects.all():
+            unread = Message.objects.filter(
+                listing=thread.listing_id, sender=thread.other_user_id, receiver=thread.owner_id,
+                pk__gt=thread.last_read_id,
+            ).count()
+            self.assertEqual(thread.unread_count, unread)
+        self.assertEqual(
+            sum(SellerRating.objects.values_list('review_count', flat=True)), Review.objects.count()
+        )
+        photo = CarListing.objects.values_list('image', flat=True).first()
+        references = (
+            CarListing.objects.filter(image=photo).count() + CarImage.objects.filter(image=photo).count()
+        )
+        self.assertEqual(MediaBlob.objects.get(name=photo).references, references)
+        self.assertEqual(engagement.reconcile(), [])
+        self.assertEqual(rollups.dashboard()['total_listings'], 80)
+
+    def test_benchmark_reports_percentiles_per_view(self):
+        self.generate()
+        result = benchmark.Benchmark(seed=1).run(20)
+        self.assertGreaterEqual(result['requests'], 20)
+        for row in result['views'].values():
+            self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+            self.assertLessEqual(row['p95_ms'], row['p99_ms'])
+
+        slower = {'views': {view: dict(row, p95_ms=row['p95_ms'] * 2) for view, row in result['views'].items()}}
+        view, before, now, change = benchmark.compare(result, slower)[0]
+        self.assertAlmostEqual(change, 100)
 
-# Create your tests here.
@@ -0,0 +1,29 @@
+# File: listings/unread.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import Conversation
+
+# The navbar's unread badge is rendered on every page, so the count is cached
+# per user. It adds up the unread counts of the user's Conversation rows, which
+# listings/signals.py raises as messages arrive and conversations.mark_read
+# clears; both drop the cached value.
+
+
+def _cache_key(user_id):
+    return f'listings:unread:{user_id}'
+
+
+def get_unread_count(user_id):
+    key = _cache_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Conversation.objects.filter(owner_id=user_id).aggregate(count=Sum('unread_count'))['count'] or 0
+        cache.set(key, count, settings.UNREAD_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
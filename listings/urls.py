@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('', views.landing_page_view, name='landing-page'),
     path('cars/', views.car_list_view, name='car-list'),
+    path('cars/more/', views.car_list_more_view, name='car-list-more'),
     path('cars/<int:pk>/', views.car_detail_view, name='car-detail'),
     path('signup/', views.signup_view, name='signup'),
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
@@ -25,6 +26,7 @@ urlpatterns = [
     path('compare/', views.compare_cars_view, name='compare-cars'),
     path('inbox/', views.inbox_view, name='inbox'),
     path('inbox/conversation/<int:listing_pk>/<int:other_user_pk>/', views.conversation_view, name='conversation'),
+    path('inbox/conversation/<int:listing_pk>/<int:other_user_pk>/events/', views.conversation_events_view, name='conversation-events'),
     path('my-purchases/', views.my_purchases_view, name='my-purchases'),
     path('my-purchases/<int:listing_pk>/review/', views.leave_review_view, name='leave-review'),
     path('reviews/<int:review_pk>/respond/', views.add_review_response_view, name='add-review-response'),
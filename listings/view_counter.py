@@ -0,0 +1,154 @@
+# File: listings/view_counter.py
+
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F
+
+from .models import CarListing, ListingViewer, PendingView
+
+# Listing page views are added to CarListing.views in batches, instead of an
+# UPDATE + SELECT of the whole row on every page view. A counted view is one
+# INSERT into the narrow PendingView table, so it survives the process that
+# recorded it. The first view a process records after a flush starts a timer,
+# so views reach the listing within VIEW_COUNT_FLUSH_INTERVAL seconds whether
+# or not more traffic follows; `manage.py flush_view_counts` flushes the views
+# of every process, e.g. those of a worker that was killed before its timer
+# fired. The same rows give the unique_viewers counts.
+logger = logging.getLogger(__name__)
+
+# Pending views written per transaction
+FLUSH_BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_timer = None
+
+
+def _dedup_key(listing_id, user_id):
+    return f'listings:viewed:{listing_id}:{user_id}'
+
+
+def record_view(listing_id, user_id):
+    """
+    Counts one view of a listing by a user. Repeat views by the same user
+    within VIEW_COUNT_DEDUP_WINDOW seconds are ignored. Returns True if the
+    view was counted.
+    """
+    if not cache.add(_dedup_key(listing_id, user_id), True, settings.VIEW_COUNT_DEDUP_WINDOW):
+        return False
+    PendingView.objects.create(listing_id=listing_id, user_id=user_id)
+    with _lock:
+        _schedule_flush()
+    return True
+
+
+def _schedule_flush():
+    # Called with _lock held
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(settings.VIEW_COUNT_FLUSH_INTERVAL, _flush_in_background)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _flush_in_background():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush_all()
+    finally:
+        # This thread opened its own database connection
+        connections.close_all()
+
+
+def flush_all():
+    """
+    flush() for the timer: a failure is logged and the views stay pending for
+    another try after VIEW_COUNT_FLUSH_INTERVAL.
+    """
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not write the buffered listing views")
+        with _lock:
+            _schedule_flush()
+
+
+def reset():
+    """Cancels this process's scheduled flush. Pending views stay in the database."""
+    global _timer
+    with _lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+
+def pending_views(listing_id):
+    """
+    Views that are recorded but not added to the listing's count yet.
+    """
+    return PendingView.objects.filter(listing_id=listing_id).count()
+
+
+def _by_increment(counts):
+    by_increment = defaultdict(list)
+    for listing_id, count in counts.items():
+        by_increment[count].append(listing_id)
+    return by_increment
+
+
+def flush():
+    """
+    Adds the pending views to the listings and deletes them, FLUSH_BATCH_SIZE
+    at a time. Each batch is one UPDATE per distinct increment, e.g. every
+    listing viewed 3 times is updated together. Users who view a listing for
+    the first time become ListingViewer rows and are added to its
+    unique_viewers. Returns (views written, new viewers).
+    """
+    views = viewers = 0
+    while True:
+        with transaction.atomic():
+            batch = list(PendingView.objects.order_by('id').values_list('id', 'listing_id', 'user_id')[:FLUSH_BATCH_SIZE])
+            if not batch:
+                return views, viewers
+            deleted, _ = PendingView.objects.filter(id__in=[row[0] for row in batch]).delete()
+            if deleted != len(batch):
+                # Another process flushed some of these rows first; the next
+                # pass picks up whatever it left
+                transaction.set_rollback(True)
+                continue
+            counts = Counter(listing_id for _, listing_id, _ in batch)
+            for count, listing_ids in _by_increment(counts).items():
+                CarListing.objects.filter(id__in=listing_ids).update(views=F('views') + count)
+            viewers += _add_viewers({(listing_id, user_id) for _, listing_id, user_id in batch})
+            views += len(batch)
+
+
+def _add_viewers(pairs):
+    """
+    Records (listing, user) pairs as ListingViewer rows and adds the ones seen
+    for the first time to unique_viewers. Returns the number of new viewers.
+    """
+    listing_ids = {listing_id for listing_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+    seen = set(ListingViewer.objects.filter(
+        listing_id__in=listing_ids, user_id__in=user_ids,
+    ).values_list('listing_id', 'user_id'))
+    # Skip listings and users deleted since the view was recorded
+    listing_ids = set(CarListing.objects.filter(id__in=listing_ids).values_list('id', flat=True))
+    user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    new = {pair for pair in pairs - seen if pair[0] in listing_ids and pair[1] in user_ids}
+    ListingViewer.objects.bulk_create(
+        [ListingViewer(listing_id=listing_id, user_id=user_id) for listing_id, user_id in new],
+        ignore_conflicts=True,
+    )
+    counts = Counter(listing_id for listing_id, _ in new)
+    for count, listing_ids in _by_increment(counts).items():
+        CarListing.objects.filter(id__in=listing_ids).update(unique_viewers=F('unique_viewers') + count)
+    return len(new)
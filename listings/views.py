@@ -1,37 +1,84 @@
 # File: listings/views.py
 
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import CarListing, Message, User, Review, Profile, CarImage
+from .models import ActivityEvent, CarListing, Message, User, Review, Profile, CarImage, Conversation, SellerRating
 from .forms import (
     CarListingForm, UserUpdateForm, ProfileUpdateForm, 
     MessageForm, CarFilterForm, ReviewForm,  SellerResponseForm
 )
 from django.contrib.auth import logout
 # --- Import F and Count ---
-from django.db.models import Q, Avg, Count, F
+from django.db.models import Q, Count, Exists, OuterRef
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.defaultfilters import pluralize
+from django.template.loader import render_to_string
+from django.urls import reverse
+from .pagination import apaginate_keyset, paginate_keyset, NEWEST_FIRST
+from . import activity, compare, conversations, facets, images, live, metrics, search, unread, view_counter, wishlist
 
 # ... (all other views from landing_page_view to car_list_view remain the same) ...
-def landing_page_view(request):
-    featured_listings = CarListing.objects.filter(status='ACTIVE').order_by('-created_at')[:3]
-    return render(request, 'landing.html', {'featured_listings': featured_listings})
 
-def car_list_view(request):
-    queryset = CarListing.objects.filter(status='ACTIVE').order_by('-created_at')
-    
-    make_choices = list(CarListing.objects.filter(status='ACTIVE').values_list('make', flat=True).distinct().order_by('make'))
-    make_choices_for_form = [(make, make) for make in make_choices]
+# --- Async read paths ---
+# The landing, browse, detail, profile and compare pages are async views, so
+# under ASGI (car_platform/asgi.py) they run on the event loop: their own
+# queries go through the async ORM and are started together with
+# asyncio.gather, and the cached helpers shared with the sync views run through
+# sync_to_async. Templates and context processors are sync code, so pages are
+# rendered with arender().
+arender = sync_to_async(render)
 
-    city_choices = list(CarListing.objects.filter(status='ACTIVE').values_list('location_city', flat=True).distinct().order_by('location_city'))
-    city_choices_for_form = [(city, city) for city in city_choices]
+async def _auser(request):
+    """
+    Loads the user once for both the view and the templates, which would
+    otherwise look it up again through the lazy request.user.
+    """
+    request.user = await request.auser()
+    return request.user
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+async def landing_page_view(request):
+    user = await _auser(request)
+    featured_listings, wishlisted_ids = await asyncio.gather(
+        _alist(CarListing.objects.filter(status='ACTIVE').select_related('seller__seller_rating').order_by('-created_at')[:3]),
+        sync_to_async(wishlist.wishlisted_ids)(user),
+    )
+    return await arender(request, 'landing.html', {
+        'featured_listings': featured_listings,
+        'wishlisted_ids': wishlisted_ids,
+        'image_renditions': await sync_to_async(images.listing_renditions)(featured_listings),
+    })
+
+def _filter_car_listings(request):
+    """
+    Builds the active-listing queryset for the current search and CarFilterForm state.
+    Shared by the car list page and its "load more" endpoint. Also returns the
+    facet cube the form's choices came from, for counting facets without reading it again.
+    """
+    queryset = CarListing.objects.filter(status='ACTIVE').select_related('seller__seller_rating')
+    
+    # Brand and city choices come from the cached facet cube, not a DISTINCT query
+    cube = facets.get_cube()
+    make_choices_for_form = [(make, make) for make in facets.choices_for('make', cube)]
+    city_choices_for_form = [(city, city) for city in facets.choices_for('location_city', cube)]
 
     filter_form = CarFilterForm(request.GET, make_choices=make_choices_for_form, city_choices=city_choices_for_form)
 
+    ordering = NEWEST_FIRST
     query = request.GET.get('q')
     if query:
-        queryset = queryset.filter(Q(make__icontains=query) | Q(model__icontains=query))
+        queryset, ordering = search.search_listings(queryset, query)
 
     if filter_form.is_valid():
         transmission = filter_form.cleaned_data.get('transmission')
@@ -56,44 +103,98 @@ def car_list_view(request):
             queryset = queryset.filter(location_city=location_city)
         if year:
             queryset = queryset.filter(year=year)
-            
+
+    return queryset, ordering, filter_form, query, cube
+
+INBOX_ORDERING = ('-last_message_at', '-id')
+REVIEW_ORDERING = ('-timestamp', '-id')
+
+def _page_url(request, cursor, path=None):
+    # Keep every filter and the search term, only swap the cursor.
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params['cursor'] = cursor
+    return f"{path or request.path}?{params.urlencode()}"
+
+async def car_list_view(request):
+    user = await _auser(request)
+    queryset, ordering, filter_form, query, cube = await sync_to_async(_filter_car_listings)(request)
+    page, facet_counts, wishlisted_ids = await asyncio.gather(
+        apaginate_keyset(queryset, request.GET.get('cursor'), settings.CAR_LIST_PAGE_SIZE, ordering),
+        sync_to_async(facets.facet_counts)(filter_form.cleaned_data if filter_form.is_valid() else {}, cube),
+        sync_to_async(wishlist.wishlisted_ids)(user),
+    )
+    filter_form.apply_facet_counts(facet_counts)
+
     context = {
-        'listings': queryset,
+        'listings': page,
+        'page': page,
+        'next_page_url': _page_url(request, page.next_cursor) if page.next_cursor else None,
+        'prev_page_url': _page_url(request, page.previous_cursor) if page.previous_cursor else None,
+        'load_more_url': _page_url(request, page.next_cursor, reverse('car-list-more')) if page.next_cursor else None,
+        'price_facets': facets.price_bucket_facets(facet_counts),
+        'year_facets': sorted(facet_counts['year'].items(), reverse=True),
         'search_query': query,
-        'filter_form': filter_form
+        'filter_form': filter_form,
+        'wishlisted_ids': wishlisted_ids,
+        'image_renditions': await sync_to_async(images.listing_renditions)(page),
+        'compare_max_cars': settings.COMPARE_MAX_CARS,
     }
-    return render(request, 'car_list.html', context)
+    return await arender(request, 'car_list.html', context)
+
+def car_list_more_view(request):
+    """
+    JSON fragment for the "Load more" button: the next page of cards as HTML
+    plus the URL for the page after it.
+    """
+    queryset, ordering, filter_form, query, _ = _filter_car_listings(request)
+    page = paginate_keyset(queryset, request.GET.get('cursor'), settings.CAR_LIST_PAGE_SIZE, ordering)
+    html = render_to_string('partials/car_cards.html', {
+        'listings': page,
+        'wishlisted_ids': wishlist.wishlisted_ids(request.user),
+        'image_renditions': images.listing_renditions(page),
+    }, request=request)
+    return JsonResponse({
+        'html': html,
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+        'load_more_url': _page_url(request, page.next_cursor, reverse('car-list-more')) if page.next_cursor else None,
+    })
 
 # --- UPDATED car_detail_view ---
-def car_detail_view(request, pk):
-    car = get_object_or_404(CarListing, id=pk, status='ACTIVE')
+async def car_detail_view(request, pk):
+    user = await _auser(request)
+    car, wishlisted = await asyncio.gather(
+        aget_object_or_404(CarListing.objects.select_related('seller__seller_rating'), id=pk, status='ACTIVE'),
+        sync_to_async(wishlist.is_wishlisted)(user, pk),
+    )
     
     # --- Increment the view counter ---
-    # We only increment if the user is logged in and is NOT the seller.
-    if request.user.is_authenticated and request.user != car.seller:
-        # F() is a database-level operation that prevents race conditions.
-        # It's the safest way to increment a value.
-        car.views = F('views') + 1
-        car.save()
-        # We must refresh the object from the database to see the new value
-        car.refresh_from_db()
+    # We only count logged-in users who are NOT the seller. The view is buffered
+    # and written in a batch later (see listings/view_counter.py).
+    if user.is_authenticated and user.id != car.seller_id:
+        await sync_to_async(view_counter.record_view)(car.id, user.id)
 
     message_form = MessageForm()
     if request.method == 'POST':
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             messages.error(request, "You must be logged in to contact a seller.")
             return redirect('login')
         message_form = MessageForm(request.POST)
         if message_form.is_valid():
             new_message = message_form.save(commit=False)
-            new_message.sender = request.user
+            new_message.sender = user
             new_message.receiver = car.seller
             new_message.listing = car
-            new_message.save()
+            await new_message.asave()
             messages.success(request, f"Your message has been sent to {car.seller.username}.")
             return redirect('car-detail', pk=pk)
             
-    return render(request, 'car_detail.html', {'car': car, 'message_form': message_form})
+    return await arender(request, 'car_detail.html', {
+        'car': car,
+        'message_form': message_form,
+        'wishlisted': wishlisted,
+    })
 
 # ... (all other views from signup_view to post_car_view remain the same) ...
 def signup_view(request):
@@ -112,6 +213,14 @@ def logout_view(request):
     messages.success(request, "You have been successfully logged out.")
     return redirect('landing-page')
 
+def _add_listing_photos(request, listing):
+    """Saves the 'additional_images' uploads and tells the user how it went."""
+    created, rejected = images.ingest_car_images(listing, request.FILES.getlist('additional_images'))
+    if created:
+        messages.info(request, f"{len(created)} photo{pluralize(len(created))} added.")
+    if rejected:
+        messages.warning(request, f"Skipped files that are not valid images: {', '.join(rejected)}")
+
 @login_required
 def post_car_view(request):
     if request.method == 'POST':
@@ -121,10 +230,7 @@ def post_car_view(request):
             new_listing.seller = request.user
             new_listing.save()
             
-            images = request.FILES.getlist('additional_images')
-            for image in images:
-                CarImage.objects.create(listing=new_listing, image=image)
-            
+            _add_listing_photos(request, new_listing)
             messages.success(request, 'Your car has been listed! It is now pending admin approval.')
             return redirect('my-listings')
     else:
@@ -134,16 +240,14 @@ def post_car_view(request):
 # --- UPDATED my_listings_view ---
 @login_required
 def my_listings_view(request):
-    user_listings_query = CarListing.objects.filter(seller=request.user)
-    
-    # We annotate the queryset to get the wishlist count for each listing
-    user_listings = user_listings_query.annotate(
-        wishlist_count=Count('wishlist')
-    ).order_by('-created_at')
-
-    # The 'views' count is already on the model, so we don't need to annotate it.
-    # We can access it directly in the template as 'listing.views'.
-    return render(request, 'my_listings.html', {'listings': user_listings, 'page_title': 'My Car Listings'})
+    # Wishlist, message and viewer counts are plain columns kept up to date by
+    # signals, so this is a single query however popular the listings are.
+    user_listings = CarListing.objects.filter(seller=request.user).order_by('-created_at')
+    return render(request, 'my_listings.html', {
+        'listings': user_listings,
+        'image_renditions': images.listing_renditions(user_listings),
+        'page_title': 'My Car Listings',
+    })
 
 @login_required
 def my_listing_detail_view(request, pk):
@@ -158,10 +262,7 @@ def edit_listing_view(request, pk):
         if form.is_valid():
             form.save()
             
-            images = request.FILES.getlist('additional_images')
-            for image in images:
-                CarImage.objects.create(listing=listing, image=image)
-                
+            _add_listing_photos(request, listing)
             messages.success(request, "Your listing has been updated successfully!")
             return redirect('my-listings')
     else:
@@ -190,7 +291,8 @@ def delete_listing_view(request, pk):
 
 @login_required
 def mark_as_sold_view(request, pk):
-    listing = get_object_or_404(CarListing, id=pk, seller=request.user)
+    # The seller is named in the activity log entry for the sale
+    listing = get_object_or_404(CarListing.objects.select_related('seller'), id=pk, seller=request.user)
     if listing.status == 'ACTIVE':
         listing.status = 'SOLD'
         listing.save()
@@ -202,25 +304,66 @@ def mark_as_sold_view(request, pk):
 @login_required
 def wishlist_view(request):
     wishlist_items = request.user.wishlist_items.all().order_by('-created_at')
-    return render(request, 'wishlist.html', {'listings': wishlist_items, 'page_title': 'My Wishlist'})
+    return render(request, 'wishlist.html', {
+        'listings': wishlist_items,
+        'image_renditions': images.listing_renditions(wishlist_items),
+        'page_title': 'My Wishlist',
+    })
 
 @login_required
 def toggle_wishlist_view(request, pk):
-    listing = get_object_or_404(CarListing, id=pk)
-    if listing.wishlist.filter(id=request.user.id).exists():
-        listing.wishlist.remove(request.user)
-        messages.success(request, f"Removed {listing.make} {listing.model} from your wishlist.")
+    """
+    Adds or removes a listing from the user's wishlist. A POST with
+    wishlisted=true or false sets that state, so sending it twice is harmless;
+    otherwise the current state is flipped. Requests that accept JSON get
+    {"wishlisted": ...} back instead of a redirect.
+    """
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+    listing = None if wants_json else get_object_or_404(CarListing, id=pk)
+    wanted = request.POST.get('wishlisted')
+    if wanted is None:
+        # The flip is decided by the database, not the cached ids, which a
+        # toggle handled by another worker doesn't clear: add only if nothing
+        # was removed
+        wanted = not wishlist.remove(request.user, pk)
     else:
-        listing.wishlist.add(request.user)
+        wanted = wanted == 'true'
+        if not wanted:
+            wishlist.remove(request.user, pk)
+
+    if wanted and not wishlist.add(request.user, pk) and not CarListing.objects.filter(pk=pk).exists():
+        # Nothing was inserted because the listing doesn't exist
+        raise Http404("No such listing.")
+
+    if wants_json:
+        return JsonResponse({'listing': pk, 'wishlisted': wanted})
+    if wanted:
         messages.success(request, f"Added {listing.make} {listing.model} to your wishlist.")
+    else:
+        messages.success(request, f"Removed {listing.make} {listing.model} from your wishlist.")
     return redirect('car-detail', pk=pk)
 
-def profile_view(request, username):
-    profile_user = get_object_or_404(User, username=username)
-    reviews = profile_user.reviews_received.all().order_by('-timestamp')
-    average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
-    context = {'profile_user': profile_user, 'reviews': reviews, 'average_rating': average_rating}
-    return render(request, 'profile.html', context)
+async def profile_view(request, username):
+    # The reviews are looked up by username, so they load alongside the user
+    reviews = Review.objects.filter(seller__username=username).select_related('reviewer__profile', 'seller')
+    profile_user, page = await asyncio.gather(
+        aget_object_or_404(User.objects.select_related('profile', 'seller_rating'), username=username),
+        apaginate_keyset(reviews, request.GET.get('cursor'), settings.REVIEWS_PAGE_SIZE, REVIEW_ORDERING),
+    )
+    # Totals are maintained by signals, so there is no aggregate over the reviews here
+    try:
+        seller_rating = profile_user.seller_rating
+    except SellerRating.DoesNotExist:
+        seller_rating = None
+    context = {
+        'profile_user': profile_user,
+        'reviews': page,
+        'seller_rating': seller_rating,
+        'average_rating': seller_rating.average if seller_rating else None,
+        'next_page_url': _page_url(request, page.next_cursor) if page.next_cursor else None,
+        'prev_page_url': _page_url(request, page.previous_cursor) if page.previous_cursor else None,
+    }
+    return await arender(request, 'profile.html', context)
 
 @login_required
 def edit_profile_view(request):
@@ -247,20 +390,15 @@ def edit_profile_view(request):
 
 @login_required
 def inbox_view(request):
-    all_user_messages = Message.objects.filter(
-        Q(sender=request.user) | Q(receiver=request.user)
-    ).order_by('-timestamp')
-    conversation_threads = {}
-    for message in all_user_messages:
-        other_user = message.sender if message.receiver == request.user else message.receiver
-        thread_key = (message.listing.id, other_user.id)
-        if thread_key not in conversation_threads:
-            conversation_threads[thread_key] = {
-                'latest_message': message,
-                'other_user': other_user
-            }
+    # One row per thread, maintained by signals when a Message is saved
+    threads = Conversation.objects.filter(owner=request.user).select_related(
+        'other_user', 'listing', 'last_message'
+    )
+    page = paginate_keyset(threads, request.GET.get('cursor'), settings.INBOX_PAGE_SIZE, INBOX_ORDERING)
     context = {
-        'conversation_threads': list(conversation_threads.values()),
+        'conversation_threads': page,
+        'next_page_url': _page_url(request, page.next_cursor) if page.next_cursor else None,
+        'prev_page_url': _page_url(request, page.previous_cursor) if page.previous_cursor else None,
         'page_title': 'My Inbox'
     }
     return render(request, 'inbox.html', context)
@@ -270,7 +408,7 @@ def conversation_view(request, listing_pk, other_user_pk):
     listing = get_object_or_404(CarListing, id=listing_pk)
     other_user = get_object_or_404(User, id=other_user_pk)
     
-    if listing.seller not in [request.user, other_user]:
+    if listing.seller_id not in (request.user.pk, other_user.pk):
         messages.error(request, "You are not authorized to view this conversation.")
         return redirect('inbox')
     
@@ -278,58 +416,127 @@ def conversation_view(request, listing_pk, other_user_pk):
         messages.error(request, "Invalid conversation.")
         return redirect('inbox')
 
-    Message.objects.filter(
-        listing=listing, 
-        sender=other_user, 
-        receiver=request.user, 
-        is_read=False
-    ).update(is_read=True)
-
-    conversation_messages = Message.objects.filter(
-        listing=listing,
-        sender__in=[request.user, other_user],
-        receiver__in=[request.user, other_user]
-    ).order_by('timestamp')
-    
+    wants_json = 'application/json' in request.headers.get('Accept', '')
     if request.method == 'POST':
         reply_form = MessageForm(request.POST)
+        if not reply_form.is_valid() and wants_json:
+            return JsonResponse({'errors': reply_form.errors}, status=400)
         if reply_form.is_valid():
             reply = reply_form.save(commit=False)
             reply.sender = request.user
             reply.receiver = other_user
             reply.listing = listing
             reply.save()
+            if wants_json:
+                # The open page shows the reply when its event stream delivers it
+                return JsonResponse({'id': reply.pk}, status=201)
             messages.success(request, "Your reply has been sent.")
             return redirect('conversation', listing_pk=listing.pk, other_user_pk=other_user.pk)
     else:
         reply_form = MessageForm()
-        
+
+    # Newest messages first, a page at a time; "Load older" follows the cursor
+    cursor = request.GET.get('cursor')
+    page = conversations.history(listing.pk, request.user.pk, other_user.pk, cursor, settings.CONVERSATION_PAGE_SIZE)
+    read_up_to = conversations.watermarks(listing.pk, request.user.pk, other_user.pk)
+    newest = page.object_list[0] if page.object_list else None
+    if not cursor and newest and newest.pk > read_up_to[request.user.pk]:
+        conversations.mark_read(listing.pk, request.user.pk, other_user.pk, newest)
+        live.notify(listing.pk, request.user.pk, other_user.pk)
+
+    history = {
+        # Not 'messages': base.html shows the flash messages under that name
+        'conversation_messages': page.object_list[::-1],
+        'seen_up_to': read_up_to[other_user.pk],
+    }
+    load_older_url = _page_url(request, page.next_cursor) if page.next_cursor else None
+    if cursor and wants_json:
+        html = render_to_string('partials/conversation_messages.html', history, request=request)
+        return JsonResponse({'html': html, 'load_older_url': load_older_url})
+
     context = {
         'listing': listing,
         'other_user': other_user,
-        'messages': conversation_messages,
+        **history,
         'reply_form': reply_form,
+        'load_older_url': load_older_url,
+        'is_latest_page': not cursor,
+        # The event stream picks up after the newest message on the page
+        'stream_url': reverse('conversation-events', args=[listing.pk, other_user.pk]),
+        'last_message_id': newest.pk if newest else 0,
         'page_title': f'Conversation about {listing.make} {listing.model}'
     }
     return render(request, 'conversation.html', context)
 
+@login_required
+async def conversation_events_view(request, listing_pk, other_user_pk):
+    """
+    Streams a conversation's new messages and read receipts as Server-Sent
+    Events, starting after the message id in the Last-Event-ID header (sent by
+    the browser when it reconnects) or the `after` parameter. Under ASGI the
+    stream stays open for MESSAGE_STREAM_TIMEOUT seconds as one idle coroutine;
+    under WSGI it would hold a worker, so it sends what is waiting and closes,
+    and the browser reconnects after MESSAGE_STREAM_RETRY milliseconds.
+    """
+    user = await request.auser()
+    listing = await aget_object_or_404(CarListing, id=listing_pk)
+    if listing.seller_id not in (user.pk, other_user_pk) or user.pk == other_user_pk:
+        raise Http404("No such conversation.")
+    if not await User.objects.filter(pk=other_user_pk).aexists():
+        raise Http404("No such conversation.")
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0)
+    except ValueError:
+        after = 0
+    poll = sync_to_async(live.poll)
+    retry = f'retry: {settings.MESSAGE_STREAM_RETRY}\n\n'
+
+    if not isinstance(request, ASGIRequest):
+        events, *_ = await poll(listing.pk, user.pk, other_user_pk, after, 0)
+        response = HttpResponse(retry + ''.join(events), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    async def stream():
+        nonlocal after
+        read_up_to = 0
+        yield retry
+        with live.subscribe(listing.pk, user.pk, other_user_pk) as changed:
+            deadline = time.monotonic() + settings.MESSAGE_STREAM_TIMEOUT
+            while True:
+                changed.clear()
+                events, after, read_up_to, more = await poll(listing.pk, user.pk, other_user_pk, after, read_up_to)
+                if events:
+                    yield ''.join(events)
+                if more:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), min(settings.MESSAGE_STREAM_POLL, remaining))
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ': ping\n\n'
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tells nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def my_purchases_view(request):
-    sold_listings = CarListing.objects.filter(status='SOLD')
-    purchased_cars = []
-    for listing in sold_listings:
-        last_message = Message.objects.filter(listing=listing).order_by('-timestamp').first()
-        if last_message:
-            potential_buyer = None
-            if last_message.sender == listing.seller:
-                potential_buyer = last_message.receiver
-            else:
-                potential_buyer = last_message.sender
-            if potential_buyer == request.user:
-                has_reviewed = Review.objects.filter(reviewer=request.user, listing=listing).exists()
-                purchased_cars.append({'car': listing, 'has_reviewed': has_reviewed})
+    # The buyer is recorded when a listing is marked as sold, so this is one query
+    purchases = CarListing.objects.filter(status='SOLD', buyer=request.user).select_related('seller').annotate(
+        has_reviewed=Exists(Review.objects.filter(reviewer=request.user, listing=OuterRef('pk')))
+    )
+    page = paginate_keyset(purchases, request.GET.get('cursor'), settings.PURCHASES_PAGE_SIZE)
     context = {
-        'purchased_cars': purchased_cars, 
+        'purchased_cars': page,
+        'next_page_url': _page_url(request, page.next_cursor) if page.next_cursor else None,
+        'prev_page_url': _page_url(request, page.previous_cursor) if page.previous_cursor else None,
+        'image_renditions': images.listing_renditions(page),
         'page_title': 'My Purchases'
     }
     return render(request, 'my_purchases.html', context)
@@ -355,23 +562,29 @@ def leave_review_view(request, listing_pk):
     context = {'form': form, 'listing': listing, 'page_title': f'Review Your Purchase: {listing.make} {listing.model}'}
     return render(request, 'leave_review.html', context)
 
-def compare_cars_view(request):
-    car_ids_str = request.GET.get('ids', '')
-    cars_to_compare = []
-    if car_ids_str:
-        car_ids = car_ids_str.split(',')
-        cars_to_compare = CarListing.objects.filter(id__in=car_ids)
-    return render(request, 'compare.html', {'cars': cars_to_compare, 'page_title': 'Compare Cars'})
+async def compare_cars_view(request):
+    # Only the first COMPARE_MAX_CARS ids are read; listings that aren't
+    # active any more drop out of the comparison
+    car_ids, truncated = compare.parse_ids(request.GET.get('ids', ''))
+    result = await sync_to_async(compare.comparison)(car_ids)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({**compare.as_json(result), 'truncated': truncated, 'max_cars': settings.COMPARE_MAX_CARS})
+    return await arender(request, 'compare.html', {
+        'cars': result['cars'],
+        'rows': result['rows'],
+        'image_renditions': await sync_to_async(images.listing_renditions)(result['cars']),
+        'truncated': truncated,
+        'max_cars': settings.COMPARE_MAX_CARS,
+        'page_title': 'Compare Cars',
+    })
 
 def unread_messages_context(request):
     """
     Makes the count of unread messages available on all pages.
     """
     if request.user.is_authenticated:
-        # We query the Message model where the receiver is the current user
-        # and the 'is_read' flag is False[cite: 8].
-        unread_count = Message.objects.filter(receiver=request.user, is_read=False).count()
-        return {'unread_messages_count': unread_count}
+        # Cached per user and dropped when a message arrives or is read (see listings/unread.py)
+        return {'unread_messages_count': unread.get_unread_count(request.user.id)}
     return {}
 
 @login_required
@@ -402,4 +615,57 @@ def add_review_response_view(request, review_pk):
         'review': review,
         'page_title': 'Respond to Review'
     }
-    return render(request, 'add_review_response.html', context)
\ No newline at end of file
+    return render(request, 'add_review_response.html', context)
+
+# --- Per-view request metrics for staff (see listings/middleware.py) ---
+@staff_member_required
+def metrics_view(request):
+    snapshot = metrics.registry.snapshot()
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(metrics.prometheus_text(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    default_budget = (settings.METRICS_QUERY_BUDGET, settings.METRICS_LATENCY_BUDGET_MS)
+    rows = []
+    for view, histograms in snapshot.items():
+        latency, queries = histograms['latency_seconds'], histograms['queries']
+        max_queries, max_ms = settings.METRICS_VIEW_BUDGETS.get(view, default_budget)
+        rows.append({
+            'view': view,
+            'requests': latency.count,
+            'latency_p50': latency.quantile(0.5) * 1000,
+            'latency_p95': latency.quantile(0.95) * 1000,
+            'latency_max': latency.max * 1000,
+            'queries_avg': queries.sum / queries.count,
+            'queries_max': queries.max,
+            'sql_avg': histograms['sql_seconds'].sum / latency.count * 1000,
+            'template_avg': histograms['template_seconds'].sum / latency.count * 1000,
+            'size_avg': histograms['response_bytes'].sum / latency.count,
+            'over_latency': latency.quantile(0.95) * 1000 > max_ms,
+            'over_queries': queries.max > max_queries,
+        })
+    rows.sort(key=lambda row: row['latency_p95'], reverse=True)
+    context = {
+        'title': 'Request metrics',
+        'rows': rows,
+        'query_budget': default_budget[0],
+        'latency_budget': default_budget[1],
+    }
+    return render(request, 'admin/metrics.html', context)
+
+
+@staff_member_required
+def activity_feed_view(request):
+    """The whole activity log, newest first, one keyset page at a time."""
+    event_type = request.GET.get('type')
+    if event_type not in dict(ActivityEvent.TYPE_CHOICES):
+        event_type = None
+    page = activity.feed(request.GET.get('cursor'), settings.ACTIVITY_PAGE_SIZE, event_type)
+    context = {
+        'title': 'Activity',
+        'events': page,
+        'event_type': event_type,
+        'event_types': ActivityEvent.TYPE_CHOICES,
+        'next_page_url': _page_url(request, page.next_cursor) if page.next_cursor else None,
+        'prev_page_url': _page_url(request, page.previous_cursor) if page.previous_cursor else None,
+    }
+    return render(request, 'admin/activity.html', context)